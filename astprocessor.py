@@ -19,6 +19,37 @@ def EvaluateFunctionOrList(f, s):
         return f[0](s)
     return f(s)
 
+
+class Program(object):
+    """
+    The AST of a program, as its first command and the rest of the program, \
+that puts together the trees of its commands in a loop \
+rather than asking the rest of the program for its tree.
+
+    """
+    __slots__ = ("command", "rest")
+
+    def __init__(self, command=None, rest=None):
+        """
+        Program(command=None, rest=None) -> Program
+
+        Creates the AST of a program running command then rest, \
+both processed, or of an empty program if command is None.
+
+        """
+        self.command = command
+        self.rest = rest
+
+    def __call__(self, s=""):
+        tree, program = ["Program"], self
+        while isinstance(program, Program):
+            if program.command is None:
+                return tree
+            tree += [program.command[0](s)]
+            program = program.rest[0]
+        return tree + program(s)[1:]
+
+
 ASTProcessor = {
     CT.Arrow: [
         lambda r: [lambda s="": [r[0] + ": Left"]],
@@ -235,8 +266,8 @@ ASTProcessor = {
     ],
 
     CT.Program: [
-        lambda r: [lambda s="": ["Program", r[0][0](s)] + r[2][0](s)[1:]],
-        lambda r: [lambda s="": ["Program"]]
+        lambda r: [Program(r[0], r[2])],
+        lambda r: [Program()]
     ],
     CT.Body: [
         lambda r: [lambda s="": r[1]],
@@ -0,0 +1,237 @@
+from charcoal import Charcoal, GetProgram, ProcessInput
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from difflib import unified_diff
+from io import StringIO
+from time import perf_counter as clock
+import json
+import os
+import signal
+import threading
+
+worker = {}
+
+
+class CaseTimeout(BaseException):
+    """
+    Raised in a worker when a test case runs out of time.
+
+    Derives from BaseException so the interpreter's own \
+exception handlers do not swallow it.
+
+    """
+    pass
+
+
+def LoadCases(path):
+    """
+    LoadCases(path) -> list
+
+    Returns the test cases in path, as dicts with the keys \
+"name", "input" and optionally "output".
+
+    path is either a JSONL file with one object per line, \
+with an "input" and optionally an "output" and a "name", \
+or a directory of NAME.in files, each with an optional NAME.out file \
+holding the expected output.
+
+    """
+    cases = []
+    if os.path.isdir(path):
+        for file_name in sorted(os.listdir(path)):
+            if not file_name.endswith(".in"):
+                continue
+            name = file_name[:-3]
+            input_path = os.path.join(path, file_name)
+            output_path = os.path.join(path, name + ".out")
+            with open(input_path, encoding="utf-8") as file:
+                case = {"name": name, "input": file.read()}
+            if os.path.isfile(output_path):
+                with open(output_path, encoding="utf-8") as file:
+                    case["output"] = file.read()
+            cases += [case]
+        return cases
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if not isinstance(case, dict):
+                case = {"input": case}
+            case.setdefault("name", str(number))
+            case.setdefault("input", "")
+            cases += [case]
+    return cases
+
+
+def TimeOut(signal_number, frame):
+    """
+    TimeOut(signal_number, frame)
+
+    Handles SIGALRM by stopping the current test case.
+
+    """
+    raise CaseTimeout()
+
+
+def StartWorker(
+    code, whitespace, normal_encoding, compiled=False, optimized=False
+):
+    """
+    StartWorker(code, whitespace, normal_encoding, compiled=False, \
+optimized=False)
+
+    Parses the program and creates the canvas every test case \
+in this process reuses, compiling or optimizing the program \
+if compiled or optimized is true, see GetProgram.
+
+    """
+    worker["program"] = GetProgram(
+        code, whitespace=whitespace, normal_encoding=normal_encoding,
+        compiled=compiled, optimized=optimized
+    )
+    worker["charcoal"] = Charcoal()
+    if (
+        hasattr(signal, "setitimer") and
+        threading.current_thread() is threading.main_thread()
+    ):
+        worker["previous_handler"] = signal.signal(signal.SIGALRM, TimeOut)
+        worker["timer"] = True
+
+
+def StopWorker():
+    """
+    StopWorker()
+
+    Puts back the SIGALRM handler StartWorker replaced, \
+and forgets the program and canvas, for workers in this process.
+
+    """
+    if worker.get("timer"):
+        previous_handler = worker["previous_handler"]
+        # None means the handler was not installed from Python
+        signal.signal(signal.SIGALRM, (
+            signal.SIG_DFL if previous_handler is None else previous_handler
+        ))
+    worker.clear()
+
+
+def RunCase(case, timeout=0):
+    """
+    RunCase(case, timeout=0) -> dict
+
+    Runs the program of this worker on the input of case, \
+stopping after timeout seconds if timeout is not 0 \
+and the platform supports interval timers.
+
+    Returns the result of the case, with its status \
+("pass", "fail", "error", "timeout", or "done" if there is \
+no expected output), elapsed time in seconds, output, \
+anything printed while running, and a diff against the expected output.
+
+    """
+    charcoal = worker["charcoal"]
+    charcoal.Clear()
+    charcoal.ClearInputs()
+    inputs = case.get("input", "")
+    charcoal.AddInputs(
+        list(inputs) if isinstance(inputs, list) else ProcessInput(inputs)
+    )
+    printed = StringIO()
+    result = {"name": case.get("name", ""), "output": None}
+    timer = timeout and worker.get("timer")
+    start = clock()
+    try:
+        with redirect_stdout(printed):
+            if timer:
+                # Keep firing until caught, in case a bare except eats one
+                signal.setitimer(signal.ITIMER_REAL, timeout, 0.05)
+            try:
+                worker["program"](charcoal)
+            finally:
+                if timer:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        result["output"] = str(charcoal)
+    except CaseTimeout:
+        result["status"] = "timeout"
+    except (Exception, SystemExit) as error:
+        result["status"] = "error"
+        result["error"] = "%s: %s" % (type(error).__name__, error)
+    result["elapsed"] = clock() - start
+    result["stdout"] = printed.getvalue()
+    if "status" in result:
+        return result
+    if "output" not in case:
+        result["status"] = "done"
+    elif result["output"] == case["output"]:
+        result["status"] = "pass"
+    else:
+        result["status"] = "fail"
+        result["diff"] = "\n".join(unified_diff(
+            case["output"].split("\n"), result["output"].split("\n"),
+            "expected", "actual", lineterm=""
+        ))
+    return result
+
+
+def RunBatch(
+    code,
+    cases,
+    jobs=None,
+    timeout=0,
+    whitespace=False,
+    normal_encoding=False,
+    compiled=False,
+    optimized=False
+):
+    """
+    RunBatch(code, cases, jobs=None, timeout=0, whitespace=False, \
+normal_encoding=False, compiled=False, optimized=False) -> dict
+
+    Runs the given Charcoal code on each test case in cases, \
+which is either a list of cases or a path passed to LoadCases, \
+compiled or optimized if compiled or optimized is true, see GetProgram.
+
+    The cases are spread across jobs worker processes, \
+or one per CPU if jobs is None, and each worker parses the code once. \
+If jobs is 1, the cases run in this process instead, \
+which gets back its own SIGALRM handler afterwards.
+
+    Returns a summary with the number of cases with each status, \
+the total elapsed time and the result of each case, in order.
+
+    """
+    if isinstance(cases, str):
+        cases = LoadCases(cases)
+    start = clock()
+    if jobs == 1:
+        StartWorker(code, whitespace, normal_encoding, compiled, optimized)
+        try:
+            results = [RunCase(case, timeout) for case in cases]
+        finally:
+            StopWorker()
+    else:
+        # Parse here first, so forked workers find the program cached
+        GetProgram(
+            code, whitespace=whitespace, normal_encoding=normal_encoding,
+            compiled=compiled, optimized=optimized
+        )
+        with ProcessPoolExecutor(
+            jobs, initializer=StartWorker, initargs=(
+                code, whitespace, normal_encoding, compiled, optimized
+            )
+        ) as executor:
+            results = list(executor.map(
+                RunCase, cases, [timeout] * len(cases),
+                chunksize=max(1, len(cases) // (
+                    (jobs or os.cpu_count() or 1) * 4
+                ))
+            ))
+    summary = {
+        status: sum(result["status"] == status for result in results)
+        for status in ("pass", "fail", "error", "timeout", "done")
+    }
+    summary["total"] = len(results)
+    summary["elapsed"] = clock() - start
+    summary["cases"] = results
+    return summary
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+Charcoal's benchmark module.
+
+Contains timing benchmarks, and runs them when invoked.
+
+"""
+
+from charcoal import Parse, Charcoal, ClearProgramCache, Info
+from interpreterprocessor import (
+    InterpreterProcessor, Incremented, Halved, vectorize
+)
+from compiler import CompilerProcessor
+from optimizer import OptimizerProcessor
+from direction import Direction
+import charactertransformers
+import compression
+from contextlib import redirect_stdout
+from io import StringIO
+import argparse
+import random
+import sys
+import time
+
+sys.setrecursionlimit(100000)
+
+
+def Time(function, repeat=3):
+    """
+    Time(function, repeat=3) -> float
+
+    Returns the fastest time in seconds taken by function over repeat runs.
+
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def Report(name, size, seconds):
+    """
+    Report(name, size, seconds)
+
+    Prints a benchmark result, along with the time taken per unit of size.
+
+    """
+    print("%-32s %8d %12.6fs %12.3fus/unit" % (
+        name, size, seconds, seconds / size * 1e6
+    ))
+
+
+def BenchmarkParse():
+    """
+    BenchmarkParse()
+
+    Times parsing of nested expressions and of long programs, \
+with and without packrat memoization.
+
+    Time per unit should stay flat as the size grows when memoizing. \
+The program cache is bypassed, so every run parses the program.
+
+    """
+    programs = [
+        ("nested sum", lambda n: "⁺" * n + "¹" * (n + 1)),
+        ("nested ternary", lambda n: "⎇" * n + "¹" * (2 * n + 1)),
+        ("long program", lambda n: "Ｆ²«a¹»" * n)
+    ]
+    for name, generate in programs:
+        for size in (10, 100, 1000):
+            code = generate(size)
+            Report(name, size, Time(lambda: Parse(
+                code, processor=InterpreterProcessor, cache=False
+            )))
+        for size in (4, 8, 12):
+            code = generate(size)
+            Report(name + " (no packrat)", size, Time(lambda: Parse(
+                code, processor=InterpreterProcessor, packrat=False,
+                cache=False
+            )))
+
+
+def BenchmarkProgramCache():
+    """
+    BenchmarkProgramCache()
+
+    Times running the same program on many inputs, \
+with and without the program cache.
+
+    """
+    code = "Ｆ⪪θ «Ｐι↓»↗³"
+    for cache in (True, False):
+        ClearProgramCache()
+        Report(
+            "cached run" if cache else "uncached run", 1000,
+            Time(lambda: [
+                Parse(code, processor=InterpreterProcessor, cache=cache)(
+                    Charcoal([str(i) + " ab"])
+                )
+                for i in range(1000)
+            ])
+        )
+
+
+def BenchmarkCanvas():
+    """
+    BenchmarkCanvas()
+
+    Times drawing lines across wide filled canvases, \
+and growing canvases upwards a row at a time, \
+with rows stored as strings and as row buffers.
+
+    """
+    for row_buffers in (False, True):
+        name = "row buffer lines" if row_buffers else "string lines"
+        for size in (1000, 4000):
+
+            def Grow():
+                charcoal = Charcoal(row_buffers=row_buffers)
+                for _ in range(size):
+                    charcoal.PrintLine({Direction.up}, 1, "a")
+            Report(name + " upwards", size, Time(Grow))
+        for size in (1000, 16000, 64000):
+            charcoal = Charcoal(row_buffers=row_buffers)
+            charcoal.Oblong(size, 100, "#")
+
+            def Draw():
+                for x in range(0, size, size // 10):
+                    charcoal.x, charcoal.y = x, 0
+                    charcoal.PrintLine({Direction.down}, 100, "|")
+                    charcoal.x, charcoal.y = x, 0
+                    charcoal.PrintLine(
+                        {Direction.down_right}, 100, "\\", overwrite=False
+                    )
+            Report(name, size, Time(Draw))
+
+
+def BenchmarkRender():
+    """
+    BenchmarkRender()
+
+    Times printing square canvases full of gaps, with a one character \
+background and with a tiled background.
+
+    Time per unit should stay flat as the size grows.
+
+    """
+    for background in (".", "ab\ncde"):
+        name = "render " + repr(background)
+        for size in (100, 200, 400):
+            charcoal = Charcoal()
+            for y in range(size):
+                charcoal.Put("x\000\000" * (size // 3), 0, y)
+            charcoal.SetBackground(background)
+            Report(name, size * size, Time(lambda: str(charcoal)))
+
+
+def BenchmarkRefresh():
+    """
+    BenchmarkRefresh()
+
+    Times animating a cursor across filled canvases, \
+redrawing the whole screen and only the changed rows every frame, \
+and prints the frames per second and characters written per frame.
+
+    """
+    for incremental in (False, True):
+        name = "incremental refresh" if incremental else "full refresh"
+        for size in (20, 80, 200):
+            charcoal = Charcoal(
+                info={Info.incremental_refresh} if incremental else set()
+            )
+            charcoal.Oblong(size, size, ".")
+            output = StringIO()
+
+            def Animate():
+                output.seek(0)
+                output.truncate()
+                with redirect_stdout(output):
+                    for frame in range(100):
+                        charcoal.Put("@", frame % size, frame * 7 % size)
+                        charcoal.RefreshFast()
+            seconds = Time(Animate)
+            print("%-32s %8d %12.1ffps %12dchars/frame" % (
+                name, size, 100 / seconds, len(output.getvalue()) // 100
+            ))
+
+
+def BenchmarkCompression():
+    """
+    BenchmarkCompression()
+
+    Times compressing and decompressing random ASCII art \
+with each of the compression methods, for literals up to 64 KB.
+
+    Time per unit should grow slowly with the size.
+
+    """
+    methods = [
+        ("string", compression.CompressString, "“"),
+        ("permuted", compression.CompressPermutations, "”"),
+        ("charset", compression.CompressCharset, "”"),
+        ("rle", compression.CompressRLE, "”"),
+        ("brotli", compression.CompressBrotli, "”"),
+        ("lzma", compression.CompressLZMA, "”")
+    ]
+    generator = random.Random(0)
+    for name, compress, delimiter in methods:
+        for size in (1024, 4096, 16384, 65536):
+            string = "".join(
+                generator.choice(" _/\\|-\n") * generator.randint(1, 4)
+                for _ in range(size // 2)
+            )[:size]
+            literal = delimiter + compress(string) + "”"
+            Report("compress " + name, size, Time(
+                lambda: compress(string), 1
+            ))
+            Report("decompress " + name, len(literal), Time(
+                lambda: compression.Decompressed(literal), 1
+            ))
+
+
+def BenchmarkCompressed():
+    """
+    BenchmarkCompressed()
+
+    Times finding the shortest literal for random ASCII art, \
+trying the compression methods one at a time and in a pool of threads.
+
+    Time per unit should grow slowly with the size.
+
+    """
+    generator = random.Random(0)
+    for workers in (0, 4):
+        compression.SetCompressionPool(workers)
+        for size in (64, 1024, 16384):
+            string = "".join(
+                generator.choice(" _/\\|-\n") * generator.randint(1, 4)
+                for _ in range(size // 2)
+            )[:size]
+            Report("search %d workers" % workers, size, Time(
+                lambda: compression.SearchCompressed(string), 1
+            ))
+    compression.SetCompressionPool()
+
+
+def BenchmarkCompile():
+    """
+    BenchmarkCompile()
+
+    Times running nested loops and long programs, \
+interpreted and compiled to Python functions.
+
+    Compiled programs should run faster, most of all for nested loops.
+
+    """
+    superscript = str.maketrans("0123456789", "⁰¹²³⁴⁵⁶⁷⁸⁹")
+    programs = [
+        ("nested loops", lambda size: "Ｆ%sＦ%s¿﹪⁺ικ³→" % (
+            str(size).translate(superscript), str(size).translate(superscript)
+        )),
+        ("while loop", lambda size: "≔⁰θＷ‹θ%s≔⊕θθ" % (
+            str(size * size).translate(superscript)
+        )),
+        ("long program", lambda size: "a→" * size * 10)
+    ]
+    for name, make in programs:
+        for size in (10, 20, 40):
+            code = make(size)
+            for processor, kind in (
+                (InterpreterProcessor, "interpreted"),
+                (CompilerProcessor, "compiled")
+            ):
+                program = Parse(code, processor=processor)
+
+                def Execute():
+                    program(Charcoal())
+                Report("%s %s" % (kind, name), size, Time(Execute))
+
+
+def BenchmarkOptimize():
+    """
+    BenchmarkOptimize()
+
+    Times running loops over constant expressions, branches \
+and loop invariants, as parsed and optimized.
+
+    Optimized programs should run faster, as they no longer \
+evaluate the constants and invariants on every iteration.
+
+    """
+    superscript = str.maketrans("0123456789", "⁰¹²³⁴⁵⁶⁷⁸⁹")
+    programs = [
+        ("constants", lambda size: "Ｆ%s≔⁺×χφ↥βθ" % (
+            str(size * size).translate(superscript)
+        )),
+        ("branches", lambda size: "Ｆ%s¿∧⁰ι→←" % (
+            str(size * size).translate(superscript)
+        )),
+        ("invariants", lambda size: "≔abcθＦ%s≔⁺ι×ＬθＬθη" % (
+            str(size * size).translate(superscript)
+        ))
+    ]
+    for name, make in programs:
+        for size in (10, 20, 40):
+            code = make(size)
+            for processor, kind in (
+                (InterpreterProcessor, "interpreted"),
+                (OptimizerProcessor, "optimized")
+            ):
+                program = Parse(code, processor=processor)
+
+                def Execute():
+                    program(Charcoal())
+                Report("%s %s" % (kind, name), size, Time(Execute))
+
+
+def BenchmarkScope():
+    """
+    BenchmarkScope()
+
+    Times reading and writing loop variables in nested loops \
+of increasing depth.
+
+    Variables are resolved through the slots of the innermost scope, \
+so the time per access should not grow with the depth.
+
+    """
+    for depth in (1, 2, 4, 6):
+        program = Parse(
+            "≔⁰θ%s≔⁺ιθθ" % ("Ｆ⁴" * depth),
+            processor=InterpreterProcessor
+        )
+
+        def Execute():
+            program(Charcoal())
+        Report("loops nested %d deep" % depth, 4 ** depth, Time(Execute))
+
+
+def BenchmarkLambda():
+    """
+    BenchmarkLambda()
+
+    Times calling Charcoal functions as lambdas, see Lambdafy, \
+which run on canvases reused from a pool.
+
+    """
+    for code in ("", "Ｉι", "Ｆι«a↓»"):
+        charcoal = Charcoal()
+        function = charcoal.Lambdafy(
+            Parse(code, processor=InterpreterProcessor)
+        )
+        for size in (100, 1000):
+
+            def Execute():
+                for _ in range(size):
+                    function(3)
+            Report("lambda %r" % code, size, Time(Execute))
+
+
+def BenchmarkVectorize():
+    """
+    BenchmarkVectorize()
+
+    Times arithmetic on lists of numbers, which maps over the list \
+in one pass instead of recursing per element.
+
+    """
+    charcoal = Charcoal()
+    modulo = vectorize(lambda left, right, c: left % right, cast_string=False)
+    for size in (1000, 100000):
+        numbers = list(range(size))
+        Report("increment", size, Time(lambda: Incremented(numbers)))
+        Report("halve", size, Time(lambda: Halved(numbers)))
+        Report("add", size, Time(lambda: charcoal.Add(numbers, 3)))
+        Report("divide", size, Time(lambda: charcoal.Divide(numbers, 3)))
+        Report("modulo", size, Time(lambda: modulo(numbers, 3, charcoal)))
+
+
+def BenchmarkFill():
+    """
+    BenchmarkFill()
+
+    Times filling the inside of boxes of increasing size \
+with a patterned string, see Spans.
+
+    """
+    superscript = str.maketrans("0123456789", "⁰¹²³⁴⁵⁶⁷⁸⁹")
+    for size in (16, 64, 256):
+        program = Parse(
+            "ＵＲ%s¦%sＪ¹¦¹¤abc" % (
+                str(size).translate(superscript),
+                str(size).translate(superscript)
+            ),
+            processor=InterpreterProcessor
+        )
+
+        def Execute():
+            program(Charcoal())
+        Report("fill", (size - 2) ** 2, Time(Execute))
+
+
+def BenchmarkPolygon():
+    """
+    BenchmarkPolygon()
+
+    Times drawing and filling polygons of increasing size, \
+whose outlines are collected row by row, see Coordinates.
+
+    """
+    superscript = str.maketrans("0123456789", "⁰¹²³⁴⁵⁶⁷⁸⁹")
+    for size in (16, 128, 512):
+        length = str(size).translate(superscript)
+        for code in (
+            "Ｇ↗%s↘%s*" % (length, length),
+            "Ｇ→%s↓%s←%sab\ncd" % (length, length, length)
+        ):
+            program = Parse(code, processor=InterpreterProcessor)
+
+            def Execute():
+                program(Charcoal())
+            Report("polygon %r" % code[:2], size, Time(Execute))
+
+
+def BenchmarkTrim():
+    """
+    BenchmarkTrim()
+
+    Times trimming a sparse canvas, and trimming it again \
+once there is nothing left to trim.
+
+    """
+    for size in (100, 1000):
+        lines = ["\000" * 10] + [
+            "\000" * size + "a" + "\000" * size if i % 2 else "a" * 10
+            for i in range(size)
+        ] + ["\000" * 10]
+        charcoal = Charcoal()
+        charcoal.lines = lines[:]
+        charcoal.indices = [0] * len(lines)
+        charcoal.lengths = list(map(len, lines))
+        charcoal.right_indices = charcoal.lengths[:]
+
+        def Execute():
+            charcoal.Trim()
+        Report("trim", size, Time(Execute, repeat=1))
+        Report("trim again", size, Time(Execute))
+
+
+def BenchmarkTransform():
+    """
+    BenchmarkTransform()
+
+    Times every rotation and reflection of a 1000x1000 canvas, \
+and copying or overlapping it rotated or reflected, \
+with and without transforming the characters, see bulktransforms.
+
+    Each rotation by 45 degrees is timed, up to 315 degrees, \
+as rotating by 360 degrees does nothing.
+
+    """
+    size = 1000
+    generator = random.Random(0)
+    lines = [
+        "".join(generator.choice("ab/\\|-") for _ in range(size))
+        for _ in range(size)
+    ]
+    charcoal = Charcoal()
+
+    def Transformed(method, *arguments):
+        def Execute():
+            charcoal.lines = lines[:]
+            charcoal.indices = [0] * size
+            charcoal.lengths = [size] * size
+            charcoal.right_indices = [size] * size
+            charcoal.top = 0
+            method(*arguments)
+        return Execute
+    for transform in (False, True):
+        name = " transform" if transform else ""
+        for rotations in range(1, 8):
+            Report(
+                "rotate %d%s" % (rotations, name), size * size,
+                Time(Transformed(charcoal.Rotate, rotations, transform))
+            )
+        for direction in (
+            Direction.right, Direction.down, Direction.down_right,
+            Direction.down_left
+        ):
+            Report(
+                "reflect %s%s" % (direction.name, name), size * size,
+                Time(Transformed(charcoal.Reflect, direction, transform))
+            )
+        for direction in (Direction.right, Direction.down_right):
+            Report(
+                "copy %s%s" % (direction.name, name), size * size,
+                Time(Transformed(charcoal.ReflectCopy, direction, transform))
+            )
+            Report(
+                "overlap %s%s" % (direction.name, name), size * size,
+                Time(Transformed(
+                    charcoal.ReflectOverlap, direction, transform, 1
+                ))
+            )
+        Report(
+            "rotate copy%s" % name, size * size,
+            Time(Transformed(
+                charcoal.RotateCopy, 2, Direction.down_right, transform
+            ))
+        )
+        Report(
+            "rotate overlap%s" % name, size * size,
+            Time(Transformed(
+                charcoal.RotateOverlap, 2, Direction.down_right, transform
+            ))
+        )
+
+
+def BenchmarkTranslate():
+    """
+    BenchmarkTranslate()
+
+    Times transforming every character of a 1000x1000 canvas \
+with each character transformer, see Transformer.
+
+    """
+    size = 1000
+    generator = random.Random(0)
+    lines = [
+        "".join(generator.choice("ab/\\|-┌┐") for _ in range(size))
+        for _ in range(size)
+    ]
+    for name, transformer in sorted(vars(charactertransformers).items()):
+        if isinstance(transformer, charactertransformers.Transformer):
+
+            def Execute():
+                for line in lines:
+                    transformer.Translate(line)
+            Report("translate " + name, size * size, Time(Execute))
+
+
+Benchmarks = {
+    "parse": BenchmarkParse,
+    "cache": BenchmarkProgramCache,
+    "canvas": BenchmarkCanvas,
+    "render": BenchmarkRender,
+    "refresh": BenchmarkRefresh,
+    "compression": BenchmarkCompression,
+    "compressed": BenchmarkCompressed,
+    "compile": BenchmarkCompile,
+    "optimize": BenchmarkOptimize,
+    "scope": BenchmarkScope,
+    "lambda": BenchmarkLambda,
+    "vectorize": BenchmarkVectorize,
+    "fill": BenchmarkFill,
+    "polygon": BenchmarkPolygon,
+    "trim": BenchmarkTrim,
+    "transform": BenchmarkTransform,
+    "translate": BenchmarkTranslate
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Charcoal's benchmarks.")
+    parser.add_argument(
+        "benchmarks", nargs="*", default=list(Benchmarks),
+        help="Benchmarks to run, out of: %s." % ", ".join(Benchmarks)
+    )
+    for name in parser.parse_args().benchmarks:
+        if name not in Benchmarks:
+            print("Unknown benchmark: %s" % name)
+            sys.exit(1)
+        print("Benchmark %s:" % name)
+        Benchmarks[name]()
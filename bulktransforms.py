@@ -0,0 +1,376 @@
+import re
+
+# Where the cell at (x, y) ends up after rotating the canvas 45 degrees
+# a number of times, and the direction each row is drawn in afterwards
+rotators = {
+    1: lambda x, y: (y + x, y - x),
+    2: lambda x, y: (y, -x),
+    3: lambda x, y: (y - x, -y - x),
+    4: lambda x, y: (-x, -y),
+    5: lambda x, y: (-x - y, x - y),
+    6: lambda x, y: (-y, x),
+    7: lambda x, y: (x - y, x + y)
+}
+steps = {
+    1: (1, -1), 2: (0, -1), 3: (-1, -1), 4: (-1, 0), 5: (-1, 1), 6: (0, 1),
+    7: (1, 1)
+}
+sentinels = "\001\002\003\004\005\006\007\010"
+
+
+def NewRowIndices(number, offset, below):
+    """
+    NewRowIndices(number, offset, below) -> list
+
+    Returns the indices Charcoal.FillLines gives to number new rows, \
+added below the canvas if below is true and above it otherwise, \
+where offset is the x-coordinate of the cursor minus \
+the index of the row next to the new rows.
+
+    """
+    sign = (offset > 0) - (offset < 0)
+    count = min(number, offset * sign)
+    zeros = [0] * (number - count)
+    if sign == 1:
+        steps = list(range(1, count + 1))
+    elif sign == -1:
+        steps = list(range(-1, -count - 1, -1))
+    else:
+        return [0] * number
+    return zeros + steps if below else steps[::-1] + zeros
+
+
+def Bounds(lines, indices):
+    """
+    Bounds(lines, indices) -> (int, int)
+
+    Returns the leftmost and rightmost x-coordinates of the cells \
+in the rows, or (0, 0) if the rows are all empty.
+
+    """
+    bounds = [
+        (index, index + len(line))
+        for line, index in zip(lines, indices)
+        if line
+    ]
+    if not bounds:
+        return 0, 0
+    return min(bounds)[0], max(right for _, right in bounds)
+
+
+def Extents(strokes, top=0, indices=(0,), lengths=(0,)):
+    """
+    Extents(strokes, top=0, indices=(0,), lengths=(0,)) -> (int, int, list)
+
+    Returns the top and bottom of the canvas after drawing strokes \
+on the canvas with the given top and row indices and lengths, \
+empty by default, and the rows FillLines adds on the way \
+as (y-coordinate, indices) pairs.
+
+    Each stroke is a tuple (x, y, low, high, x_low, x_high) where \
+the cursor starts at (x, y), rows low to high get written to, \
+and x_low and x_high are the leftmost x-coordinates written \
+in rows low and high.
+
+    """
+    bottom = top + len(indices) - 1
+    top_index, bottom_index = indices[0], indices[-1]
+    top_written, bottom_written = lengths[0] > 0, lengths[-1] > 0
+    added = []
+    for x, y, low, high, x_low, x_high in strokes:
+        if y > bottom:
+            indices = NewRowIndices(y - bottom, x - bottom_index, True)
+            added += [(bottom + 1, indices)]
+            bottom, bottom_index, bottom_written = y, indices[-1], False
+        elif y < top:
+            indices = NewRowIndices(top - y, x - top_index, False)
+            added += [(y, indices)]
+            top, top_index, top_written = y, indices[0], False
+        if low < top:
+            top, top_index, top_written = low, x_low, True
+        elif low == top:
+            top_index = min(top_index, x_low) if top_written else x_low
+            top_written = True
+        if high > bottom:
+            bottom, bottom_index, bottom_written = high, x_high, True
+        elif high == bottom:
+            bottom_index = (
+                min(bottom_index, x_high) if bottom_written else x_high
+            )
+            bottom_written = True
+    return top, bottom, added
+
+
+def Sentinel(lines):
+    """
+    Sentinel(lines) -> str
+
+    Returns a control character found in none of the lines, \
+or None if they use them all.
+
+    """
+    for sentinel in sentinels:
+        if not any(sentinel in line for line in lines):
+            return sentinel
+    return None
+
+
+def Rotate(lines, indices, lengths, top, rotations):
+    """
+    Rotate(lines, indices, lengths, top, rotations) -> tuple
+
+    Returns the lines, indices, lengths, right indices and top \
+of the canvas rotated 45 degrees the given number of times, \
+from 1 to 7.
+
+    The result is the same as drawing each row in its new direction, \
+as Charcoal.Rotate does, but each new row is put together in one go: \
+the rows are padded to the same width, and sheared for diagonals, \
+so every new row is a column of the padded rows. \
+Returns None if lengths does not hold the length of each line, \
+as Charcoal.Rotate then repeats or cuts the lines, \
+or if there is no character to pad the rows with, see Sentinel.
+
+    """
+    number = len(lines)
+    if lengths[:number] != [len(line) for line in lines]:
+        return None
+    lengths = lengths[:number]
+    rotator, (delta_x, delta_y) = rotators[rotations], steps[rotations]
+    strokes = []
+    for y, index, length in zip(range(top, top + number), indices, lengths):
+        # Rows are drawn with Put when horizontal, even if empty
+        if length or not delta_y:
+            x, start = rotator(index, y)
+            end_x = x + delta_x * (length - 1)
+            end = start + delta_y * (length - 1)
+            strokes += [
+                (x, start, end, start, end_x, x) if delta_y < 0 else
+                (x, start, start, end, x, end_x) if delta_y else
+                (x, start, start, start, end_x, end_x)
+            ]
+    new_top, new_bottom, added = Extents(strokes)
+    height = new_bottom - new_top + 1
+    new_lines = [""] * height
+    new_indices = [0] * height
+    new_lengths = [0] * height
+    for y, row_indices in added:
+        new_indices[y - new_top:y - new_top + len(row_indices)] = row_indices
+    if rotations == 4:
+        start = -(top + number - 1) - new_top
+        new_lines[start:start + number] = [line[::-1] for line in lines][::-1]
+        new_indices[start:start + number] = [
+            1 - index - length for index, length in zip(indices, lengths)
+        ][::-1]
+        new_lengths[start:start + number] = lengths[::-1]
+        return Canvas(new_lines, new_indices, new_lengths, new_top)
+    sentinel = Sentinel(lines)
+    if sentinel is None:
+        return None
+    left, right = Bounds(lines, indices)
+    width = right - left
+    rows = [
+        sentinel * (index - left) + line +
+        sentinel * (right - index - len(line))
+        if line else sentinel * width
+        for line, index in zip(lines, indices)
+    ]
+    # Shear so cells on the same diagonal end up in the same column
+    if delta_x == delta_y:
+        shifts = range(number)
+    elif delta_x:
+        shifts = range(number - 1, -1, -1)
+    else:
+        shifts = [0] * number
+    if delta_x:
+        rows = [
+            sentinel * shift + row + sentinel * (number - 1 - shift)
+            for row, shift in zip(rows, shifts)
+        ]
+    reverse = delta_y > 0
+    for column, cells in enumerate(zip(*rows)):
+        cells = "".join(cells)
+        line = cells.strip(sentinel)
+        if not line:
+            continue
+        line = line.replace(sentinel, "\000")
+        if delta_x:
+            line = "\000".join(line)
+        row = len(cells) - len(cells.rstrip(sentinel)) if reverse else (
+            len(cells) - len(cells.lstrip(sentinel))
+        )
+        if reverse:
+            line = line[::-1]
+            row = number - 1 - row
+        x, y = rotator(left + column - shifts[row], top + row)
+        new_lines[y - new_top] = line
+        new_indices[y - new_top] = x
+        new_lengths[y - new_top] = len(line)
+    return Canvas(new_lines, new_indices, new_lengths, new_top)
+
+
+def Canvas(lines, indices, lengths, top):
+    """
+    Canvas(lines, indices, lengths, top) -> tuple
+
+    Returns the lines, indices, lengths, right indices and top \
+of a canvas.
+
+    """
+    return lines, indices, lengths, [
+        index + length for index, length in zip(indices, lengths)
+    ], top
+
+
+def Overlay(
+    lines, indices, lengths, right_indices, top, step, strokes, overwrite
+):
+    """
+    Overlay(
+        lines, indices, lengths, right_indices, top, step, strokes, overwrite
+    ) -> tuple
+
+    Returns the lines, indices, lengths, right indices and top \
+of the canvas after drawing the strokes (x, y, length, string) on it \
+from (x, y) in the direction step, a pair (delta x, delta y), \
+as Charcoal.DrawStrokes does with PrintLine, \
+keeping the cells already drawn on unless overwrite is true. \
+Rows nothing is drawn on keep their right indices.
+
+    Horizontal strokes must each be on their own row, and each vertical \
+stroke one column along from the last. The cells each row gets \
+are put together in one go, then merged with the old row, see Merge. \
+Returns None if the strokes are laid out some other way, \
+if a length is not that of its string, if lengths does not hold \
+the length of each line, if rows would be added below indices \
+left behind by Charcoal.Trim, or if there is no character \
+to mark the cells left alone with, see Sentinel.
+
+    """
+    number = len(lines)
+    lines = list(lines)
+    if not number or lengths[:number] != [len(line) for line in lines] or any(
+        length != len(string) for _, _, length, string in strokes
+    ):
+        return None
+    # Charcoal.Trim leaves the indices of the rows it removes behind,
+    # and Charcoal.FillLines adds new rows after them
+    tail = indices[number:], lengths[number:], right_indices[number:]
+    indices, lengths = indices[:number], lengths[:number]
+    delta_x, delta_y = step
+    # PrintLine draws empty strings as a line of length 0 when overwriting
+    if overwrite and not delta_y and not all(
+        string for _, _, _, string in strokes
+    ):
+        return None
+    sentinel = Sentinel(lines + [string for _, _, _, string in strokes])
+    if sentinel is None:
+        return None
+    paths, rows = [], []
+    if delta_y:
+        xs = [x for x, _, _, _ in strokes]
+        step_x = 1 if len(xs) < 2 or xs[1] > xs[0] else -1
+        if xs != list(range(xs[0], xs[0] + step_x * len(xs), step_x)):
+            return None
+        columns = []
+        for x, y, length, string in strokes:
+            if not length:
+                columns += [(0, -1, "")]
+                continue
+            end = y + delta_y * (length - 1)
+            low, high = min(y, end), max(y, end)
+            paths += [(x, y, low, high, x, x)]
+            columns += [(low, high, string if delta_y > 0 else string[::-1])]
+        if paths:
+            first = min(low for _, _, low, _, _, _ in paths)
+            last = max(high for _, _, _, high, _, _ in paths)
+            columns = [
+                sentinel * (low - first) + column + sentinel * (last - high)
+                if column else sentinel * (last - first + 1)
+                for low, high, column in columns
+            ]
+            if step_x < 0:
+                columns.reverse()
+            left = min(xs)
+            for row, cells in enumerate(zip(*columns)):
+                cells = "".join(cells)
+                stripped = cells.lstrip(sentinel)
+                if stripped:
+                    rows += [(
+                        first + row, left + len(cells) - len(stripped),
+                        stripped.rstrip(sentinel)
+                    )]
+    else:
+        for x, y, length, string in strokes:
+            if not length:
+                continue
+            left = x - length + 1 if delta_x < 0 else x
+            paths += [(x, y, y, y, left, left)]
+            rows += [(y, left, string[::-1] if delta_x < 0 else string)]
+        if len({y for y, _, _ in rows}) != len(rows):
+            return None
+    new_top, new_bottom, added = Extents(paths, top, indices, lengths)
+    if tail[0] and new_bottom >= top + number:
+        return None
+    height = new_bottom - new_top + 1
+    start = top - new_top
+    new_lines = [""] * height
+    new_indices = [0] * height
+    for y, row_indices in added:
+        new_indices[y - new_top:y - new_top + len(row_indices)] = row_indices
+    new_lines[start:start + number] = lines
+    new_indices[start:start + number] = indices
+    new_right_indices = list(new_indices)
+    new_right_indices[start:start + number] = right_indices[:number]
+    for y, x, cells in rows:
+        row = y - new_top
+        merged = Merge(
+            new_lines[row], new_indices[row], cells, x, sentinel, overwrite
+        )
+        if merged:
+            new_lines[row], new_indices[row] = merged
+            new_right_indices[row] = merged[1] + len(merged[0])
+    return (
+        new_lines, new_indices + tail[0],
+        [len(line) for line in new_lines] + tail[1],
+        new_right_indices + tail[2], new_top
+    )
+
+
+def Merge(line, index, cells, x, sentinel, overwrite):
+    """
+    Merge(line, index, cells, x, sentinel, overwrite) -> (str, int)
+
+    Returns the row starting at index after drawing cells on it \
+from x, and its new index, where the cells that are the sentinel \
+are left alone, and so are the cells of the row already drawn on \
+unless overwrite is true. Gaps are filled with null characters, \
+as Charcoal.Put does. Returns None if no cell gets drawn.
+
+    """
+    if not line:
+        return cells.replace(sentinel, "\000"), x
+    start = min(index, x)
+    end = max(index + len(line), x + len(cells))
+    line = (
+        "\000" * (index - start) + line +
+        "\000" * (end - index - len(line))
+    )
+    begin = x - start
+    old = line[begin:begin + len(cells)]
+    if overwrite:
+        if sentinel in cells:
+            cells = re.sub(
+                re.escape(sentinel) + "+",
+                lambda match: old[match.start():match.end()], cells
+            )
+    else:
+        new = cells
+        cells = re.sub(
+            "\000+", lambda match: new[match.start():match.end()], old
+        )
+        # Each null character left alone is now the sentinel
+        if cells.count(sentinel) == old.count("\000"):
+            return None
+        cells = cells.replace(sentinel, "\000")
+    return line[:begin] + cells + line[begin + len(cells):], start
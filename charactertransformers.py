@@ -1,26 +1,56 @@
 # TODO: alphabe
 
-RotateHalfRight = {
+
+class Transformer(dict):
+    """
+    A dict from characters to their transformed versions, \
+along with a str.translate table made from it when it is created.
+
+    """
+    __slots__ = ("table",)
+
+    def __init__(self, mapping):
+        """
+        Transformer(mapping) -> Transformer
+
+        Creates a transformer replacing the keys of mapping with its values.
+
+        """
+        super().__init__(mapping)
+        self.table = str.maketrans(dict(mapping))
+
+    def Translate(self, string):
+        """
+        Translate(string) -> str
+
+        Returns string with every character transformed, \
+using str.translate.
+
+        """
+        return string.translate(self.table)
+
+
+RotateHalfRight = Transformer({
     "|": "/", "-": "\\", "/": "-", "\\": "|", "│": "╱", "─": "╲", "╱": "─",
     "╲": "│"
-}
+})
 
-RotateHalfLeft = {
+RotateHalfLeft = Transformer({
     "|": "\\", "-": "/", "/": "|", "\\": "-", "│": "╲", "─": "╱", "╱": "│",
     "╲": "─"
-}
+})
 
-RotateThreeHalvesRight = {
+RotateThreeHalvesRight = Transformer({
     "|": "\\", "-": "/", "/": "|", "\\": "-", "│": "╲", "─": "╱", "╱": "│",
     "╲": "─"
-}
+})
 
-RotateThreeHalvesLeft = {
+RotateThreeHalvesLeft = Transformer({
     "|": "/", "-": "\\", "/": "-", "\\": "|", "│": "╱", "─": "╲", "╱": "─",
     "╲": "│"
-}
+})
 
-RotateRight = {
+RotateRight = Transformer({
     "-": "|", "|": "-", "\\": "/", "/": "\\", "╲": "╱", "╱": "╲",
     "─": "│", "│": "─", "━": "┃", "┃": "━", "╌": "╎", "╎": "╌",
     "╍": "╏", "╏": "╍", "┄": "┆", "┆": "┄", "┅": "┇", "┇": "┅",
@@ -43,9 +73,9 @@ RotateRight = {
     "╯": "╰", "╰": "╭", "╴": "╵", "╵": "╶", "╶": "╷", "╷": "╴",
     "╸": "╹", "╹": "╺", "╺": "╻", "╻": "╸", "╼": "╽", "╽": "╾",
     "╾": "╿", "╿": "╼"
-}
+})
 
-RotateLeft = {
+RotateLeft = Transformer({
     "-": "|", "|": "-", "\\": "/", "/": "\\", "╲": "╱", "╱": "╲",
     "─": "│", "│": "─", "━": "┃", "┃": "━", "╌": "╎", "╎": "╌",
     "╍": "╏", "╏": "╍", "┄": "┆", "┆": "┄", "┅": "┇", "┇": "┅",
@@ -68,9 +98,9 @@ RotateLeft = {
     "╯": "╮", "╰": "╯", "╴": "╷", "╵": "╴", "╶": "╵", "╷": "╶",
     "╸": "╻", "╹": "╸", "╺": "╹", "╻": "╺", "╼": "╿", "╽": "╼",
     "╾": "╽", "╿": "╾"
-}
+})
 
-RotateDown = {
+RotateDown = Transformer({
     "b": "q", "d": "p", "p": "d", "q": "b", "6": "9", "9": "6",
     "{": "}", "}": "{", "[": "]", "]": "[", "<": ">", ">": "<",
     "(": ")", ")": "(", "┐": "└", "┘": "┌", "┌": "┘", "└": "┐",
@@ -120,9 +150,9 @@ RotateDown = {
     "〚": "〛", "〛": "〚", "《": "》", "》": "《", "【": "】", "】": "【",
     "（": "）", "）": "（", "［": "］", "］": "［", "＜": "＞", "＞": "＜",
     "｛": "｝", "｝": "｛", "｟": "｠", "｠": "｟"
-}
+})
 
-HorizontalFlip = {
+HorizontalFlip = Transformer({
     "b": "d", "d": "b", "p": "q", "q": "p",
     "{": "}", "}": "{", "[": "]", "]": "[", "<": ">", ">": "<",
     "(": ")", ")": "(", "\\": "/", "/": "\\", "╲": "╱", "╱": "╲",
@@ -162,9 +192,9 @@ HorizontalFlip = {
     "《": "》", "》": "《", "【": "】", "】": "【", "（": "）", "）": "（",
     "［": "］", "］": "［", "＜": "＞", "＞": "＜", "｛": "｝", "｝": "｛",
     "｟": "｠", "｠": "｟"
-}
+})
 
-VerticalFlip = {
+VerticalFlip = Transformer({
     "b": "p", "d": "q", "p": "b", "q": "d",
     "\\": "/", "/": "\\", "╲": "╱", "╱": "╲",
     "┐": "┘", "┘": "┐", "┌": "└", "└": "┌",
@@ -192,9 +222,9 @@ VerticalFlip = {
     "⎴": "⎵", "⎵": "⎴", "⏜": "⏝", "⏝": "⏜", "⏞": "⏟", "⏟": "⏞",
     "⏠": "⏡", "⏡": "⏠", "⦍": "⦏", "⦏": "⦍", "⦐": "⦎", "⦎": "⦐",
     "⸜": "⸍", "⸍": "⸜", "⸝": "⸌", "⸌": "⸝", "⸉": "⸊", "⸊": "⸉",
-}
+})
 
-NWSEFlip = {
+NWSEFlip = Transformer({
     "-": "|", "|": "-",
     "─": "│", "│": "─", "━": "┃", "┃": "━", "╌": "╎", "╎": "╌",
     "╍": "╏", "╏": "╍", "┄": "┆", "┆": "┄", "┅": "┇", "┇": "┅",
@@ -220,9 +250,9 @@ NWSEFlip = {
     "╠": "╦", "╦": "╠", "╣": "╩", "╩": "╣", "╪": "╫", "╫": "╪",
     "╮": "╰", "╰": "╮", "╸": "╹", "╹": "╸", "╺": "╻", "╻": "╺",
     "╼": "╽", "╽": "╼", "╾": "╿", "╿": "╾"
-}
+})
 
-NESWFlip = {
+NESWFlip = Transformer({
     "-": "|", "|": "-",
     "─": "│", "│": "─", "━": "┃", "┃": "━", "╌": "╎", "╎": "╌",
     "╍": "╏", "╏": "╍", "┄": "┆", "┆": "┄", "┅": "┇", "┇": "┅",
@@ -242,4 +272,4 @@ NESWFlip = {
     "╢": "╤", "╧": "╟", "╠": "╩", "╦": "╣", "╣": "╦", "╩": "╠",
     "╪": "╫", "╫": "╪", "╭": "╯", "╯": "╭", "╸": "╻", "╹": "╺",
     "╺": "╹", "╻": "╸", "╼": "╿", "╽": "╾", "╾": "╽", "╿": "╼"
-}
+})
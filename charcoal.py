@@ -14,16 +14,33 @@ from directiondictionaries import *
 from unicodegrammars import UnicodeGrammars
 from verbosegrammars import VerboseGrammars
 from astprocessor import ASTProcessor
-from interpreterprocessor import InterpreterProcessor, iter_apply
+from interpreterprocessor import (
+    InterpreterProcessor, iter_apply, IsNumeric, numeric_types
+)
 from stringifierprocessor import StringifierProcessor
+from derivationprocessor import (
+    DerivationProcessor, Replay, FlattenDerivation
+)
+from compiler import CompilerProcessor
+from optimizer import OptimizerProcessor, CompiledOptimizerProcessor
+from diskcache import DiskCache
+from rowbuffer import RowBuffers
+from floodfill import Spans, Cycled
+import bulktransforms
+from bulktransforms import rotators
 from codepage import (
     UnicodeLookup, ReverseLookup, UnicodeCommands, InCodepage, sOperator,
-    rCommand
+    rCommand, DecodeStream, EncodeStream
+)
+from compression import (
+    Decompressed, Escaped, SetCompressionPool, SetDecompressedCache
 )
-from compression import Decompressed, Escaped
 from wolfram import *
 from extras import *
 from enum import Enum
+from collections import OrderedDict
+from itertools import chain
+from array import array
 from ast import literal_eval
 from time import sleep, perf_counter as clock, time as now
 from math import ceil, log2
@@ -36,6 +53,7 @@ import builtins
 import types
 import zlib
 import base64
+import json
 
 command_abbreviations = {}
 
@@ -198,6 +216,11 @@ def large_range(number):
         yield n
         n += 1
 
+
+rGaps = re.compile("(\000+)")
+# The most cells of the canvas a CharcoalLimitError keeps as its output
+max_partial_output = 1 << 20
+
 stringify_lookup = {
     "e": "cdflmnosv"
 }
@@ -263,6 +286,70 @@ class Info(Enum):
     warn_ambiguities = 3
     step_canvas = 4
     dump_canvas = 5
+    incremental_refresh = 6
+    raise_errors = 7
+
+
+class CharcoalError(Exception):
+    """
+    Base class for errors in Charcoal programs, raised instead of \
+exiting when Info.raise_errors is set.
+
+    """
+    pass
+
+
+class CharcoalRuntimeError(CharcoalError):
+    """
+    Raised when a Charcoal program fails while running.
+
+    """
+    pass
+
+
+class CharcoalLimitError(CharcoalRuntimeError):
+    """
+    Raised when a Charcoal program goes over one of the limits \
+set with Charcoal.SetLimits.
+
+    The limit that was hit, "steps", "size" or "time", is kept in limit, \
+and the canvas as printed when it was hit in output.
+
+    """
+
+    def __init__(self, message, limit, output):
+        """
+        CharcoalLimitError(message, limit, output) -> CharcoalLimitError
+
+        Creates an error for the given limit and partial output.
+
+        """
+        super().__init__(message)
+        self.limit = limit
+        self.output = output
+
+
+class CharcoalParseError(CharcoalError):
+    """
+    Raised when Charcoal code cannot be parsed.
+
+    The parse trace, if any, is kept in trace.
+
+    """
+
+    def __init__(self, trace=None):
+        """
+        CharcoalParseError(trace=None) -> CharcoalParseError
+
+        Creates an error for the given parse trace.
+
+        """
+        super().__init__(
+            "Parsing failed, parse trace:\n" + "\n".join(trace)
+            if isinstance(trace, list) else
+            "Parsing failed"
+        )
+        self.trace = trace
 
 
 class Whatever(object):
@@ -341,65 +428,121 @@ whatever = Whatever()
 
 
 class Coordinates(object):
-    __slots__ = ("top", "coordinates", "list")
+    """
+    The x-coordinates of the cells on the outline of a polygon, \
+as an array per row in the order they were added.
+
+    Rows from y = 0 down are kept in below and rows above it \
+in above, nearest first, so rows can be added in either direction \
+in amortized constant time.
+
+    """
+    __slots__ = ("above", "below")
 
     def __init__(self):
-        self.top = 0
-        self.coordinates = [[]]
-        self.list = []
+        self.above = []
+        self.below = [array("l")]
+
+    @property
+    def top(self):
+        return -len(self.above)
 
     def FillLines(self, y):
-        if y > self.top + len(self.coordinates) - 1:
-            self.coordinates += [[] for _ in range(
-                y - self.top - len(self.coordinates) + 1
-            )]
-        elif y < self.top:
-            self.coordinates = [
-                [] for _ in range(self.top - y)
-            ] + self.coordinates
-            self.top = y
+        """
+        FillLines(y) -> array
+
+        Adds empty rows up to row y, and returns row y.
+
+        """
+        rows, index = (self.below, y) if y >= 0 else (self.above, -1 - y)
+        if index >= len(rows):
+            rows += [array("l") for _ in range(index - len(rows) + 1)]
+        return rows[index]
 
     def Add(self, x, y):
-        self.FillLines(y)
-        self.coordinates[y - self.top] += [x]
-        self.list += [(x, y)]
+        """
+        Add(x, y)
+
+        Adds the cell at x, y.
+
+        """
+        row = self.FillLines(y)
+        try:
+            row.append(x)
+        except (OverflowError, TypeError):
+            # Too big or not an int, so the row falls back to a list
+            row = list(row) + [x]
+            if y >= 0:
+                self.below[y] = row
+            else:
+                self.above[-1 - y] = row
+
+    def Rows(self):
+        """
+        Rows() -> iterable
+
+        Returns the rows from the top row down.
+
+        """
+        return chain(reversed(self.above), self.below)
 
 
 class Scope(object):
-    __slots__ = ("parent", "lookup")
+    """
+    The variables of a Charcoal program, as a chain of frames, \
+the dicts lookup of each loop or function call and the dict parent \
+of the outermost scope, which holds the variables assigned \
+and not found in any other frame.
+
+    Each scope resolves every name bound in its chain to the frame \
+holding it when it is created, in slots, so looking up a variable \
+does not walk the chain. Frames only gain names through the scope \
+they belong to, while it is the innermost.
+
+    """
+    __slots__ = ("parent", "lookup", "slots", "root")
 
     def __init__(self, parent=None, lookup=None):
         self.parent = parent or {}
         self.lookup = lookup or {}
+        if isinstance(self.parent, Scope):
+            self.slots = self.parent.slots.copy()
+            self.root = self.parent.root
+        else:
+            self.slots = {}
+            self.root = self.parent
+        for key in self.lookup:
+            self.slots[key] = self.lookup
 
     def __next__(self):
-        key = next(filter(
-            lambda character: character not in self,
-            "ικλμνξπρςστυφχψωαβγδεζηθ"
-        ))
+        slots, root = self.slots, self.root
+        for key in "ικλμνξπρςστυφχψωαβγδεζηθ":
+            if key not in slots and key not in root:
+                break
+        else:
+            raise StopIteration
         self.lookup[key] = None
+        slots[key] = self.lookup
         return key
 
     def __contains__(self, key):
-        return key in self.parent or key in self.lookup
+        return key in self.slots or key in self.root
 
     def __getitem__(self, key):
-        if key in self.lookup:
-            return self.lookup[key]
-        else:
-            return self.parent[key]
+        return self.slots.get(key, self.root)[key]
 
     def __setitem__(self, key, value):
-        if key in self.lookup:
-            self.lookup[key] = value
-        else:
-            self.parent[key] = value
+        self.slots.get(key, self.root)[key] = value
 
     def __delitem__(self, key):
-        if key in self.lookup:
-            del self.lookup[key]
-        else:
-            del self.parent[key]
+        frame = self.slots.pop(key, self.root)
+        del frame[key]
+        scope = self.parent
+        while isinstance(scope, Scope):
+            if key in scope.lookup:
+                self.slots[key] = scope.lookup
+                break
+            scope = scope.parent
 
     def __repr__(self):
         string = "{"
@@ -489,6 +632,8 @@ class Cells(list):
         self.xs = xs
         self.ys = ys
         self.charcoal = charcoal
+        # Writing to the cells draws on charcoal, so it cannot be reused
+        charcoal.lent = False
 
     def __setitem__(self, i, value):
         super().__setitem__(i, value)
@@ -520,9 +665,10 @@ class Charcoal(object):
         "x", "y", "top", "lines", "indices", "lengths", "right_indices",
         "top_scope", "scope", "info", "original_input", "inputs",
         "original_inputs", "direction", "background", "bg_lines",
-        "bg_line_number", "bg_line_length", "timeout_end", "dump_timeout_end",
-        "trim", "print_at_end", "canvas_step",
-        "last_printed", "charcoal"
+        "bg_tiles", "bg_line_number", "bg_line_length", "timeout_end",
+        "dump_timeout_end", "trim", "print_at_end", "canvas_step",
+        "last_printed", "charcoal", "row_buffers", "dirty", "frame",
+        "limits", "steps", "deadline", "pool", "lent", "extent"
     )
 
     secret = {}
@@ -552,21 +698,30 @@ class Charcoal(object):
         info=set(),
         canvas_step=500,
         original_input="",
-        trim=False
+        trim=False,
+        row_buffers=False
     ):
         """
-        Charcoal(inputs=[], info=set(), canvas_step=500, original_input="") \
--> Charcoal
+        Charcoal(inputs=[], info=set(), canvas_step=500, original_input="", \
+trim=False, row_buffers=False) -> Charcoal
 
         Creates a Charcoal canvas, \
 an object on which all canvas drawing methods exist.
 
+        If row_buffers is true, rows are stored in mutable buffers, \
+so writing to a cell does not copy the whole row.
+
         """
         self.x = self.y = self.top = 0
-        self.lines = [""]
+        self.row_buffers = row_buffers
+        self.lines = self.Rows([""])
         self.indices = [0]
         self.lengths = [0]
         self.right_indices = [0]
+        self.dirty = set()
+        self.frame = None
+        self.limits = None
+        self.steps = self.deadline = 0
         self.info = info
         self.original_input = original_input
         self.inputs = inputs
@@ -585,6 +740,7 @@ an object on which all canvas drawing methods exist.
         self.direction = Direction.right
         self.background = " "
         self.bg_lines = [" "]
+        self.bg_tiles = [" "]
         self.bg_line_number = self.bg_line_length = 1
         self.timeout_end = self.dump_timeout_end = 0
         self.trim = trim
@@ -592,6 +748,9 @@ an object on which all canvas drawing methods exist.
         self.canvas_step = canvas_step
         self.last_printed = None
         self.charcoal = None
+        self.pool = []
+        self.lent = False
+        self.extent = None
         if Info.step_canvas in self.info:
             print("\033[2J")
 
@@ -599,64 +758,59 @@ an object on which all canvas drawing methods exist.
         """Returns the current state of the canvas."""
         left = min(self.indices)
         right = max(self.right_indices)
-        string = ""
-        if not self.background:
-            for i in range(len(self.lines)):
-                top = self.top + i
-                index = self.indices[i]
-                line = self.lines[i]
-                bg_start = None
-                j = 0
-                if "\000" in line:
-                    for character in line:
-                        if character == "\000":
-                            if bg_start is None:
-                                bg_start = j
-                        elif bg_start is not None:
-                            line = (
-                                line[:bg_start] +
-                                self.BackgroundString(
-                                    top, index + bg_start, index + j
-                                ) +
-                                line[j:]
-                            )
-                            bg_start = None
-                        j += 1
-                    if bg_start is not None:
-                        line = (
-                            line[:bg_start] +
-                            self.BackgroundString(
-                                top, index + bg_start, index + j
-                            )
-                        )
-                string += (
-                    self.BackgroundString(
-                        self.top + i, left, self.indices[i]
-                    ) +
-                    line +
-                    ("" if self.trim else self.BackgroundString(
-                        self.top + i, self.right_indices[i], right
-                    )) +
-                    "\n"
-                )
-            return string[:-1]
-        else:
-            for line, index, right_index in zip(
-                self.lines, self.indices, self.right_indices
-            ):
-                string += (
-                    self.background * (index - left) +
-                    (
-                        re.sub("\000", self.background, line)
-                        if "\000" in line else line
-                    ) +
-                    (
-                        "" if self.trim else
-                        self.background * (right - right_index)
-                    ) +
-                    "\n"
+        if self.background:
+            trim = self.trim
+            return "\n".join([
+                "\000" * (index - left) + line +
+                ("" if trim else "\000" * (right - right_index))
+                for line, index, right_index in zip(
+                    self.lines, self.indices, self.right_indices
                 )
-            return string[:-1]
+            ]).replace("\000", self.background)
+        render_row = self.RenderRow
+        return "\n".join([
+            render_row(y_index, left, right)
+            for y_index in range(len(self.lines))
+        ])
+
+    def RenderRow(self, y_index, left, right):
+        """
+        RenderRow(y_index, left, right) -> str
+
+        Returns the row at the given index as it appears when printing \
+the canvas, where left and right are the x-coordinates \
+of the edges of the canvas.
+
+        """
+        line = self.lines[y_index]
+        index = self.indices[y_index]
+        right_index = self.right_indices[y_index]
+        if self.background:
+            return (
+                "\000" * (index - left) + line +
+                ("" if self.trim else "\000" * (right - right_index))
+            ).replace("\000", self.background)
+        start = min(left, right_index)
+        background = self.BackgroundString(
+            self.top + y_index, start, max(right, index + len(line))
+        )
+        if "\000" in line:
+            pieces = []
+            x = index - start
+            for piece in rGaps.split(line):
+                pieces += [
+                    background[x:x + len(piece)]
+                    if piece[:1] == "\000" else
+                    piece
+                ]
+                x += len(piece)
+            line = "".join(pieces)
+        return (
+            background[left - start:index - start] + line + (
+                "" if self.trim else
+                background[right_index - start:right - start]
+            )
+        )
 
     def __getattribute__(self, attr):
         method = object.__getattribute__(self, attr)
@@ -664,6 +818,145 @@ an object on which all canvas drawing methods exist.
             self.last_printed = None
         return method
 
+    def Error(self, message):
+        """
+        Error(message)
+
+        Reports a runtime error, raising CharcoalRuntimeError \
+if Info.raise_errors is set, and otherwise printing it \
+and exiting unless in the REPL.
+
+        """
+        if Info.raise_errors in self.info:
+            raise CharcoalRuntimeError(message)
+        print("RuntimeError: " + message)
+        if Info.is_repl not in self.info:
+            sys.exit(1)
+
+    def SetLimits(self, steps=0, size=0, time=0):
+        """
+        SetLimits(steps=0, size=0, time=0)
+
+        Limits programs drawing on the canvas to the given number of steps, \
+each an iteration of a loop, map or filter, an evaluation \
+or a line printed, to canvases at most size cells wide, \
+from the leftmost row to the rightmost, and at most size rows tall, \
+and to time seconds from now or from the next Clear. \
+A limit of 0 means no limit.
+
+        Going over a limit raises CharcoalLimitError, \
+with the output cut down if the canvas is huge, see PartialOutput.
+
+        """
+        self.limits = (steps, size, time) if steps or size or time else None
+        self.steps = 0
+        self.deadline = clock() + time
+        self.extent = None
+
+    def CheckLimits(self, size=0, steps=1):
+        """
+        CheckLimits(size=0, steps=1)
+
+        Counts the given number of steps, and raises CharcoalLimitError \
+if the program is out of steps or time, or if size is over the size limit.
+
+        """
+        step_limit, size_limit, time_limit = self.limits
+        self.steps += steps
+        if step_limit and self.steps > step_limit:
+            raise CharcoalLimitError(
+                "Step limit of %d exceeded" % step_limit, "steps",
+                self.PartialOutput()
+            )
+        if size_limit and size > size_limit:
+            raise CharcoalLimitError(
+                "Size limit of %d exceeded" % size_limit, "size",
+                self.PartialOutput()
+            )
+        if time_limit and clock() > self.deadline:
+            raise CharcoalLimitError(
+                "Time limit of %gs exceeded" % time_limit, "time",
+                self.PartialOutput()
+            )
+
+    def PartialOutput(self):
+        """
+        PartialOutput() -> str
+
+        Returns the canvas as printed, or if it has more than \
+max_partial_output cells, as many of its top rows as fit, \
+cut off at max_partial_output cells wide.
+
+        """
+        left, right = min(self.indices), max(self.right_indices)
+        number = len(self.lines)
+        if (right - left) * number <= max_partial_output:
+            return str(self)
+        width = min(right - left, max_partial_output)
+        right = left + width
+        rows = []
+        for y_index in range(min(number, max_partial_output // width)):
+            line, index = self.lines[y_index], self.indices[y_index]
+            start, end = max(index, left), min(index + len(line), right)
+            row = "\000" * (min(index, right) - left) + (
+                line[start - index:end - index] if end > start else ""
+            )
+            if not self.trim:
+                row += "\000" * (width - len(row))
+            if "\000" in row:
+                background = self.background * len(row) or (
+                    self.BackgroundString(
+                        self.top + y_index, left, left + len(row)
+                    )
+                )
+                row = "".join([
+                    cell if cell != "\000" else background_cell
+                    for cell, background_cell in zip(row, background)
+                ])
+            rows += [row]
+        return "\n".join(rows)
+
+    def CheckWidth(self, left, right, y_index=None):
+        """
+        CheckWidth(left, right, y_index=None)
+
+        Raises CharcoalLimitError if the canvas would be over the size limit \
+wide once cells from x-coordinate left up to right are drawn on it, \
+leaving out the row at y_index, which those cells replace.
+
+        The bounds of the canvas are kept in extent, which may be wider \
+than the canvas after a Trim or Crop, so the rows are only scanned again \
+when those bounds would go over the limit.
+
+        """
+        size = self.limits[1]
+        if not size:
+            return
+        indices, right_indices = self.indices, self.right_indices
+        extent = self.extent
+        if (
+            extent and extent[0] is indices and
+            extent[1] is right_indices
+        ):
+            new_left = min(left, extent[2])
+            new_right = max(right, extent[3])
+            if new_right - new_left <= size:
+                self.extent = (indices, right_indices, new_left, new_right)
+                return
+        if y_index is None:
+            left = min(left, min(indices))
+            right = max(right, max(right_indices))
+        else:
+            left = min(chain(
+                (left,), indices[:y_index], indices[y_index + 1:]
+            ))
+            right = max(chain(
+                (right,), right_indices[:y_index],
+                right_indices[y_index + 1:]
+            ))
+        self.extent = (indices, right_indices, left, right)
+        self.CheckLimits(right - left, 0)
+
     def BackgroundString(self, y, start, end):
         """
         BackgroundString(y, start, end) -> str
@@ -671,12 +964,19 @@ an object on which all canvas drawing methods exist.
         Returns the background for row at the specified y-coordinate,
         from the x-coordinates start to end.
 
+        The tiled background rows are kept in bg_tiles, and only \
+grow when a longer piece is asked for.
+
         """
-        bg_line = self.bg_lines[y % self.bg_line_number]
+        row = y % self.bg_line_number
+        tile = self.bg_tiles[row]
         index = start % self.bg_line_length
-        bg_line = bg_line[index:] + bg_line[:index]
-        length = end - start
-        return (bg_line * (length // self.bg_line_length + 1))[:length]
+        end = index + end - start
+        if end > len(tile):
+            tile = self.bg_tiles[row] = self.bg_lines[row] * (
+                max(end, 2 * len(tile)) // self.bg_line_length + 1
+            )
+        return tile[index:end]
 
     def AddInputs(self, inputs):
         """
@@ -705,33 +1005,72 @@ an object on which all canvas drawing methods exist.
         Deletes empty cells on all four sides of the canvas.
 
         """
+        lines = self.lines
         to_delete = 0
-        while re.match("^\000*$", self.lines[to_delete]):
+        while not lines[to_delete].lstrip("\000"):
             to_delete += 1
         to_delete -= 1
         if to_delete > 0:
-            self.lines = self.lines[to_delete:]
+            del lines[:to_delete]
             self.top += to_delete
         to_delete = -1
-        while re.match("^\000*$", self.lines[to_delete]):
+        while not lines[to_delete].lstrip("\000"):
             to_delete -= 1
         to_delete += 1
         if to_delete < 0:
-            self.lines = self.lines[:to_delete]
-        for i in range(len(self.lines)):
-            line = self.lines[i]
-            match = re.match("^\000*", line)
-            match_length = len(match.group(0)) if match else 0
-            self.indices[i] += match_length
-            self.lengths[i] -= match_length
-            match_2 = re.match("\000*$", line)
-            match_2_length = len(match_2.group(0)) if match_2 else 0
-            self.right_indices[i] -= match_2_length
-            self.lengths[i] -= match_2_length
-            line = line[match_length:]
-            if match_2_length > 0:
-                line = line[:-match_2_length]
-            self.lines[i] = line
+            del lines[to_delete:]
+        indices, lengths = self.indices, self.lengths
+        right_indices = self.right_indices
+        for i in range(len(lines)):
+            line = lines[i]
+            if line[:1] != "\000":
+                continue
+            # Only lines with nothing but "\000" lose their right side too,
+            # which ends up with lengths[i] == -len(line)
+            stripped = line.lstrip("\000")
+            match_length = len(line) - len(stripped)
+            match_2_length = 0 if stripped else match_length
+            indices[i] += match_length
+            lengths[i] -= match_length + match_2_length
+            right_indices[i] -= match_2_length
+            lines[i] = stripped
+        self.frame = None
+
+    def Reset(self):
+        """
+        Reset()
+
+        Returns a canvas created with the default options to the state \
+it was created in, but for its scope, so Lambdafy can reuse it \
+instead of creating a new one for every call.
+
+        """
+        self.x = self.y = self.top = 0
+        self.lines = [""]
+        self.indices = [0]
+        self.lengths = [0]
+        self.right_indices = [0]
+        self.dirty = set()
+        self.frame = None
+        self.limits = None
+        self.steps = self.deadline = 0
+        self.info = set()
+        self.original_input = ""
+        self.inputs = []
+        self.original_inputs = []
+        self.scope = self.top_scope
+        self.direction = Direction.right
+        self.background = " "
+        self.bg_lines = [" "]
+        self.bg_tiles = [" "]
+        self.bg_line_number = self.bg_line_length = 1
+        self.timeout_end = self.dump_timeout_end = 0
+        self.trim = False
+        self.print_at_end = True
+        self.canvas_step = 500
+        self.last_printed = None
+        self.charcoal = None
+        self.lent = False
 
     def Clear(self, all=True):
         """
@@ -743,10 +1082,14 @@ an object on which all canvas drawing methods exist.
 
         """
         self.x = self.y = self.top = 0
-        self.lines = [""]
+        self.lines = self.Rows([""])
         self.indices = [0]
         self.lengths = [0]
         self.right_indices = [0]
+        self.dirty = set()
+        self.frame = None
+        if self.limits:
+            self.SetLimits(*self.limits)
         if all:
             self.top_scope = self.scope = Scope(lookup={
                 "γ": " !\"#$%&'()*+,-./0123456789:;<=>?@\
@@ -763,6 +1106,7 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
             self.direction = Direction.right
             self.background = " "
             self.bg_lines = [" "]
+            self.bg_tiles = [" "]
             self.bg_line_number = self.bg_line_length = 1
             self.timeout_end = self.dump_timeout_end = 0
             self.trim = False
@@ -775,6 +1119,16 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
             print("Clear")
             print(str(self))
 
+    def Rows(self, lines):
+        """
+        Rows(lines) -> list
+
+        Returns the strings in lines stored the way this canvas \
+stores its rows, in RowBuffers if it was created with row_buffers.
+
+        """
+        return RowBuffers(lines) if self.row_buffers else lines
+
     def Get(self):
         """
         Get() -> str
@@ -790,6 +1144,8 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
             self.x - self.indices[y_index] < 0
         ):
             return ""
+        if type(self.lines) is RowBuffers:
+            return self.lines.Get(y_index, self.x - self.indices[y_index])
         return self.lines[y_index][self.x - self.indices[y_index]]
 
     def CanFillAt(self, x, y):
@@ -807,6 +1163,10 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
             x - self.indices[y_index] < self.lengths[y_index] and
             x - self.indices[y_index] >= 0
         ):
+            if type(self.lines) is RowBuffers:
+                return self.lines.Get(
+                    y_index, x - self.indices[y_index]
+                ) == "\000"
             result = (
                 self.lines[y_index][x - self.indices[y_index]] == "\000"
             )
@@ -825,8 +1185,33 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
             self.FillLines()
             self.x, self.y = original_x, original_y
         y = self.y if y is None else y
+        self.dirty.add(y)
         y_index = y - self.top
         x_index = self.indices[y_index]
+        if self.limits:
+            lines = self.lines
+            line_length = (
+                lines.Length(y_index) if type(lines) is RowBuffers else
+                len(lines[y_index])
+            )
+            left, right = x, x + len(string)
+            if line_length:
+                left = min(left, x_index)
+                right = max(right, x_index + line_length)
+            # The canvas only gets wider if the row does
+            if not line_length or right - left > line_length:
+                self.CheckWidth(left, right, y_index)
+        if self.row_buffers:
+            lines = self.lines
+            if type(lines) is not RowBuffers:
+                lines = self.lines = RowBuffers(lines)
+            if lines.Length(y_index):
+                if lines.Write(y_index, x - x_index, string):
+                    self.indices[y_index] = x
+                length = lines.Length(y_index)
+                self.lengths[y_index] = length
+                self.right_indices[y_index] = self.indices[y_index] + length
+                return
         line = self.lines[y_index]
         if not line:
             length = len(string)
@@ -859,6 +1244,8 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
         """
         if self.y > self.top + len(self.lines) - 1:
             number = self.y - self.top - len(self.lines) + 1
+            if self.limits:
+                self.CheckLimits(len(self.lines) + number, 0)
             x_number = self.x - self.indices[-1]
             x_sign = Sign(x_number)
             x_number *= x_sign
@@ -876,12 +1263,17 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
                 )
             else:
                 indices = [0] * number
+            if self.limits:
+                self.CheckWidth(min(indices), max(indices))
+            self.dirty.update(range(self.y - number + 1, self.y + 1))
             self.lines += [""] * number
             self.indices += indices
             self.lengths += [0] * number
             self.right_indices += indices
         elif self.y < self.top:
             number = self.top - self.y
+            if self.limits:
+                self.CheckLimits(len(self.lines) + number, 0)
             x_number = self.x - self.indices[0] if len(self.indices) else 0
             x_sign = Sign(x_number)
             x_number *= x_sign
@@ -899,10 +1291,15 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
                 )
             else:
                 indices = [0] * number
-            self.lines = [""] * number + self.lines
-            self.indices = indices + self.indices
-            self.lengths = [0] * number + self.lengths
-            self.right_indices = indices + self.right_indices
+            if self.limits:
+                self.CheckWidth(min(indices), max(indices))
+            if type(self.lines) is RowBuffers:
+                self.lines.Prepend([""] * number)
+            else:
+                self.lines = [""] * number + self.lines
+            self.indices[:0] = indices
+            self.lengths[:0] = [0] * number
+            self.right_indices[:0] = indices
             self.top = self.y
 
     def SetBackground(self, string):
@@ -920,6 +1317,7 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
                 line + " " * (length - len(line))
                 for line in lines
             ]
+            self.bg_tiles = self.bg_lines[:]
             self.bg_line_number = len(lines)
             self.bg_line_length = length
             if length > 1 or len(lines) > 1:
@@ -927,9 +1325,7 @@ ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
             else:
                 self.background = string
         else:
-            print("RuntimeError: Cannot change background to nothing")
-            if Info.is_repl not in self.info:
-                sys.exit(1)
+            self.Error("Cannot change background to nothing")
         if Info.step_canvas in self.info:
             self.RefreshFastText("Set background", self.canvas_step)
         elif Info.dump_canvas in self.info:
@@ -971,6 +1367,8 @@ be added to the list of coordinates.
         old_y = self.y
         string_is_empty = not string
         length = int(length)
+        if self.limits:
+            self.CheckLimits(length)
         if coordinates is True:
             coordinates = Coordinates()
         for direction in directions:
@@ -1295,11 +1693,10 @@ a horizontal, vertical or diagonal line.
             lines = [
                 line + "\000" * (line_length - len(line)) for line in lines
             ]
-            for row in coordinates.coordinates:
+            for row in coordinates.Rows():
                 line = lines[self.y % number_of_lines]
-                while len(row) >= 2:
-                    start, end = row[:2]
-                    row = row[2:]
+                for i in range(0, len(row) - 1, 2):
+                    start, end = row[i], row[i + 1]
                     if start > end:
                         start, end = end, start
                     index = start % line_length
@@ -1310,19 +1707,18 @@ a horizontal, vertical or diagonal line.
                         length,
                         line[index:] + line[:index]
                     )
-                if len(row):
-                    position = row[0]
+                if len(row) % 2:
+                    position = row[-1]
                     index = position % line_length
                     self.x = position
                     self.Put(line[index])
                 self.y += 1
         else:
-            for row in coordinates.coordinates:
+            for row in coordinates.Rows():
                 if len(row) % 2:
                     row = row[:-1] + row[-2:]
-                while len(row) >= 2:
-                    start, end = row[:2]
-                    row = row[2:]
+                for i in range(0, len(row) - 1, 2):
+                    start, end = row[i], row[i + 1]
                     if start > end:
                         start, end = end, start
                     if end - start < 2:
@@ -1330,8 +1726,8 @@ a horizontal, vertical or diagonal line.
                     length = end - start
                     self.x = start + 1
                     self.PrintLine({Direction.right}, length, character)
-                if len(row):
-                    position = row[0]
+                if len(row) % 2:
+                    position = row[-1]
                     self.x = position
                     self.Put(character)
                 self.y += 1
@@ -1483,105 +1879,33 @@ be used for the sides and + for the corners.
         Fills the empty area under the cursor \
 with the specified string, repeating it if needed.
 
+        The area is found as runs of cells, see Spans, \
+and each run is written in one go.
+
         """
-        left, top, bottom = min(self.indices), self.top, len(self.lines)
-        points = set()
-        stack = []
         x0, y0 = self.x, self.y
-        y, x = self.y, self.x
-
-        class Segment(object):
-            __slots__ = (
-                "start_x", "end_x", "y", "direction", "scan_left", "scan_right"
-            )
-        
-            def __init__(
-                self, start_x, end_x, y, direction, scan_left, scan_right
-            ):
-                self.start_x = start_x
-                self.end_x = end_x
-                self.y = y
-                self.direction = direction
-                self.scan_left = scan_left
-                self.scan_right = scan_right
-
-        def add_line(
-            start_x, end_x, y, ignore_start, ignore_end, direction,
-            is_next_in_dir
-        ):
-            nonlocal stack
-            region_start, x = left - 1, start_x
-            while x < end_x:
-                if (
-                    (is_next_in_dir or x < ignore_start or x >= ignore_end) and
-                    self.CanFillAt(x, y) and
-                    not (y, x) in points
-                ):
-                    points.add((y, x))
-                    if region_start < left:
-                        region_start = x
-                elif region_start >= left:
-                    stack += [Segment(
-                        region_start, x, y, direction, region_start == start_x,
-                        False
-                    )]
-                    region_start = left - 1
-                if not is_next_in_dir and x < ignore_end and x >= ignore_start:
-                    x = ignore_end - 1
-                x += 1
-            if region_start >= left:
-                stack += [Segment(
-                    region_start, x, y, direction, region_start == start_x,
-                    True
-                )]
-
-        if not self.CanFillAt(x, y):
+        spans = Spans(self.lines, self.indices, self.top, self.x, self.y)
+        if not spans:
             return
-        points.add((y, x))
-        stack += [Segment(x, x + 1, y, 0, True, True)]
-        while len(stack):
-            r = stack.pop()
-            start_x, end_x = r.start_x, r.end_x
-            if r.scan_left:
-                while (
-                    start_x > left and
-                    self.CanFillAt(start_x - 1, r.y) and
-                    not (r.y, start_x - 1) in points
-                ):
-                    start_x -= 1
-                    points.add((r.y, start_x))
-            if r.scan_right:
-                while (
-                    self.CanFillAt(end_x, r.y) and
-                    not (r.y, end_x) in points
-                ):
-                    points.add((r.y, end_x))
-                    end_x += 1
-            r.start_x -= 1
-            r.end_x += 1
-            if r.y > top:
-                add_line(
-                    start_x, end_x, r.y - 1, r.start_x, r.end_x, -1,
-                    r.direction <= 0
-                )
-            if r.y < bottom:
-                add_line(
-                    start_x, end_x, r.y + 1, r.start_x, r.end_x, 1,
-                    r.direction >= 0
-                )
-        points = sorted(points)
-        n_points = len(points)
+        n_points = sum(end - start for _, start, end in spans)
         if isinstance(string, int) or isinstance(string, float):
             string = str(string)
         if isinstance(string, Expression):
             string = str(string.run(n_points))
         length = len(string)
-        for i in range(len(points)):
-            point = points[i]
-            self.y, self.x = point
-            character = string[i % length]
-            if character != "\000":
-                self.Put(character)
+        i = 0
+        for y, start, end in spans:
+            self.y = y
+            if isinstance(string, str):
+                text = Cycled(string, i, end - start)
+                if text.strip("\000"):
+                    self.Put(text, start)
+            else:
+                for x in range(start, end):
+                    character = string[(i + x - start) % length]
+                    if character != "\000":
+                        self.Put(character, x)
+            i += end - start
         self.x, self.y = x0, y0
         if Info.step_canvas in self.info:
             self.RefreshFastText("Fill", self.canvas_step)
@@ -1676,15 +2000,20 @@ characters to the axis are next to the axis.
                 for direction_ in direction:
                     self.ReflectCopy(direction_, transform)
             return
+        if self.limits:
+            # The copy doubles the width or the height
+            if direction in (Direction.left, Direction.right):
+                self.CheckLimits(
+                    (max(self.right_indices) - min(self.indices)) * 2, 0
+                )
+            elif direction in (Direction.up, Direction.down):
+                self.CheckLimits(len(self.lines) * 2, 0)
         finished = True
         if direction == Direction.left:
             left = min(self.indices)
             self.x -= (self.x - left) * 2 + 1
-            self.lines = [
-                "".join(
-                    HorizontalFlip.get(character, character)
-                    for character in line[::-1]
-                ) +
+            self.lines = self.Rows([
+                HorizontalFlip.Translate(line[::-1]) +
                 "\000\000" * (index - left) +
                 line
                 for line, index in zip(self.lines, self.indices)
@@ -1693,7 +2022,7 @@ characters to the axis are next to the axis.
                 "\000\000" * (index - left) +
                 line
                 for line, index in zip(self.lines, self.indices)
-            ]
+            ])
             self.lengths = [
                 (length + index - left) * 2
                 for length, index in zip(self.lengths, self.indices)
@@ -1705,20 +2034,17 @@ characters to the axis are next to the axis.
         elif direction == Direction.right:
             right = max(self.right_indices)
             self.x += (right - self.x) * 2 - 1
-            self.lines = [
+            self.lines = self.Rows([
                 line +
                 "\000\000" * (right - right_index) +
-                "".join(
-                    HorizontalFlip.get(character, character)
-                    for character in line[::-1]
-                )
+                HorizontalFlip.Translate(line[::-1])
                 for line, right_index in zip(self.lines, self.right_indices)
             ] if transform else [
                 line +
                 "\000\000" * (right - right_index) +
                 line[::-1]
                 for line, right_index in zip(self.lines, self.right_indices)
-            ]
+            ])
             self.lengths = [
                 (length + right - right_index) * 2
                 for length, right_index in zip(
@@ -1735,10 +2061,7 @@ characters to the axis are next to the axis.
             self.top -= len(self.lines)
             self.lines = (
                 [
-                    "".join(
-                        VerticalFlip.get(character, character)
-                        for character in line
-                    ) for line in self.lines[::-1]
+                    VerticalFlip.Translate(line) for line in self.lines[::-1]
                 ]
                 if transform else
                 self.lines[::-1]
@@ -1748,12 +2071,10 @@ characters to the axis are next to the axis.
             self.right_indices = self.right_indices[::-1] + self.right_indices
         elif direction == Direction.down:
             self.y += (self.top + len(self.lines) - self.y) * 2 - 1
+            self.frame = None
             self.lines += (
                 [
-                    "".join(
-                        VerticalFlip.get(character, character)
-                        for character in line
-                    ) for line in self.lines[::-1]
+                    VerticalFlip.Translate(line) for line in self.lines[::-1]
                 ]
                 if transform else
                 self.lines[::-1]
@@ -1778,28 +2099,14 @@ characters to the axis are next to the axis.
                 )
             )
             x = -negative_x
-            self.x = x
-            if transform:
-                for line, length, index in zip(
-                    self.lines[:], self.lengths[:], self.indices[:]
-                ):
-                    self.x -= 1
-                    self.y = top_left - index
-                    self.PrintLine(
-                        {Direction.up},
-                        length,
-                        "".join(
-                            NESWFlip.get(character, character)
-                            for character in line
-                        )
-                    )
-            else:
-                for line, length, index in zip(
-                    self.lines[:], self.lengths[:], self.indices[:]
-                ):
-                    self.x -= 1
-                    self.y = top_left - index
-                    self.PrintLine({Direction.up}, length, line)
+            self.DrawStrokes(Direction.up, [
+                (x - number, top_left - index, length, line)
+                for number, (line, length, index) in enumerate(zip(
+                    [NESWFlip.Translate(line) for line in self.lines]
+                    if transform else self.lines,
+                    self.lengths, self.indices
+                ), 1)
+            ])
             self.x = top_left - initial_y
             self.y = top_left - initial_x
         elif direction == Direction.up_right:
@@ -1811,28 +2118,15 @@ characters to the axis are next to the axis.
                     range(len(self.right_indices))
                 )
             )
-            self.x = x = -negative_x
-            if transform:
-                for line, length, right_index in zip(
-                    self.lines[:], self.lengths[:], self.right_indices[:]
-                ):
-                    self.x += 1
-                    self.y = right_index + top_right
-                    self.PrintLine(
-                        {Direction.up},
-                        length,
-                        "".join(
-                            NWSEFlip.get(character, character)
-                            for character in line[::-1]
-                        )
-                    )
-            else:
-                for line, length, right_index in zip(
-                    self.lines[:], self.lengths[:], self.right_indices[:]
-                ):
-                    self.x += 1
-                    self.y = right_index + top_right
-                    self.PrintLine({Direction.up}, length, line[::-1])
+            x = -negative_x
+            self.DrawStrokes(Direction.up, [
+                (x + number, right_index + top_right, length, line)
+                for number, (line, length, right_index) in enumerate(zip(
+                    [NWSEFlip.Translate(line[::-1]) for line in self.lines]
+                    if transform else [line[::-1] for line in self.lines],
+                    self.lengths, self.right_indices
+                ), 1)
+            ])
             self.x = initial_y - top_right - 1
             self.y = top_right + initial_x + 1
         elif direction == Direction.down_left:
@@ -1844,28 +2138,14 @@ characters to the axis are next to the axis.
                     range(len(self.indices))[::-1]
                 )
             )
-            self.x = x
-            if transform:
-                for line, length, index in zip(
-                    self.lines[::-1], self.lengths[::-1], self.indices[::-1]
-                ):
-                    self.x -= 1
-                    self.y = index + bottom_left
-                    self.PrintLine(
-                        {Direction.down},
-                        length,
-                        "".join(
-                            NWSEFlip.get(character, character)
-                            for character in line
-                        )
-                    )
-            else:
-                for line, length, index in zip(
-                    self.lines[::-1], self.lengths[::-1], self.indices[::-1]
-                ):
-                    self.x -= 1
-                    self.y = index + bottom_left
-                    self.PrintLine({Direction.down}, length, line)
+            self.DrawStrokes(Direction.down, [
+                (x - number, index + bottom_left, length, line)
+                for number, (line, length, index) in enumerate(zip(
+                    [NWSEFlip.Translate(line) for line in self.lines[::-1]]
+                    if transform else self.lines[::-1],
+                    self.lengths[::-1], self.indices[::-1]
+                ), 1)
+            ])
             self.x = initial_y - bottom_left
             self.y = bottom_left + initial_x
         elif direction == Direction.down_right:
@@ -1877,30 +2157,19 @@ characters to the axis are next to the axis.
                     range(len(self.right_indices))[::-1]
                 )
             )
-            self.x = x = -negative_x
-            if transform:
-                for line, length, right_index in zip(
-                    self.lines[::-1], self.lengths[::-1],
-                    self.right_indices[::-1]
-                ):
-                    self.x += 1
-                    self.y = bottom_right - right_index
-                    self.PrintLine(
-                        {Direction.down},
-                        length,
-                        "".join(
-                            NESWFlip.get(character, character)
-                            for character in line[::-1]
-                        )
-                    )
-            else:
-                for line, length, right_index in zip(
-                    self.lines[::-1], self.lengths[::-1],
-                    self.right_indices[::-1]
-                ):
-                    self.x += 1
-                    self.y = bottom_right - right_index
-                    self.PrintLine({Direction.down}, length, line[::-1])
+            x = -negative_x
+            self.DrawStrokes(Direction.down, [
+                (x + number, bottom_right - right_index, length, line)
+                for number, (line, length, right_index) in enumerate(zip(
+                    [
+                        NESWFlip.Translate(line[::-1])
+                        for line in self.lines[::-1]
+                    ] if transform else [
+                        line[::-1] for line in self.lines[::-1]
+                    ],
+                    self.lengths[::-1], self.right_indices[::-1]
+                ), 1)
+            ])
             self.x = bottom_right - initial_y - 1
             self.y = bottom_right - initial_x - 1
         if Info.step_canvas in self.info:
@@ -1944,72 +2213,55 @@ but not if it overwrites the original.
             return
         finished, initial_x, initial_y = True, self.x, self.y
         if direction == Direction.left:
-            self.y = self.top
             left = min(self.indices)
-            for line, length, index in zip(
-                self.lines[:], self.lengths[:], self.indices[:]
-            ):
-                self.x = left * 2 - index + overlap - 1
-                string = (
-                    "".join(HorizontalFlip.get(c, c) for c in line)
-                    if transform else line
+            self.DrawStrokes(Direction.left, [
+                (left * 2 - index + overlap - 1, y, len(line), line)
+                for y, line, index in zip(
+                    range(self.top, self.top + len(self.lines)),
+                    [HorizontalFlip.Translate(line) for line in self.lines]
+                    if transform else self.lines,
+                    self.indices
                 )
-                self.PrintLine(
-                    {Direction.left}, len(string), string, overwrite=False
-                )
-                self.y += 1
+            ], False)
             self.x = initial_x - (initial_x - left) * 2 + overlap - 1
             self.y = initial_y
         elif direction == Direction.right:
-            self.y = self.top
             right = max(self.right_indices)
-            for line, length, index in zip(
-                self.lines[:], self.lengths[:], self.indices[:]
-            ):
-                self.x = right * 2 - index - overlap - 1
-                string = (
-                    "".join(HorizontalFlip.get(c, c) for c in line)
-                    if transform else line
-                )
-                self.PrintLine(
-                    {Direction.left}, len(string), string, overwrite=False
+            self.DrawStrokes(Direction.left, [
+                (right * 2 - index - overlap - 1, y, len(line), line)
+                for y, line, index in zip(
+                    range(self.top, self.top + len(self.lines)),
+                    [HorizontalFlip.Translate(line) for line in self.lines]
+                    if transform else self.lines,
+                    self.indices
                 )
-                self.y += 1
+            ], False)
             self.x = initial_x + (right - initial_x - 1) * 2 + 1 - overlap
             self.y = initial_y
         elif direction == Direction.up:
-            self.y = self.top + overlap - 1
-            final_y = self.y - (initial_y - self.top)
-            for line, length, index in zip(
-                self.lines[:], self.lengths[:], self.indices[:]
-            ):
-                self.x = index
-                string = (
-                    "".join(VerticalFlip.get(c, c) for c in line)
-                    if transform else line
-                )
-                self.PrintLine(
-                    {Direction.right}, len(string), string, overwrite=False
-                )
-                self.y -= 1
+            first = self.top + overlap - 1
+            final_y = first - (initial_y - self.top)
+            self.DrawStrokes(Direction.right, [
+                (index, first - number, len(line), line)
+                for number, (line, index) in enumerate(zip(
+                    [VerticalFlip.Translate(line) for line in self.lines]
+                    if transform else self.lines,
+                    self.indices
+                ))
+            ], False)
             self.x = initial_x
             self.y = final_y
         elif direction == Direction.down:
-            line_count = len(self.lines)
-            self.y = self.top + line_count * 2 - overlap - 1
-            final_y = self.y - (initial_y - self.top)
-            for line, length, index in zip(
-                self.lines[:], self.lengths[:], self.indices[:]
-            ):
-                self.x = index
-                string = (
-                    "".join(VerticalFlip.get(c, c) for c in line)
-                    if transform else line
-                )
-                self.PrintLine(
-                    {Direction.right}, len(string), string, overwrite=False
-                )
-                self.y -= 1
+            first = self.top + len(self.lines) * 2 - overlap - 1
+            final_y = first - (initial_y - self.top)
+            self.DrawStrokes(Direction.right, [
+                (index, first - number, len(line), line)
+                for number, (line, index) in enumerate(zip(
+                    [VerticalFlip.Translate(line) for line in self.lines]
+                    if transform else self.lines,
+                    self.indices
+                ))
+            ], False)
             self.x = initial_x
             self.y = final_y
         else:
@@ -2039,28 +2291,15 @@ but not if it overwrites the original.
                     range(len(self.indices))
                 )
             )
-            x = -negative_x
-            self.x = x + overlap
-
-            for line, length, index in zip(
-                self.lines[:], self.lengths[:], self.indices[:]
-            ):
-                self.x -= 1
-                self.y = top_left - index + overlap - 1
-                string = (
-                    "".join(
-                        NWSEFlip.get(character, character)
-                        for character in line
-                    )
-                    if transform else
-                    line
-                )
-                self.PrintLine(
-                    {Direction.up},
-                    len(string),
-                    string,
-                    overwrite=False
-                )
+            x = -negative_x + overlap
+            self.DrawStrokes(Direction.up, [
+                (x - number, top_left - index + overlap - 1, len(line), line)
+                for number, (line, index) in enumerate(zip(
+                    [NWSEFlip.Translate(line) for line in self.lines]
+                    if transform else self.lines,
+                    self.indices
+                ), 1)
+            ], False)
             self.x = top_left - initial_y + overlap - 1
             self.y = top_left - initial_x + overlap - 1
         elif direction == Direction.up_right:
@@ -2072,27 +2311,18 @@ but not if it overwrites the original.
                     range(len(self.right_indices))
                 )
             )
-            x = -negative_x
-            self.x = x - overlap
-            for line, length, right_index in zip(
-                self.lines[:], self.lengths[:], self.right_indices[:]
-            ):
-                self.x += 1
-                self.y = top_right + right_index + overlap - 1
-                string = (
-                    "".join(
-                        NESWFlip.get(character, character)
-                        for character in line
-                    )
-                    if transform else
-                    line
-                )[::-1]
-                self.PrintLine(
-                    {Direction.up},
-                    len(string),
-                    string,
-                    overwrite=False
+            x = -negative_x - overlap
+            self.DrawStrokes(Direction.up, [
+                (
+                    x + number, top_right + right_index + overlap - 1,
+                    len(line), line
                 )
+                for number, (line, right_index) in enumerate(zip(
+                    [NESWFlip.Translate(line)[::-1] for line in self.lines]
+                    if transform else [line[::-1] for line in self.lines],
+                    self.right_indices
+                ), 1)
+            ], False)
             self.x = initial_y - top_right - overlap
             self.y = top_right + initial_x + overlap
         elif direction == Direction.down_left:
@@ -2104,20 +2334,18 @@ but not if it overwrites the original.
                     range(len(self.indices))[::-1]
                 )
             )
-            self.x = x + overlap
-            for line, length, index in zip(
-                self.lines[::-1], self.lengths[::-1], self.indices[::-1]
-            ):
-                self.x -= 1
-                self.y = bottom_left + index - overlap + 1
-                string = (
-                    "".join(NESWFlip.get(c, c) for c in line)
-                    if transform else
-                    line
-                )
-                self.PrintLine(
-                    {Direction.down}, len(string), string, overwrite=False
+            x += overlap
+            self.DrawStrokes(Direction.down, [
+                (
+                    x - number, bottom_left + index - overlap + 1,
+                    len(line), line
                 )
+                for number, (line, index) in enumerate(zip(
+                    [NESWFlip.Translate(line) for line in self.lines[::-1]]
+                    if transform else self.lines[::-1],
+                    self.indices[::-1]
+                ), 1)
+            ], False)
             self.x = initial_y - bottom_left - 1 + overlap
             self.y = bottom_left + initial_x + 1 - overlap
         elif direction == Direction.down_right:
@@ -2129,20 +2357,22 @@ but not if it overwrites the original.
                     range(len(self.right_indices))[::-1]
                 )
             )
-            x = -negative_x
-            self.x = x - overlap
-            for line, length, right_index in zip(
-                self.lines[::-1], self.lengths[::-1], self.right_indices[::-1]
-            ):
-                self.x += 1
-                self.y = bottom_right - right_index - overlap + 1
-                string = (
-                    "".join(NWSEFlip.get(c, c) for c in line)
-                    if transform else line
-                )[::-1]
-                self.PrintLine(
-                    {Direction.down}, len(string), string, overwrite=False
+            x = -negative_x - overlap
+            self.DrawStrokes(Direction.down, [
+                (
+                    x + number, bottom_right - right_index - overlap + 1,
+                    len(line), line
                 )
+                for number, (line, right_index) in enumerate(zip(
+                    [
+                        NWSEFlip.Translate(line)[::-1]
+                        for line in self.lines[::-1]
+                    ] if transform else [
+                        line[::-1] for line in self.lines[::-1]
+                    ],
+                    self.right_indices[::-1]
+                ), 1)
+            ], False)
             self.x = bottom_right - initial_y - overlap
             self.y = bottom_right - initial_x - overlap
         if Info.step_canvas in self.info:
@@ -2179,20 +2409,20 @@ but not if it overwrites the original.
                 1 - index
                 for index in self.indices
             ]
-            self.lines = [
-                "".join(HorizontalFlip.get(c, c) for c in line[::-1])
+            self.lines = self.Rows([
+                HorizontalFlip.Translate(line[::-1])
                 for line in self.lines
             ] if transform else [
                 line[::-1] for line in self.lines
-            ]
+            ])
             self.x = -self.x
         elif direction == Direction.up or direction == Direction.down:
             if transform:
-                self.lines = [
-                    "".join(VerticalFlip.get(c, c) for c in line)
-                    for line in self.lines
-                ]
+                self.lines = self.Rows([
+                    VerticalFlip.Translate(line) for line in self.lines
+                ])
             self.lines.reverse()
+            self.frame = None
             self.indices.reverse()
             self.lengths.reverse()
             self.right_indices.reverse()
@@ -2203,10 +2433,9 @@ but not if it overwrites the original.
             direction == Direction.down_right
         ):
             if transform:
-                self.lines = [
-                    "".join(NESWFlip.get(c, c) for c in line)
-                    for line in self.lines
-                ]
+                self.lines = self.Rows([
+                    NESWFlip.Translate(line) for line in self.lines
+                ])
             self.Rotate(2)
             self.Reflect(Direction.right, False)
         elif (
@@ -2214,11 +2443,9 @@ but not if it overwrites the original.
             direction == Direction.down_left
         ):
             if transform:
-                for i in range(len(self.lines)):
-                    self.lines[i] = "".join(
-                        NWSEFlip.get(character, character)
-                        for character in self.lines[i]
-                    )
+                self.lines = self.Rows([
+                    NWSEFlip.Translate(line) for line in self.lines
+                ])
             self.Rotate(6)
             self.Reflect(Direction.right, False)
         if Info.step_canvas in self.info:
@@ -2299,17 +2526,12 @@ make a copy for each of the digits in rotations.
         If transform is true, rotate characters if possible.
 
         """
-        _lines, lengths, indices = (
-            self.lines[::-1], self.lengths[::-1], self.indices[::-1]
-        )
         if isinstance(rotations, list):
             for rotation in rotations:
                 self.RotateCopy(rotation, anchor, transform, number)
             return
         if rotations % 2:
-            print("RuntimeError: Cannot rotate an odd number of times")
-            if Info.is_repl not in self.info:
-                sys.exit(1)
+            self.Error("Cannot rotate an odd number of times")
         rotations = int(rotations)
         if number and rotations > 10:
             new_rotations = set()
@@ -2317,120 +2539,16 @@ make a copy for each of the digits in rotations.
                 new_rotations |= {rotations % 10}
                 rotations //= 10
                 if rotations % 2:
-                    print("RuntimeError: Cannot rotate an odd number of times")
-                    if Info.is_repl not in self.info:
-                        sys.exit(1)
+                    self.Error("Cannot rotate an odd number of times")
             rotations = new_rotations
         else:
             rotations = {rotations}
-        initial_x, initial_y = self.x, self.y
-        line_count = len(self.lines)
-        if XMovement[anchor] == 1:
-            right = max(self.right_indices)
-        elif XMovement[anchor] == -1:
-            left = min(self.indices)
-        else:
-            return
-        if YMovement[anchor] == 1:
-            bottom = self.top + len(self.lines)
-        elif YMovement[anchor] == -1:
-            top = self.top
-        else:
+        if not XMovement[anchor] or not YMovement[anchor]:
             return
-        if 2 in rotations:
-            lines = [
-                "".join(
-                    RotateLeft.get(character, character) for character in line
-                )
-                for line in _lines
-            ] if transform else _lines
-            if anchor == Direction.down_right:
-                self.x = right
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x -= 1
-                    self.y = bottom + right - index - 1
-                    self.PrintLine({Direction.up}, length, line)
-            elif anchor == Direction.down_left:
-                self.x = left
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x -= 1
-                    self.y = bottom + left - index - 1
-                    self.PrintLine({Direction.up}, length, line)
-            elif anchor == Direction.up_left:
-                self.x = left + line_count
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x -= 1
-                    self.y = top + left - index - 1
-                    self.PrintLine({Direction.up}, length, line)
-            elif anchor == Direction.up_right:
-                self.x = right + line_count
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x -= 1
-                    self.y = top + right - index - 1
-                    self.PrintLine({Direction.up}, length, line)
-        if 4 in rotations:
-            lines = [
-                "".join(
-                    RotateDown.get(character, character) for character in line
-                )
-                for line in _lines
-            ] if transform else _lines
-            if anchor == Direction.down_right:
-                self.y = bottom - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x = right * 2 - index - 1
-                    self.y += 1
-                    self.PrintLine({Direction.left}, length, line)
-            elif anchor == Direction.down_left:
-                self.y = bottom - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x = left - index - 1
-                    self.y += 1
-                    self.PrintLine({Direction.left}, length, line)
-            elif anchor == Direction.up_left:
-                self.y = top - line_count - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x = left - index - 1
-                    self.y += 1
-                    self.PrintLine({Direction.left}, length, line)
-            elif anchor == Direction.up_right:
-                self.y = top - line_count - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x = right * 2 - index - 1
-                    self.y += 1
-                    self.PrintLine({Direction.left}, length, line)
-        if 6 in rotations:
-            lines = [
-                "".join(
-                    RotateRight.get(character, character)
-                    for character in line
-                )
-                for line in _lines
-            ] if transform else _lines
-            if anchor == Direction.down_right:
-                self.x = right - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x += 1
-                    self.y = bottom - right + index
-                    self.PrintLine({Direction.down}, length, line)
-            elif anchor == Direction.down_left:
-                self.x = left - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x += 1
-                    self.y = bottom - left + index
-                    self.PrintLine({Direction.down}, length, line)
-            elif anchor == Direction.up_left:
-                self.x = left - line_count - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x += 1
-                    self.y = top - left + index
-                    self.PrintLine({Direction.down}, length, line)
-            elif anchor == Direction.up_right:
-                self.x = right - line_count - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x += 1
-                    self.y = top - right + index
-                    self.PrintLine({Direction.down}, length, line)
+        for direction, strokes in self.RotationStrokes(
+            rotations, anchor, transform
+        ):
+            self.DrawStrokes(direction, strokes)
         if Info.step_canvas in self.info:
             self.RefreshFastText((
                 "Rotate prism"
@@ -2441,6 +2559,83 @@ make a copy for each of the digits in rotations.
             print("Rotate prism" if transform else "Rotate copyu")
             print(str(self))
 
+    def RotationStrokes(self, rotations, anchor, transform, overlap=0):
+        """
+        RotationStrokes(rotations, anchor, transform, overlap=0) -> list
+
+        Returns the direction and strokes, see DrawStrokes, \
+of a copy of the canvas for each of rotations, a set of 2, 4 and 6, \
+rotated 45 degrees that many times about the corner anchor, \
+overlapping the original by the specified number of characters.
+
+        If transform is true, rotate characters if possible.
+
+        """
+        lines, lengths, indices = (
+            self.lines[::-1], self.lengths[::-1], self.indices[::-1]
+        )
+        line_count = len(self.lines)
+        left, right = min(self.indices), max(self.right_indices)
+        top, bottom = self.top, self.top + line_count
+        if anchor == Direction.down_right:
+            starts = {
+                2: (right, bottom + right - 1 - overlap),
+                4: (bottom - 1 - overlap, right * 2 - 1 - overlap),
+                6: (right - 1 - overlap, bottom - right)
+            }
+        elif anchor == Direction.down_left:
+            starts = {
+                2: (left + overlap, bottom + left - 1),
+                4: (bottom - 1 - overlap, left - 1 + overlap),
+                6: (left - 1, bottom - left - overlap)
+            }
+        elif anchor == Direction.up_left:
+            starts = {
+                2: (left + line_count, top + left - 1 + overlap),
+                4: (top - line_count - 1 + overlap, left - 1 + overlap),
+                6: (left - line_count - 1 + overlap, top - left)
+            }
+        elif anchor == Direction.up_right:
+            starts = {
+                2: (right + line_count - overlap, top + right - 1),
+                4: (top - line_count - 1 + overlap, right * 2 - 1 - overlap),
+                6: (right - line_count - 1, top - right + overlap)
+            }
+        else:
+            return []
+        copies = []
+        for rotation, direction, transformer in (
+            (2, Direction.up, RotateLeft),
+            (4, Direction.left, RotateDown),
+            (6, Direction.down, RotateRight)
+        ):
+            if rotation not in rotations:
+                continue
+            first, offset = starts[rotation]
+            rows = list(zip(
+                range(1, line_count + 1),
+                [transformer.Translate(line) for line in lines]
+                if transform else lines,
+                lengths, indices
+            ))
+            if rotation == 2:
+                strokes = [
+                    (first - number, offset - index, length, line)
+                    for number, line, length, index in rows
+                ]
+            elif rotation == 4:
+                strokes = [
+                    (offset - index, first + number, length, line)
+                    for number, line, length, index in rows
+                ]
+            else:
+                strokes = [
+                    (first + number, offset + index, length, line)
+                    for number, line, length, index in rows
+                ]
+            copies += [(direction, strokes)]
+        return copies
+
     def RotateOverlap(
         self,
         rotations=2,
@@ -2468,188 +2663,29 @@ make a copy for each of the digits in rotations.
         if not overlap:
             self.RotateCopy(rotations, anchor, transform, number)
             return
-        _lines, lengths, indices = (
-            self.lines[::-1],
-            self.lengths[::-1],
-            self.indices[::-1]
-        )
         if isinstance(rotations, list):
             for rotation in rotations:
                 self.RotateOverlap(
                     rotation, anchor, transform, number, overlap
                 )
-            return
-        if rotations % 2:
-            print("RuntimeError: Cannot rotate an odd number of times")
-            if Info.is_repl not in self.info:
-                sys.exit(1)
-        rotations = int(rotations)
-        if number and rotations > 10:
-            new_rotations = set()
-            while rotations:
-                new_rotations |= {rotations % 10}
-                rotations //= 10
-                if rotations % 2:
-                    print("RuntimeError: Cannot rotate an odd number of times")
-                    if Info.is_repl not in self.info:
-                        sys.exit(1)
-            rotations = new_rotations
-        else:
-            rotations = {rotations}
-        initial_x, initial_y = self.x, self.y
-        line_count = len(self.lines)
-        if XMovement[anchor] == 1:
-            right = max(self.right_indices)
-        elif XMovement[anchor] == -1:
-            left = min(self.indices)
-        if YMovement[anchor] == 1:
-            bottom = self.top + len(self.lines)
-        elif YMovement[anchor] == -1:
-            top = self.top
-        if 2 in rotations:
-            lines = [
-                "".join(
-                    RotateLeft.get(character, character)
-                    for character in line
-                )
-                for line in _lines
-            ] if transform else _lines
-            if anchor == Direction.down_right:
-                self.x = right
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x -= 1
-                    self.y = bottom + right - index - 1 - overlap
-                    self.PrintLine(
-                        {Direction.up}, length, line, overwrite=False
-                    )
-            if anchor == Direction.down_left:
-                self.x = left + overlap
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x -= 1
-                    self.y = bottom + left - index - 1
-                    self.PrintLine(
-                        {Direction.up}, length, line, overwrite=False
-                    )
-            if anchor == Direction.up_left:
-                self.x = left + line_count
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x -= 1
-                    self.y = top + left - index - 1 + overlap
-                    self.PrintLine(
-                        {Direction.up}, length, line, overwrite=False
-                    )
-            if anchor == Direction.up_right:
-                self.x = right + line_count - overlap
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x -= 1
-                    self.y = top + right - index - 1
-                    self.PrintLine(
-                        {Direction.up}, length, line, overwrite=False
-                    )
-        if 4 in rotations:
-            lines = [
-                "".join(
-                    RotateDown.get(character, character)
-                    for character in line
-                )
-                for line in _lines
-            ] if transform else _lines
-            if anchor == Direction.down_right:
-                self.y = bottom - 1 - overlap
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x = right * 2 - index - 1 - overlap
-                    self.y += 1
-                    self.PrintLine(
-                        {Direction.left},
-                        length,
-                        line,
-                        overwrite=False
-                    )
-            if anchor == Direction.down_left:
-                self.y = bottom - 1 - overlap
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x = left - index - 1 + overlap
-                    self.y += 1
-                    self.PrintLine(
-                        {Direction.left},
-                        length,
-                        line,
-                        overwrite=False
-                    )
-            if anchor == Direction.up_left:
-                self.y = top - line_count - 1 + overlap
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x = left - index - 1 + overlap
-                    self.y += 1
-                    self.PrintLine(
-                        {Direction.left},
-                        length,
-                        line,
-                        overwrite=False
-                    )
-            if anchor == Direction.up_right:
-                self.y = top - line_count - 1 + overlap
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x = right * 2 - index - 1 - overlap
-                    self.y += 1
-                    self.PrintLine(
-                        {Direction.left},
-                        length,
-                        line,
-                        overwrite=False
-                    )
-        if 6 in rotations:
-            lines = [
-                "".join(
-                    RotateRight.get(character, character)
-                    for character in line
-                )
-                for line in _lines
-            ] if transform else _lines
-            if anchor == Direction.down_right:
-                self.x = right - 1 - overlap
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x += 1
-                    self.y = bottom - right + index
-                    self.PrintLine(
-                        {Direction.down},
-                        length,
-                        line,
-                        overwrite=False
-                    )
-            if anchor == Direction.down_left:
-                self.x = left - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x += 1
-                    self.y = bottom - left + index - overlap
-                    self.PrintLine(
-                        {Direction.down},
-                        length,
-                        line,
-                        overwrite=False
-                    )
-            if anchor == Direction.up_left:
-                self.x = left - line_count - 1 + overlap
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x += 1
-                    self.y = top - left + index
-                    self.PrintLine(
-                        {Direction.down},
-                        length,
-                        line,
-                        overwrite=False
-                    )
-            if anchor == Direction.up_right:
-                self.x = right - line_count - 1
-                for line, length, index in zip(lines, lengths, indices):
-                    self.x += 1
-                    self.y = top - right + index + overlap
-                    self.PrintLine(
-                        {Direction.down},
-                        length,
-                        line,
-                        overwrite=False
-                    )
+            return
+        if rotations % 2:
+            self.Error("Cannot rotate an odd number of times")
+        rotations = int(rotations)
+        if number and rotations > 10:
+            new_rotations = set()
+            while rotations:
+                new_rotations |= {rotations % 10}
+                rotations //= 10
+                if rotations % 2:
+                    self.Error("Cannot rotate an odd number of times")
+            rotations = new_rotations
+        else:
+            rotations = {rotations}
+        for direction, strokes in self.RotationStrokes(
+            rotations, anchor, transform, overlap
+        ):
+            self.DrawStrokes(direction, strokes, False)
         if Info.step_canvas in self.info:
             self.RefreshFastText((
                 "Rotate shutter"
@@ -2679,7 +2715,7 @@ make a copy for each of the digits in rotations.
         old_indices = self.indices
         old_lengths = self.lengths
         self.top = 0
-        self.lines = [""]
+        self.lines = self.Rows([""])
         self.indices = [0]
         self.lengths = [0]
         self.right_indices = [0]
@@ -2692,18 +2728,20 @@ make a copy for each of the digits in rotations.
             6: Direction.down,
             7: Direction.down_right,
         }[rotations]}
-        rotator = {
-            1: lambda x, y: (y + x, y - x),
-            2: lambda x, y: (y, -x),
-            3: lambda x, y: (y - x, -y - x),
-            4: lambda x, y: (-x, -y),
-            5: lambda x, y: (-x - y, x - y),
-            6: lambda x, y: (-y, x),
-            7: lambda x, y: (x - y, x + y),
-        }[rotations]
-        for i in range(len(old_lines)):
-            self.x, self.y = rotator(old_indices[i], old_top + i)
-            self.PrintLine(directions, old_lengths[i], old_lines[i])
+        rotator = rotators[rotations]
+        rotated = not self.limits and bulktransforms.Rotate(
+            old_lines, old_indices, old_lengths, old_top, rotations
+        )
+        if rotated:
+            (
+                lines, self.indices, self.lengths, self.right_indices,
+                self.top
+            ) = rotated
+            self.lines = self.Rows(lines)
+        else:
+            for i in range(len(old_lines)):
+                self.x, self.y = rotator(old_indices[i], old_top + i)
+                self.PrintLine(directions, old_lengths[i], old_lines[i])
         self.x, self.y = rotator(old_x, old_y)
         if transform:
             transformer = ({
@@ -2715,12 +2753,9 @@ make a copy for each of the digits in rotations.
                 6: RotateRight,
                 7: RotateHalfRight
             })[rotations]
-            self.lines = [
-                "".join(
-                    transformer.get(character, character)
-                    for character in line
-                ) for line in self.lines
-            ]
+            self.lines = self.Rows([
+                transformer.Translate(line) for line in self.lines
+            ])
         if Info.step_canvas in self.info:
             self.RefreshFastText((
                 "Rotate transform"
@@ -2731,6 +2766,38 @@ make a copy for each of the digits in rotations.
             print("Rotate transform" if transform else "Rotate")
             print(str(self))
 
+    def DrawStrokes(self, direction, strokes, overwrite=True):
+        """
+        DrawStrokes(direction, strokes, overwrite=True)
+
+        Draws each stroke (x, y, length, string) in strokes \
+with PrintLine from (x, y) in the given direction, \
+leaving the cursor after the last one.
+
+        If overwrite is false, existing characters will not be overwritten.
+
+        Unless the canvas has limits, the strokes are drawn \
+in one go where possible, see bulktransforms.Overlay.
+
+        """
+        drawn = not self.limits and strokes and bulktransforms.Overlay(
+            self.lines, self.indices, self.lengths, self.right_indices,
+            self.top, (XMovement[direction], YMovement[direction]),
+            strokes, overwrite
+        )
+        if not drawn:
+            for x, y, length, string in strokes:
+                self.x, self.y = x, y
+                self.PrintLine(
+                    {direction}, length, string, overwrite=overwrite
+                )
+            return
+        lines, self.indices, self.lengths, self.right_indices, self.top = drawn
+        self.lines = self.Rows(lines)
+        x, y, length, _ = strokes[-1]
+        self.x = x + XMovement[direction] * length
+        self.y = y + YMovement[direction] * length
+
     def Copy(self, delta_x, delta_y):
         """
         Copy(delta_x, delta_y)
@@ -2758,6 +2825,33 @@ make a copy for each of the digits in rotations.
         """
         return next(self.scope);
 
+    def LoopItems(self, variable):
+        """
+        LoopItems(variable) -> iterable
+
+        Returns what For loops over given the value of its expression, \
+range(variable) if variable is a number.
+
+        """
+        if isinstance(variable, float):
+            variable = int(variable)
+        if isinstance(variable, int):
+            variable = large_range(variable)
+        return variable
+
+    def EnterLoop(self):
+        """
+        EnterLoop() -> (Scope, str)
+
+        Opens a new scope for a loop, returning it along with \
+the free variable the loop stores its value in, \
+which is always in the lookup of the new scope. \
+The loop closes it by setting scope to its parent.
+
+        """
+        self.scope = Scope(self.scope)
+        return self.scope, self.GetFreeVariable()
+
     def For(self, expression, body):
         """
         For(expression, body)
@@ -2773,14 +2867,13 @@ if expression is a number.
             else:
                 pass  # TODO
         variable = expression(self)
-        if isinstance(variable, float):
-            variable = int(variable)
-        if isinstance(variable, int):
-            variable = large_range(variable)
-        self.scope = Scope(self.scope)
-        loop_variable = self.GetFreeVariable()
+        variable = self.LoopItems(variable)
+        scope, loop_variable = self.EnterLoop()
+        frame = scope.lookup
         for item in variable:
-            self.scope[loop_variable] = item
+            if self.limits:
+                self.CheckLimits()
+            frame[loop_variable] = item
             body(self)
         self.scope = self.scope.parent
 
@@ -2791,12 +2884,14 @@ if expression is a number.
         Executes body while condition evaluates to truthy.
 
         """
-        self.scope = Scope(self.scope)
-        loop_variable = self.GetFreeVariable()
-        self.scope[loop_variable] = condition(self)
-        while self.scope[loop_variable]:
+        scope, loop_variable = self.EnterLoop()
+        frame = scope.lookup
+        frame[loop_variable] = condition(self)
+        while frame[loop_variable]:
+            if self.limits:
+                self.CheckLimits()
             body(self)
-            self.scope[loop_variable] = condition(self)
+            frame[loop_variable] = condition(self)
         self.scope = self.scope.parent
 
     def If(self, condition, if_true, if_false):
@@ -2879,8 +2974,9 @@ Warning: Possible ambiguity, make sure you explicitly use 2 if needed""")
         Get the variable with the given name.
 
         """
-        if key in self.scope:
-            return self.scope[key]
+        scope = self.scope
+        if key in scope:
+            return scope[key]
         if key in "θηζεδ":
             index = "θηζεδ".index(key)
             while len(self.original_inputs) <= index:
@@ -3000,17 +3096,16 @@ add a timeout of timeout ms before which the screen cannot be refreshed again.
         """
         self.print_at_end = False
         if not isinstance(timeout, int):
-            print(
-                "RuntimeError: Refresh expected int, found %s" % str(timeout)
-            )
-            if Info.is_repl not in self.info:
-                sys.exit(1)
+            self.Error("Refresh expected int, found %s" % str(timeout))
         elif timeout == 0 and Info.warn_ambiguities in self.info:
             print("""\
 Warning: Possible ambiguity, \
 make sure you explicitly use 0 for no delay if needed""")
         sleep(max(0, self.timeout_end - clock()))
-        print("\033[2J\033[0;0H" + str(self))
+        if Info.incremental_refresh in self.info:
+            self.RefreshRows()
+        else:
+            print("\033[2J\033[0;0H" + str(self))
         self.timeout_end = clock() + timeout / 1000
 
     def RefreshFast(self, timeout=0):
@@ -3024,7 +3119,10 @@ add a timeout of timeout ms before which the screen cannot be refreshed again.
 
         """
         sleep(max(0, self.timeout_end - clock()))
-        print("\033[2J\033[0;0H" + str(self))
+        if Info.incremental_refresh in self.info:
+            self.RefreshRows()
+        else:
+            print("\033[2J\033[0;0H" + str(self))
         self.timeout_end = clock() + timeout / 1000
 
     def RefreshFastText(self, text, timeout=0):
@@ -3040,8 +3138,47 @@ add a timeout of timeout ms before which the screen cannot be refreshed again.
         """
         sleep(max(0, self.timeout_end - clock()))
         print("\033[0;0H\033[2J" + text + "\n" + str(self))
+        self.frame = None
         self.timeout_end = clock() + timeout / 1000
 
+    def RefreshRows(self):
+        """
+        RefreshRows()
+
+        Refresh the screen by redrawing only the rows changed since \
+the last refresh, moving the cursor to each of them.
+
+        Redraws the whole canvas instead if it was moved, resized, \
+or changed some other way since the last refresh.
+
+        """
+        left = min(self.indices)
+        right = max(self.right_indices)
+        number = len(self.lines)
+        state = (
+            self.top, left, right, self.background, self.bg_lines, self.trim
+        )
+        frame = self.frame
+        if (
+            frame is None or
+            frame[0] is not self.lines or
+            frame[1] > number or
+            frame[2] != state
+        ):
+            print("\033[2J\033[0;0H" + str(self))
+        else:
+            render_row = self.RenderRow
+            top = self.top
+            print("".join([
+                "\033[%d;1H%s\033[K" % (
+                    y - top + 1, render_row(y - top, left, right)
+                )
+                for y in sorted(self.dirty)
+                if 0 <= y - top < number
+            ]) + "\033[%d;1H" % (number + 1), end="", flush=True)
+        self.frame = (self.lines, number, state)
+        self.dirty = set()
+
     def RefreshFor(self, timeout, variable, body):
         """
         RefreshFor(timeout, variable, body)
@@ -3053,6 +3190,7 @@ Add a timeout of timeout ms before which the screen cannot be refreshed again.
         """
         self.print_at_end = False
         print("\033[2J")
+        self.frame = None
         timeout /= 1000
         self.scope = Scope(self.scope)
         loop_variable = self.GetFreeVariable()
@@ -3060,6 +3198,8 @@ Add a timeout of timeout ms before which the screen cannot be refreshed again.
         if isinstance(variable, int):
             variable = range(variable)
         for item in variable:
+            if self.limits:
+                self.CheckLimits()
             self.timeout_end = clock() + timeout
             self.scope[loop_variable] = item
             body(self)
@@ -3077,11 +3217,14 @@ Add a timeout of timeout ms before which the screen cannot be refreshed again.
         """
         self.print_at_end = False
         print("\033[2J")
+        self.frame = None
         timeout /= 1000
         self.scope = Scope(self.scope)
         loop_variable = self.GetFreeVariable()
         self.scope[loop_variable] = condition(self)
         while self.scope[loop_variable]:
+            if self.limits:
+                self.CheckLimits()
             self.timeout_end = clock() + timeout
             body(self)
             self.RefreshFast()
@@ -3107,6 +3250,8 @@ whether the output wil be right-padded.
         If is_command is false, return the result.
 
         """
+        if self.limits:
+            self.CheckLimits()
         if type(code) == Expression:
             code = code.run()
         code = str(code)
@@ -3171,23 +3316,39 @@ arguments.
 
         Turns the given Charcoal function into a lambda accepting arguments
 
+        Unless called from ExecuteVariable, the lambda runs \
+on a blank canvas lent from a pool, so nested calls each get their own, \
+which is reset and returned to the pool afterwards, see Reset, \
+unless a lambda or Cells made while it was lent still refer to it.
+
         """
+        pool = self.pool
+        # The lambda refers to this canvas, so it cannot be reused
+        self.lent = False
 
         def run(function, arguments, charcoal):
+            pooled = charcoal is None
+            if pooled:
+                charcoal = pool.pop() if pool else Charcoal()
+                charcoal.lent = True
             lookup = {}
             for argument, key in zip(arguments, "ικλμνξπρςστυφχψωαβγδεζηθ"):
                 lookup[key] = argument
             charcoal.scope = Scope(self.scope, lookup)
-            function(charcoal)
-            return (
-                charcoal.last_printed
-                if charcoal.last_printed is not None else
-                str(charcoal)
-            )
-
-        return lambda *arguments: run(
-            function, arguments, self.charcoal or Charcoal()
-        )
+            try:
+                function(charcoal)
+                if charcoal.last_printed is not None:
+                    return charcoal.last_printed
+                lines = charcoal.lines
+                if len(lines) == 1 and not lines[0]:
+                    return ""
+                return str(charcoal)
+            finally:
+                if pooled and charcoal.lent:
+                    charcoal.Reset()
+                    pool.append(charcoal)
+
+        return lambda *arguments: run(function, arguments, self.charcoal)
 
     def CycleChop(self, iterable, length):
         """
@@ -3223,7 +3384,7 @@ the list or string.
         top_crop = max(0, self.y - self.top)
         bottom_crop = max(0, self.y + height - self.top)
         self.top += top_crop
-        self.lines = self.lines[top_crop:bottom_crop]
+        self.lines = self.Rows(self.lines[top_crop:bottom_crop])
         self.indices = self.indices[top_crop:bottom_crop]
         self.lengths = self.lengths[top_crop:bottom_crop]
         self.right_indices = self.right_indices[top_crop:bottom_crop]
@@ -3250,9 +3411,16 @@ and vertical rows between rows.
 
         """
         horizontal, vertical = int(horizontal) + 1, int(vertical) + 1
+        if self.limits:
+            self.CheckLimits(max(
+                (max(self.right_indices) - min(self.indices)) * horizontal,
+                (len(self.lines) - 1) * vertical + 1
+            ), 0)
         if horizontal:
             joiner = "\000" * (horizontal - 1)
-            self.lines = [joiner.join(line) for line in self.lines]
+            self.lines = self.Rows([
+                joiner.join(line) for line in self.lines
+            ])
             self.lengths = [
                 length and (length - 1) * horizontal + 1
                 for length in self.lengths
@@ -3273,7 +3441,7 @@ and vertical rows between rows.
             lengths[::vertical] = self.lengths
             indices[::vertical] = self.indices
             right_indices[::vertical] = self.right_indices
-            self.lines = lines
+            self.lines = self.Rows(lines)
             self.lengths = lengths
             self.indices = indices
             self.right_indices = right_indices
@@ -3305,11 +3473,12 @@ and vertical rows between rows.
         y_index = y - self.top
         if y_index < 0 or y_index >= len(self.lines):
             return ""
-        line = self.lines[y_index]
         x_index = x - self.indices[y_index]
         if x_index < 0 or x_index >= self.lengths[y_index]:
             return ""
-        return line[x_index]
+        if type(self.lines) is RowBuffers:
+            return self.lines.Get(y_index, x_index)
+        return self.lines[y_index][x_index]
 
     def Peek(self):
         """
@@ -3428,6 +3597,8 @@ iterable, else it returns the iterable.
         loop_variable = self.GetFreeVariable()
         index_variable = self.GetFreeVariable()
         for i, v in iterable.items() if isinstance(iterable, dict) else enumerate(iterable):
+            if self.limits:
+                self.CheckLimits()
             self.scope[loop_variable] = v
             self.scope[index_variable] = i
             result += [function(self)]
@@ -3478,6 +3649,8 @@ a function is truthy.
         loop_variable = self.GetFreeVariable()
         index_variable = self.GetFreeVariable()
         for i, v in iterable.items() if isinstance(iterable, dict) else enumerate(iterable):
+            if self.limits:
+                self.CheckLimits()
             self.scope[loop_variable] = v
             self.scope[index_variable] = i
             if function(self):
@@ -3512,6 +3685,8 @@ iterable.
         loop_variable = self.GetFreeVariable()
         index_variable = self.GetFreeVariable()
         for i, v in iterable.items() if isinstance(iterable, dict) else enumerate(iterable):
+            if self.limits:
+                self.CheckLimits()
             self.scope[loop_variable] = v
             self.scope[index_variable] = i
             if not function(self):
@@ -3539,6 +3714,8 @@ iterable.
         loop_variable = self.GetFreeVariable()
         index_variable = self.GetFreeVariable()
         for i, v in iterable.items() if isinstance(iterable, dict) else enumerate(iterable):
+            if self.limits:
+                self.CheckLimits()
             self.scope[loop_variable] = v
             self.scope[index_variable] = i
             if function(self):
@@ -3548,6 +3725,10 @@ iterable.
         return result
 
     def Add(self, left, right):
+        if type(right) in numeric_types and IsNumeric(left):
+            return [item + right for item in left]
+        if type(left) in numeric_types and IsNumeric(right):
+            return [left + item for item in right]
         if isinstance(left, String):
             left = str(left)
         if isinstance(right, String):
@@ -3583,6 +3764,10 @@ iterable.
         return left + right
 
     def Subtract(self, left, right):
+        if type(right) in numeric_types and IsNumeric(left):
+            return [item - right for item in left]
+        if type(left) in numeric_types and IsNumeric(right):
+            return [left - item for item in right]
         if isinstance(left, String):
             left = str(left)
         if isinstance(right, String):
@@ -3630,6 +3815,10 @@ iterable.
         return left - right
 
     def Multiply(self, left, right, iterable=True):
+        if type(right) in numeric_types and IsNumeric(left):
+            return [item * right for item in left]
+        if type(left) in numeric_types and IsNumeric(right):
+            return [left * item for item in right]
         if isinstance(left, String):
             left = str(left)
         if isinstance(right, String):
@@ -3681,6 +3870,14 @@ iterable.
         return left * right
 
     def Divide(self, left, right, floor=True, iterable=True):
+        if iterable and type(right) in numeric_types and IsNumeric(left):
+            if floor:
+                return [item // right for item in left]
+            return [item / right for item in left]
+        if iterable and type(left) in numeric_types and IsNumeric(right):
+            if floor:
+                return [left // item for item in right]
+            return [left / item for item in right]
         def reduce(lst, function):
             result = lst[0]
             for item in lst[1:]:
@@ -3839,6 +4036,153 @@ SuperscriptToNormal = {
     "⁵": 5, "⁶": 6, "⁷": 7, "⁸": 8, "⁹": 9
 }
 
+DispatchTables = {}
+
+
+def FirstSets(grammars):
+    """
+    FirstSets(grammars) -> dict
+
+    Returns a dict mapping each token in grammars to a list with, \
+for each of its lexemes, a tuple (first, nullable, resets).
+
+    first is the set of lowercased characters and of the String, Number, \
+Name and EOF tokens that the lexeme can start with.
+
+    nullable is whether the lexeme can match without consuming anything.
+
+    resets is whether trying the lexeme when it cannot match clears the \
+parse trace, which is true when the first token it fails on is a nonterminal.
+
+    """
+    builtin_tokens = (CT.String, CT.Number, CT.Name, CT.EOF)
+    first = {token: set() for token in grammars}
+    nullable = {token: False for token in grammars}
+
+    def SequenceFirst(lexeme):
+        result = set()
+        for token in lexeme:
+            if isinstance(token, str):
+                if token:
+                    result.add(token[:1].lower()[:1])
+                    return result, False, False
+            elif token in builtin_tokens:
+                result.add(token)
+                return result, False, False
+            else:
+                result |= first[token]
+                if not nullable[token]:
+                    return result, False, True
+        return result, True, False
+
+    changed = True
+    while changed:
+        changed = False
+        for token in grammars:
+            for lexeme in grammars[token]:
+                lexeme_first, lexeme_nullable, _ = SequenceFirst(lexeme)
+                if not lexeme_first <= first[token]:
+                    first[token] |= lexeme_first
+                    changed = True
+                if lexeme_nullable and not nullable[token]:
+                    nullable[token] = True
+                    changed = True
+    return {
+        token: [SequenceFirst(lexeme) for lexeme in grammars[token]]
+        for token in grammars
+    }
+
+
+def CanStartWith(first, character):
+    """
+    CanStartWith(first, character) -> bool
+
+    Returns whether a lexeme with the given first set can start \
+with character, where an empty character means the end of the code.
+
+    """
+    if not character:
+        return CT.EOF in first
+    return (
+        character.lower()[:1] in first or
+        CT.String in first and (
+            character not in UnicodeCommands or character in "“”"
+        ) or
+        CT.Number in first and (
+            character in SuperscriptToNormal or character == "·"
+        ) or
+        CT.Name in first and (
+            character >= "α" and character <= "ω" and character != "ο"
+        )
+    )
+
+
+def DispatchPlan(grammars, grammar, character):
+    """
+    DispatchPlan(grammars, grammar, character) -> tuple
+
+    Returns the lexeme indices of grammar worth trying when the code \
+continues with character, with -1 standing in for skipped lexemes \
+that would have cleared the parse trace.
+
+    Plans are cached per grammars, and only hold lexeme indices, \
+so they stay valid whichever processor is used or patched.
+
+    """
+    key = id(grammars)
+    if key not in DispatchTables or DispatchTables[key][0] is not grammars:
+        DispatchTables[key] = (grammars, FirstSets(grammars), {})
+    _, first_sets, plans = DispatchTables[key]
+    plan_key = (grammar, character)
+    if plan_key in plans:
+        return plans[plan_key]
+    plan = []
+    for lexeme_index, (first, nullable, resets) in enumerate(
+        first_sets[grammar]
+    ):
+        if nullable or CanStartWith(first, character):
+            plan += [lexeme_index]
+        elif resets and (not plan or plan[-1] != -1):
+            plan += [-1]
+    plan = plans[plan_key] = tuple(plan)
+    return plan
+
+
+def SkipVerbose(code, index):
+    """
+    SkipVerbose(code, index) -> int
+
+    Returns the index of the next token in verbose code, \
+skipping whitespace and comments from the given index.
+
+    """
+    while index < len(code) and code[index] in "\r\n\t ":
+        index += 1
+    next_chars = code[index:index + 2]
+    while next_chars == "//" or next_chars == "/*":
+        index += 2
+        if next_chars == "//":
+            while index < len(code) and code[index] not in "\r\n":
+                index += 1
+            if code[index - 1:index + 1] == "\r\n":
+                # It's a MS newline
+                index += 1
+        else:
+            depth = 1
+            while depth:
+                next_chars = code[index:index + 2]
+                while next_chars != "*/":
+                    if next_chars == "/*":
+                        depth += 1
+                    index += 1
+                    next_chars = code[index:index + 2]
+                depth -= 1
+            index += 2
+        while index < len(code) and code[index] in "\r\n\t ":
+            index += 1
+        next_chars = code[index:index + 2]
+    return index
+
 
 def ParseExpression(
     code,
@@ -3847,11 +4191,14 @@ def ParseExpression(
     grammars=UnicodeGrammars,
     processor=ASTProcessor,
     verbose=False,
-    return_lexeme_index=False
+    return_lexeme_index=False,
+    memo=None,
+    dispatch=True
 ):
     """
     ParseExpression(code, index=0, grammar=CT.Program, \
-grammars=UnicodeGrammars, processor=ASTProcessor, verbose=False) -> Any
+grammars=UnicodeGrammars, processor=ASTProcessor, verbose=False, \
+return_lexeme_index=False, memo=None, dispatch=True) -> Any
 
     Parse the given code starting from the given index, \
 starting from the token given as grammar.
@@ -3862,39 +4209,42 @@ starting from the token given as grammar.
 
     If verbose is true, parses using VerboseGrammars and verbose literals.
 
+    memo caches the result of every (grammar, index) pair tried while \
+parsing, so no token is parsed twice at the same position. If memo is None \
+a new cache is used, if memo is False no cache is used.
+
+    If dispatch is true, lexemes that cannot start with the next character \
+are skipped without being tried.
+
     Returns the processed expression.
 
     """
-    original_index, lexeme_index, parse_index, parse_trace = index, 0, 0, []
-    for lexeme in grammars[grammar]:
+    if memo is None:
+        memo = {}
+    if memo is not False:
+        key = (grammar, index)
+        if key in memo:
+            result = memo[key]
+            return (
+                result
+                if return_lexeme_index or result[1] is False else
+                result[:2]
+            )
+    original_index, parse_index, parse_trace = index, 0, []
+    lexemes = grammars[grammar]
+    if verbose or not dispatch:
+        plan = range(len(lexemes))
+    else:
+        plan = DispatchPlan(grammars, grammar, code[index:index + 1])
+    for lexeme_index in plan:
+        if lexeme_index == -1:
+            parse_trace, parse_index = [], original_index
+            continue
+        lexeme = lexemes[lexeme_index]
         success, index, tokens = True, original_index, []
         for token in lexeme:
             if verbose:
-                while index < len(code) and code[index] in "\r\n\t ":
-                    index += 1
-                next_chars = code[index:index + 2]
-                while next_chars == "//" or next_chars == "/*":
-                    index += 2
-                    if next_chars == "//":
-                        while index < len(code) and code[index] not in "\r\n":
-                            index += 1
-                        if code[index - 1:index + 1] == "\r\n":
-                            # It's a MS newline
-                            index += 1
-                    else:
-                        depth = 1
-                        while depth:
-                            next_chars = code[index:index + 2]
-                            while next_chars != "*/":
-                                if next_chars == "/*":
-                                    depth += 1
-                                index += 1
-                                next_chars = code[index:index + 2]
-                            depth -= 1
-                        index += 2
-                    while index < len(code) and code[index] in "\r\n\t ":
-                        index += 1
-                    next_chars = code[index:index + 2]
+                index = SkipVerbose(code, index)
             if isinstance(token, int):
                 if verbose:
                     if token == CT.EOF:
@@ -4004,7 +4354,7 @@ abcdefghijklmnopqrstuvwxyz"
                                 for expected in expect:
                                     parens = False
                                     if expected == CT.Expression:
-                                        result = ParseExpression(code, index, CT.LP, grammars, processor, verbose, return_lexeme_index=True)
+                                        result = ParseExpression(code, index, CT.LP, grammars, processor, verbose, return_lexeme_index=True, memo=memo, dispatch=dispatch)
 
                                         if result and result[1] is not False and not result[2]:
                                             index = result[1]
@@ -4019,7 +4369,7 @@ abcdefghijklmnopqrstuvwxyz"
                                             types += [CT.Expression]
                                             expect = expect_lookup[expected]
                                             break
-                                    result = ParseExpression(code, index, expected, grammars, processor, verbose, return_lexeme_index=True)
+                                    result = ParseExpression(code, index, expected, grammars, processor, verbose, return_lexeme_index=True, memo=memo, dispatch=dispatch)
                                     
                                     if not result or result[1] is False:
                                         continue
@@ -4033,7 +4383,7 @@ abcdefghijklmnopqrstuvwxyz"
                                     break
 
                             if not top:
-                                close_paren = ParseExpression(code, index, CT.RP, grammars, processor, verbose, return_lexeme_index=True)
+                                close_paren = ParseExpression(code, index, CT.RP, grammars, processor, verbose, return_lexeme_index=True, memo=memo, dispatch=dispatch)
                                 if not close_paren or close_paren[1] is False or close_paren[2]:
                                     return None
                                 index = close_paren[1]
@@ -4113,9 +4463,17 @@ expression is a command, not an operator, so it must be at top level")
                             break
                         
                         tokens += [processor[CT.Fix][0](result)]
+                    elif grammar == CT.Program and token == CT.Program:
+                        result = ParseProgram(
+                            code, index, grammars, processor, verbose, memo,
+                            dispatch
+                        )
+                        tokens += [result[0]]
+                        index = result[1]
                     else:
                         result = ParseExpression(
-                            code, index, token, grammars, processor, verbose
+                            code, index, token, grammars, processor, verbose,
+                            memo=memo, dispatch=dispatch
                         )
                         if not result:
                             success = False
@@ -4238,9 +4596,17 @@ expression is a command, not an operator, so it must be at top level")
                         else:
                             success = False
                             break
+                    elif grammar == CT.Program and token == CT.Program:
+                        result = ParseProgram(
+                            code, index, grammars, processor, verbose, memo,
+                            dispatch
+                        )
+                        tokens += [result[0]]
+                        index = result[1]
                     else:
                         result = ParseExpression(
-                            code, index, token, grammars, processor, verbose
+                            code, index, token, grammars, processor, verbose,
+                            memo=memo, dispatch=dispatch
                         )
                         if not result:
                             success = False
@@ -4267,13 +4633,13 @@ expression is a command, not an operator, so it must be at top level")
         if parse_trace and not parse_index and not original_index:
             break
         if success:
-            return (
-                (processor[grammar][lexeme_index](tokens), index, lexeme_index)
-                if return_lexeme_index else
-                (processor[grammar][lexeme_index](tokens), index)
+            result = (
+                processor[grammar][lexeme_index](tokens), index, lexeme_index
             )
-        lexeme_index += 1
-    return ((
+            if memo is not False:
+                memo[key] = result
+            return result if return_lexeme_index else result[:2]
+    result = ((
         parse_trace
         if not parse_index or parse_index == original_index else
         (
@@ -4284,6 +4650,89 @@ expression is a command, not an operator, so it must be at top level")
             parse_trace
         )
     ), False, original_index)
+    if memo is not False:
+        memo[key] = result
+    return result
+
+
+def ParseProgram(
+    code,
+    index,
+    grammars=UnicodeGrammars,
+    processor=ASTProcessor,
+    verbose=False,
+    memo=None,
+    dispatch=True
+):
+    """
+    ParseProgram(code, index, grammars=UnicodeGrammars, \
+processor=ASTProcessor, verbose=False, memo=None, dispatch=True) -> tuple
+
+    Parses the rest of a Program from the given index, after its first \
+command, the same way as ParseExpression but with a loop \
+instead of one level of recursion per command.
+
+    The rest of a program always parses, as a program \
+that is not at the start of the code falls back to being empty.
+
+    """
+    lexemes = grammars[CT.Program]
+    if (
+        len(lexemes) != 2 or lexemes[1] or not lexemes[0] or
+        lexemes[0][-1] != CT.Program
+    ):
+        return ParseExpression(
+            code, index, CT.Program, grammars, processor, verbose,
+            memo=memo, dispatch=dispatch
+        )
+    if memo is None:
+        memo = {}
+    chain, result = [], None
+    while result is None:
+        key = (CT.Program, index)
+        if memo is not False and key in memo:
+            result = memo[key]
+            break
+        tokens, end = [], index
+        if verbose or not dispatch or 0 in DispatchPlan(
+            grammars, CT.Program, code[index:index + 1]
+        ):
+            for token in lexemes[0][:-1]:
+                if verbose:
+                    end = SkipVerbose(code, end)
+                parsed = ParseExpression(
+                    code, end, token, grammars, processor, verbose,
+                    memo=memo, dispatch=dispatch
+                )
+                if not parsed or parsed[1] is False:
+                    tokens = None
+                    break
+                tokens += [parsed[0]]
+                end = parsed[1]
+            else:
+                if verbose:
+                    end = SkipVerbose(code, end)
+        else:
+            tokens = None
+        if tokens is None:
+            result = (processor[CT.Program][1]([]), index, 1)
+            if memo is not False:
+                memo[key] = result
+        elif end == index:
+            # Nothing was consumed, so parse as usual to fail the same way
+            result = ParseExpression(
+                code, index, CT.Program, grammars, processor, verbose,
+                return_lexeme_index=True, memo=memo, dispatch=dispatch
+            )
+        else:
+            chain += [(key, tokens)]
+            index = end
+    for key, tokens in reversed(chain):
+        result = (processor[CT.Program][0](tokens + [result[0]]), result[1], 0)
+        if memo is not False:
+            memo[key] = result
+    return result[:2]
+
 
 def Decode(code):
     """
@@ -4291,41 +4740,75 @@ def Decode(code):
 
     Returns code converted from Charcoal's codepage to Unicode.
 
+    code is a string of bytes as characters, a bytes-like object, \
+or a file object or memory-mapped file, see DecodeStream.
+
     """
-    result = ""
-    i = 0
-    while i < len(code):
-        character = code[i]
-        ordinal = ord(character)
-        if ordinal == 0xFF:
-            i += 1
-            ordinal = ord(code[i])
-            if ordinal & 0b11000000 == 0b10000000:  # 2 bytes
-                result += chr(
-                    ((ordinal & 63) << 8) + ord(code[i + 1]) + 128
-                )
-                i += 2
-            elif ordinal & 0b11100000 == 0b11000000:  # 3 bytes
-                result += chr(
-                    ((ordinal & 31) << 16) +
-                    (ord(code[i + 1]) << 8) +
-                    ord(code[i + 2]) +
-                    16512
-                )
-                i += 3
-            elif ordinal & 0b11110000 == 0b11100000:  # 4 bytes
-                result += chr(
-                    ((ordinal & 15) << 24) +
-                    (ord(code[i + 1]) << 16) +
-                    (ord(code[i + 2]) << 8) +
-                    ord(code[i + 3]) +
-                    2113664
-                )
-                i += 4
-        else:
-            result += UnicodeLookup.get(character, character)
-            i += 1
-    return result
+    return "".join(DecodeStream(code))
+
+
+def ReadCode(path, encoded=False, decode=True):
+    """
+    ReadCode(path, encoded=False, decode=True) -> str
+
+    Returns the code in the file at path, read as UTF-8.
+
+    If encoded is true, the file is in Charcoal's codepage, \
+and is decoded to Unicode a chunk at a time as it is read, \
+see DecodeStream, or returned as a string of bytes as characters \
+if decode is false.
+
+    """
+    if encoded and decode:
+        with _open(path, "rb") as file:
+            return Decode(file)
+    with (openl1 if encoded else open)(path) as file:
+        return file.read()
+
+
+ProgramCache = OrderedDict()
+program_cache_size = 256
+program_cache_store = None
+
+
+def SetProgramCache(size=256, directory=None):
+    """
+    SetProgramCache(size=256, directory=None)
+
+    Sets how many parsed programs Parse keeps in memory, and the directory \
+parse results are stored in so later processes can skip parsing. \
+If directory is None, parse results are not stored on disk.
+
+    """
+    global program_cache_size, program_cache_store
+    program_cache_size = size
+    program_cache_store = directory and DiskCache(directory)
+    ClearProgramCache()
+
+
+def ClearProgramCache():
+    """
+    ClearProgramCache()
+
+    Empties the in-memory cache of parsed programs.
+
+    Must be called after modifying a processor in place.
+
+    """
+    ProgramCache.clear()
+
+
+def CacheProgram(key, grammars, processor, program):
+    """
+    CacheProgram(key, grammars, processor, program)
+
+    Adds program to the in-memory cache of parsed programs, \
+evicting the least recently used programs if the cache is full.
+
+    """
+    ProgramCache[key] = (grammars, processor, program)
+    while len(ProgramCache) > program_cache_size:
+        ProgramCache.popitem(last=False)
 
 
 def Parse(
@@ -4337,12 +4820,16 @@ def Parse(
     normal_encoding=False,
     verbose=False,
     grave=False,
-    silent=False
+    silent=False,
+    packrat=True,
+    cache=True,
+    strict=False
 ):
     """
     Parse(code, grammar=CT.Program, \
 grammars=UnicodeGrammars, processor=ASTProcessor, whitespace=False, \
-normal_encoding=False, verbose=False, grave=False) -> Any
+normal_encoding=False, verbose=False, grave=False, packrat=True, \
+cache=True, strict=False) -> Any
 
     Parse the given Charcoal code, starting from the token given as grammar.
 
@@ -4359,9 +4846,38 @@ normal_encoding=False, verbose=False, grave=False) -> Any
     If grave is true, converts all characters preceded by ´ or ´´ with the \
 symbols they represent.
 
+    If packrat is true, memoizes every token tried at every position, \
+so parsing takes linear time.
+
+    If cache is true, reuses the result of parsing the same code \
+with the same options, from memory or from the directory set using \
+SetProgramCache.
+
+    If strict is true, raises CharcoalParseError if parsing fails, \
+instead of printing the parse trace and returning an empty program.
+
     Returns the processed program.
 
     """
+    key = store_key = None
+    if cache:
+        key = (
+            code, grammar, id(grammars), id(processor), whitespace,
+            normal_encoding, verbose, grave
+        )
+        if key in ProgramCache:
+            ProgramCache.move_to_end(key)
+            return ProgramCache[key][2]
+        if program_cache_store and grammars is UnicodeGrammars:
+            store_key = json.dumps([
+                code, grammar, whitespace, normal_encoding, verbose, grave,
+                GrammarHash()
+            ])
+            derivation = program_cache_store.Get(store_key)
+            if derivation is not None:
+                program = Replay(derivation, processor)
+                CacheProgram(key, grammars, processor, program)
+                return program
     if normal_encoding:
         code = Decode(code)
     if whitespace:
@@ -4372,28 +4888,62 @@ symbols they represent.
         )
     if verbose:
         parsed = ParseExpression(
-            code, 0, grammar, VerboseGrammars, StringifierProcessor, True
+            code, 0, grammar, VerboseGrammars, StringifierProcessor, True,
+            memo=None if packrat else False
         )
+        if parsed[1] is False and strict:
+            raise CharcoalParseError(parsed[0])
         if parsed[1] is False and not silent:
             PrintParseTrace(parsed[0])
             return processor[CT.Program][-1]([])
         if parsed:
             code = StringifyCode(parsed[0])
+        elif strict:
+            raise CharcoalParseError()
         else:
             print("RuntimeError: Could not parse")
             sys.exit(1)
     elif grave:
         code = Degrave(code)
-    result = ParseExpression(code, 0, grammar, grammars, processor)
+    result = ParseExpression(
+        code, 0, grammar, grammars,
+        DerivationProcessor if store_key else processor,
+        memo=None if packrat else False
+    )
+    if strict and (not result or result[1] is False):
+        raise CharcoalParseError(result and result[0])
     if not result:
         return result
-    if result[1] is False and not silent:
-        PrintParseTrace(result[0])
-    return (
-        processor[CT.Program][-1]([])
-        if result[1] is False else
-        result[0]
-    )
+    if result[1] is False:
+        if not silent:
+            PrintParseTrace(result[0])
+        return processor[CT.Program][-1]([])
+    program = result[0]
+    if store_key:
+        program_cache_store.Set(store_key, FlattenDerivation(program))
+        program = Replay(program, processor)
+    if cache:
+        CacheProgram(key, grammars, processor, program)
+    return program
+
+
+grammar_hash = None
+
+
+def GrammarHash():
+    """
+    GrammarHash() -> int
+
+    Returns a hash of UnicodeGrammars, so that stored parse results \
+are not reused once the grammar changes.
+
+    """
+    global grammar_hash
+    if not grammar_hash:
+        grammar_hash = zlib.crc32(repr(sorted(
+            UnicodeGrammars.items()
+        )).encode("utf-8"))
+    return grammar_hash
 
 
 def PrintParseTrace(trace):
@@ -4472,12 +5022,14 @@ def Run(
     normal_encoding=False,
     verbose=False,
     grave=False,
-    silent=False
+    silent=False,
+    compiled=False,
+    optimized=False
 ):
     """
     Run(code, inputs="", charcoal=None, grammar=CT.Program, \
 grammars=UnicodeGrammars, whitespace=False, normal_encoding=False, \
-verbose=False, grave=False) -> Any
+verbose=False, grave=False, compiled=False, optimized=False) -> Any
 
     Runs given Charcoal code with given inputs as a string.
 
@@ -4494,6 +5046,12 @@ verbose=False, grave=False) -> Any
     If grave is true, converts all characters preceded by ´ or ´´ with the \
 symbols they represent.
 
+    If compiled is true and grammar is Program, runs the program \
+compiled to a Python function, see Compile.
+
+    If optimized is true and grammar is Program, runs the program \
+with constants folded and dead branches removed, see Optimize.
+
     Returns the state of the canvas as a string if grammar is Program, \
 else the result of parsing.
 
@@ -4504,8 +5062,9 @@ else the result of parsing.
     else:
         charcoal.AddInputs(inputs)
     result = Parse(
-        code, grammar, grammars, InterpreterProcessor, whitespace,
-        normal_encoding, verbose, grave, silent
+        code, grammar, grammars,
+        ProgramProcessor(grammar, compiled, optimized),
+        whitespace, normal_encoding, verbose, grave, silent
     )(charcoal)
     if grammar == CT.Program:
         return str(charcoal)
@@ -4521,12 +5080,14 @@ def GetProgram(
     whitespace=False,
     normal_encoding=False,
     verbose=False,
-    grave=False
+    grave=False,
+    compiled=False,
+    optimized=False
 ):
     """
     GetProgram(code, inputs="", charcoal=None, grammar=CT.Program, \
 grammars=UnicodeGrammars, whitespace=False, normal_encoding=False, \
-verbose=False, grave=False) -> Any
+verbose=False, grave=False, compiled=False, optimized=False) -> Any
 
     Runs given Charcoal code with given inputs as a string.
 
@@ -4543,15 +5104,38 @@ verbose=False, grave=False) -> Any
     If grave is true, converts all characters preceded by ´ or ´´ with the \
 symbols they represent.
 
+    If compiled is true and grammar is Program, the program is compiled \
+to a Python function the first time it is called, see Compile.
+
+    If optimized is true and grammar is Program, constants are folded \
+and dead branches removed the first time it is called, see Optimize.
+
     Returns the Charcoal program as a function.
 
     """
     return Parse(
-        code, grammar, grammars, InterpreterProcessor, whitespace,
-        normal_encoding, verbose, grave
+        code, grammar, grammars,
+        ProgramProcessor(grammar, compiled, optimized),
+        whitespace, normal_encoding, verbose, grave
     )
 
 
+def ProgramProcessor(grammar=CT.Program, compiled=False, optimized=False):
+    """
+    ProgramProcessor(grammar=CT.Program, compiled=False, optimized=False) \
+-> dict
+
+    Returns the processor Run and GetProgram parse with, \
+given their options.
+
+    """
+    if grammar != CT.Program:
+        return InterpreterProcessor
+    if optimized:
+        return CompiledOptimizerProcessor if compiled else OptimizerProcessor
+    return CompilerProcessor if compiled else InterpreterProcessor
+
+
 def Degrave(code):
     return re.sub(r"``([\s\S])|`([\s\S])", lambda match: (
         {
@@ -4611,6 +5195,7 @@ def AddAmbiguityWarnings():
     ASTProcessor[CT.Command][60] = lambda result: [
         "Refresh [Warning: May be ambiguous]"
     ]
+    ClearProgramCache()
 
 
 def RemoveThrottle():
@@ -4623,6 +5208,7 @@ def RemoveThrottle():
     InterpreterProcessor[CT.Command][100] = (
         lambda result: lambda charcoal: charcoal.DumpNoThrottle()
     )
+    ClearProgramCache()
 
 # from https://gist.github.com/puentesarrin/6567480
 
@@ -4632,46 +5218,30 @@ def print_xxd(data):
     print_xxd(data)
 
     Prints the xxd-style hexdump using Charcoal's codepage, \
-given data in UTF-8.
+given data in UTF-8, as a string or a text file object.
+
+    Lines are printed as soon as they are encoded, see EncodeStream.
 
     """
-    array = []
-    for original in data:
-        ordinal = ord(original)
-        if InCodepage(original):
-            character = ReverseLookup.get(original, original)
-            array.append(ord(character))
-        elif ordinal < 16512:
-            code = ordinal - 128
-            array.append(0xFF)
-            array.append(0b10000000 | (code >> 8))
-            array.append(code & 0xFF)
-        elif ordinal < 2113664:
-            code = ordinal - 16512
-            array.append(0xFF)
-            array.append(0b11000000 | (code >> 16))
-            array.append((code >> 8) & 0xFF)
-            array.append(code & 0xFF)
-        else:
-            code = ordinal - 2113664
-            array.append(0xFF)
-            array.append(0b11100000 | (code >> 24))
-            array.append((code >> 16) & 0xFF)
-            array.append((code >> 8) & 0xFF)
-            array.append(code & 0xFF)
-    data, counter = array, 0
-    buf = [1]
-    while buf:
-        buf = data[counter << 4:(counter + 1) << 4]
-        if not buf:
-            break
+    buffer, counter = [], 0
+
+    def print_line(buf, counter):
         buf2 = ["%02x" % i for i in buf]
         print("{0}: {1:<39}  {2}".format(
             ("%07x" % (counter << 4)),
             " ".join(["".join(buf2[i:i + 2]) for i in range(0, len(buf2), 2)]),
             "".join([chr(c) if c >= 32 and c <= 126 else "." for c in buf])
         ))
-        counter += 1
+
+    for encoded in EncodeStream(data):
+        buffer += encoded
+        lines = len(buffer) >> 4
+        for line in range(lines):
+            print_line(buffer[line << 4:(line + 1) << 4], counter)
+            counter += 1
+        del buffer[:lines << 4]
+    if buffer:
+        print_line(buffer, counter)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -4796,6 +5366,41 @@ non-raw file input and file output."""
         "--ppcg", "--cg", action="store_true",
         help="Output a PPCG-formatted post."
     )
+    parser.add_argument(
+        "--cachedirectory", "--cd", type=str, nargs="?", default="",
+        help="Directory to store parsed programs and decompressed \
+literals in, to skip parsing and decompressing them later."
+    )
+    parser.add_argument(
+        "--compile", action="store_true",
+        help="Compile the program to a Python function before running it."
+    )
+    parser.add_argument(
+        "--optimize", action="store_true",
+        help="Fold constants and remove dead branches before running."
+    )
+    parser.add_argument(
+        "--incrementalrefresh", "--ir", action="store_true",
+        help="Only redraw the rows that changed when refreshing."
+    )
+    parser.add_argument(
+        "--batch", "-b", type=str, default="",
+        help="JSONL file or directory of test cases to run in parallel, \
+printing a JSON summary."
+    )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=None,
+        help="Number of worker processes for --batch."
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=0,
+        help="Seconds each --batch test case may run for."
+    )
+    parser.add_argument(
+        "--compressionworkers", "--cw", type=int, default=0,
+        help="Number of threads to try compression methods in at once \
+when compressing string literals."
+    )
     argv, info = parser.parse_args(), set()
     argv.repl = argv.repl or all(
         x in ["-g", "--grave", "-v", "--verbose"] for x in sys.argv[1:]
@@ -4804,10 +5409,17 @@ non-raw file input and file output."""
         from test import CharcoalTests, RunTests
         RunTests()
         sys.exit()
+    if argv.cachedirectory:
+        SetProgramCache(directory=argv.cachedirectory)
+        SetDecompressedCache(directory=argv.cachedirectory)
+    if argv.compressionworkers:
+        SetCompressionPool(argv.compressionworkers)
     if argv.stepcanvas:
         info.add(Info.step_canvas)
     if argv.dumpcanvas:
         info.add(Info.dump_canvas)
+    if argv.incrementalrefresh:
+        info.add(Info.incremental_refresh)
     if argv.nothrottle:
         RemoveThrottle()
     if argv.Wambiguities:
@@ -4819,31 +5431,31 @@ non-raw file input and file output."""
         info.add(Info.prompt)
         info.add(Info.is_repl)
     code = argv.code
+    decoded = False
     if argv.file:
-        openfile = openl1 if argv.normalencoding or argv.decode else open
         if os.path.isfile(argv.file):
-            with openfile(argv.file) as file:
-                code = file.read()
-                if argv.file.endswith(".clv"):
-                    argv.verbose = True
-                if argv.file.endswith(".clg"):
-                    argv.grave = True
+            path = argv.file
+            if argv.file.endswith(".clv"):
+                argv.verbose = True
+            if argv.file.endswith(".clg"):
+                argv.grave = True
         elif os.path.isfile(argv.file + ".cl"):
-            with openfile(argv.file + ".cl") as file:
-                code = file.read()
+            path = argv.file + ".cl"
         elif os.path.isfile(argv.file + ".clv"):
-            with openfile(argv.file + ".clv") as file:
-                code = file.read()
-                argv.verbose = True
+            path = argv.file + ".clv"
+            argv.verbose = True
         elif os.path.isfile(argv.file + "clg"):
-            with openfile(argv.file + ".clg") as file:
-                code = file.read()
-                argv.grave = True
+            path = argv.file + ".clg"
+            argv.grave = True
         else:
             print(
                 "FileNotFoundError: The specified Charcoal file was not found."
             )
             sys.exit(1)
+        encoded = argv.normalencoding or argv.decode
+        # Verbose and grave code is not decoded, see below
+        decoded = encoded and not (argv.verbose or argv.grave or argv.degrave)
+        code = ReadCode(path, encoded, decoded)
     verbose = code
     if argv.rawinputfile:
         with open(argv.rawinputfile) as file:
@@ -4902,7 +5514,8 @@ non-raw file input and file output."""
         if argv.degrave:
             warn(code)
     elif argv.normalencoding or argv.decode:
-        code = Decode(code)
+        if not decoded:
+            code = Decode(code)
         argv.normalencoding = False
         if argv.decode:
             warn(code)
@@ -4978,6 +5591,14 @@ Parse trace:
         sys.exit()
     if argv.degrave and not argv.grave:
         sys.exit()
+    if argv.batch:
+        from batch import RunBatch
+        summary = RunBatch(
+            code, argv.batch, argv.jobs, argv.timeout, argv.whitespace,
+            argv.normalencoding, argv.compile, argv.optimize
+        )
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        sys.exit(int(summary["total"] != summary["pass"] + summary["done"]))
     global_charcoal = Charcoal(
         info=info, canvas_step=argv.canvasstep, original_input=argv.input
     )
@@ -5018,7 +5639,8 @@ Parse trace:
         result = Run(
             code, argv.input[0] if len(argv.input) else "",
             charcoal=global_charcoal, whitespace=argv.whitespace,
-            normal_encoding=argv.normalencoding
+            normal_encoding=argv.normalencoding, compiled=argv.compile,
+            optimized=argv.optimize
         )
         if (
             not argv.stepcanvas and
@@ -5034,7 +5656,8 @@ Parse trace:
         test_charcoal = Charcoal()
         program = GetProgram(
             code, whitespace=argv.whitespace,
-            normal_encoding=argv.normalencoding
+            normal_encoding=argv.normalencoding, compiled=argv.compile,
+            optimized=argv.optimize
         )
         if argv.quiettesting:
             for i in range(len(argv.input)):
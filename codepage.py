@@ -85,3 +85,140 @@ sOperator = """\
 |Ｋ.|±Ｌ|⊞Ｏ|⌕Ａ|ＵＶ"""
 rCommand = re.compile("(%s)" % sCommand)
 rOperator = re.compile("(%s)" % sOperator)
+
+DecodeTable = {ord(key): value for key, value in UnicodeLookup.items()}
+EncodeTable = {
+    ord(character): ord(ReverseLookup.get(character, character))
+    for character in Codepage
+}
+rNotInCodepage = re.compile("[^%s]+" % re.escape("".join(Codepage)))
+escape_offsets = (128, 16512, 2113664)
+escape_masks = (0b00111111, 0b00011111, 0b00001111)
+escape_prefixes = (0b10000000, 0b11000000, 0b11100000)
+
+
+def Chunks(source, chunk_size=65536):
+    """
+    Chunks(source, chunk_size=65536)
+
+    Yields source in chunks of up to chunk_size items \
+if it has a read method, as file objects and memory-mapped files do, \
+and as a single chunk otherwise.
+
+    """
+    if not hasattr(source, "read"):
+        yield source
+        return
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def EscapeLength(lead):
+    """
+    EscapeLength(lead) -> int
+
+    Returns the number of bytes after 0xFF in the multibyte character \
+starting with the byte lead, or 0 if lead does not start one.
+
+    """
+    if lead & 0b11000000 == 0b10000000:
+        return 2
+    if lead & 0b11100000 == 0b11000000:
+        return 3
+    if lead & 0b11110000 == 0b11100000:
+        return 4
+    return 0
+
+
+def DecodeStream(source, chunk_size=65536):
+    """
+    DecodeStream(source, chunk_size=65536)
+
+    Yields the Unicode text of source, in Charcoal's codepage, piece by piece.
+
+    source is a string of bytes as characters, a bytes-like object, \
+or a file object or memory-mapped file to read chunk_size bytes at a time.
+
+    Runs of single bytes are translated with DecodeTable, \
+only multibyte characters, escaped by 0xFF, are decoded one at a time.
+
+    """
+    pending = ""
+    for chunk in Chunks(source, chunk_size):
+        if not isinstance(chunk, str):
+            chunk = str(chunk, "latin1")
+        if pending:
+            chunk, pending = pending + chunk, ""
+        start, length = 0, len(chunk)
+        while True:
+            escape = chunk.find("\xFF", start)
+            if escape == -1:
+                if start < length:
+                    yield chunk[start:].translate(DecodeTable)
+                break
+            if escape > start:
+                yield chunk[start:escape].translate(DecodeTable)
+            if escape + 1 == length:
+                pending = chunk[escape:]
+                break
+            size = EscapeLength(ord(chunk[escape + 1]))
+            if not size:
+                # Not a multibyte character, drop the escape
+                start = escape + 1
+                continue
+            end = escape + size + 1
+            if end > length:
+                pending = chunk[escape:]
+                break
+            ordinal = ord(chunk[escape + 1]) & escape_masks[size - 2]
+            for character in chunk[escape + 2:end]:
+                ordinal = (ordinal << 8) + ord(character)
+            yield chr(ordinal + escape_offsets[size - 2])
+            start = end
+    if pending:
+        raise ValueError("Code ends partway through a multibyte character")
+
+
+def EncodeCharacter(character):
+    """
+    EncodeCharacter(character) -> list
+
+    Returns the bytes of a character not in Charcoal's codepage, \
+as a multibyte character escaped by 0xFF.
+
+    """
+    ordinal = ord(character)
+    size = 2 if ordinal < 16512 else 3 if ordinal < 2113664 else 4
+    code = ordinal - escape_offsets[size - 2]
+    return [0xFF, escape_prefixes[size - 2] | code >> 8 * (size - 1)] + [
+        code >> 8 * shift & 0xFF for shift in range(size - 2, -1, -1)
+    ]
+
+
+def EncodeStream(source, chunk_size=65536):
+    """
+    EncodeStream(source, chunk_size=65536)
+
+    Yields the bytes of the Unicode text source in Charcoal's codepage, \
+piece by piece, as bytes for runs of characters in the codepage \
+and lists of integers for multibyte characters.
+
+    source is a string, or a file object to read chunk_size characters \
+at a time.
+
+    """
+    for chunk in Chunks(source, chunk_size):
+        start = 0
+        for match in rNotInCodepage.finditer(chunk):
+            if match.start() > start:
+                yield chunk[start:match.start()].translate(
+                    EncodeTable
+                ).encode("latin1")
+            for character in match.group():
+                yield EncodeCharacter(character)
+            start = match.end()
+        if start < len(chunk):
+            yield chunk[start:].translate(EncodeTable).encode("latin1")
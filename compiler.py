@@ -0,0 +1,239 @@
+from charcoaltoken import CharcoalToken as CT
+from interpreterprocessor import InterpreterProcessor
+from derivationprocessor import DerivationProcessor, Replay
+
+FOR, WHILE, IF_ELSE, IF = 91, 92, 93, 94
+NUMBER, STRING, NAME = 0, 1, 2
+OPERATORS = (11, 13, 15, 17)
+# Python allows 20 statically nested blocks and 200 nested parentheses
+max_depth = 16
+max_expression_depth = 64
+
+
+class CompiledProgram(list):
+    """
+    A derivation of a Program, see Replay, that compiles itself \
+to a Python function the first time it is called.
+
+    """
+    __slots__ = ("function",)
+
+    def __init__(self, derivation):
+        """
+        CompiledProgram(derivation) -> CompiledProgram
+
+        Wraps the derivation [CT.Program, lexeme index, children].
+
+        """
+        super().__init__(derivation)
+        self.function = None
+
+    def __call__(self, charcoal):
+        if self.function is None:
+            self.function = Compile(self)
+        return self.function(charcoal)
+
+
+def Commands(derivation):
+    """
+    Commands(derivation) -> list
+
+    Returns the derivations of the commands in a Program, \
+NonEmptyProgram or Body, without recursing down the program.
+
+    """
+    commands = []
+    while derivation:
+        token, lexeme_index, children = derivation
+        if token == CT.Body:
+            if lexeme_index == 2:
+                return commands + [children[0]]
+            derivation = children[1]
+        elif token == CT.Program and lexeme_index == 1:
+            return commands
+        else:
+            commands += [children[0]]
+            derivation = children[2] if len(children) > 2 else None
+    return commands
+
+
+class Compiler(object):
+    """
+    Turns the derivation of a Program into Python source, \
+with native loops for For and While and native branches for If, \
+and every other command called as its closure, see Constant.
+
+    Literals, variables and operators with strict arguments \
+in the expressions of those commands are inlined.
+
+    """
+    __slots__ = ("lines", "constants", "processor")
+
+    def __init__(self, processor=InterpreterProcessor):
+        """
+        Compiler(processor=InterpreterProcessor) -> Compiler
+
+        Creates a compiler with no source yet, calling commands \
+as their closures from processor.
+
+        """
+        self.lines = ["def program(c):"]
+        self.constants = {}
+        self.processor = processor
+
+    def Constant(self, derivation):
+        """
+        Constant(derivation) -> str
+
+        Returns the name of a new constant holding \
+the closure for derivation from the processor.
+
+        """
+        name = "k%d" % len(self.constants)
+        self.constants[name] = Replay(derivation, self.processor)
+        return name
+
+    def Value(self, value):
+        """
+        Value(value) -> str
+
+        Returns the name of a new constant holding value.
+
+        """
+        name = "k%d" % len(self.constants)
+        self.constants[name] = value
+        return name
+
+    def Expression(self, derivation, depth=0):
+        """
+        Expression(derivation, depth=0) -> str
+
+        Returns Python source evaluating the Expression derivation.
+
+        """
+        token, lexeme_index, children = derivation
+        if token != CT.Expression or depth > max_expression_depth:
+            return self.Constant(derivation) + "(c)"
+        if lexeme_index in (NUMBER, STRING):
+            return self.Value(children[0]["value"])
+        if lexeme_index == NAME:
+            return "c.Retrieve(%s)" % self.Value(children[0]["value"])
+        if lexeme_index in OPERATORS:
+            return "%s(%s, c)" % (self.Constant(children[0]), ", ".join(
+                self.Expression(child, depth + 1) for child in children[1:-1]
+            ))
+        return self.Constant(derivation) + "(c)"
+
+    def Emit(self, depth, *lines):
+        """
+        Emit(depth, *lines)
+
+        Adds lines to the source, indented to the given depth.
+
+        """
+        self.lines += ["    " * depth + line for line in lines]
+
+    def Block(self, derivation, depth):
+        """
+        Block(derivation, depth)
+
+        Adds the commands in derivation to the source at the given depth.
+
+        """
+        commands = Commands(derivation)
+        if not commands:
+            self.Emit(depth, "pass")
+        for command in commands:
+            self.Command(command, depth)
+
+    def Command(self, command, depth):
+        """
+        Command(command, depth)
+
+        Adds the command derivation to the source at the given depth.
+
+        """
+        lexeme_index, children = command[1], command[2]
+        if depth > max_depth or lexeme_index not in (
+            FOR, WHILE, IF_ELSE, IF
+        ):
+            self.Emit(depth, self.Constant(command) + "(c)")
+            return
+        names = {
+            "condition": self.Expression(children[1]), "n": len(self.lines)
+        }
+        # Calling the Charcoal method would have reset last_printed
+        self.Emit(depth, "c.last_printed = None")
+        if lexeme_index == FOR:
+            self.Emit(depth, *(line % names for line in (
+                "items%(n)s = %(condition)s",
+                "items%(n)s = c.LoopItems(items%(n)s)",
+                "scope%(n)s, variable%(n)s = c.EnterLoop()",
+                "frame%(n)s = scope%(n)s.lookup",
+                "limits%(n)s = c.limits",
+                "for item%(n)s in items%(n)s:",
+                "    if limits%(n)s:",
+                "        c.CheckLimits()",
+                "    frame%(n)s[variable%(n)s] = item%(n)s"
+            )))
+            self.Block(children[2], depth + 1)
+            self.Emit(depth, "c.scope = c.scope.parent")
+        elif lexeme_index == WHILE:
+            self.Emit(depth, *(line % names for line in (
+                "scope%(n)s, variable%(n)s = c.EnterLoop()",
+                "frame%(n)s = scope%(n)s.lookup",
+                "limits%(n)s = c.limits",
+                "frame%(n)s[variable%(n)s] = %(condition)s",
+                "while frame%(n)s[variable%(n)s]:",
+                "    if limits%(n)s:",
+                "        c.CheckLimits()"
+            )))
+            self.Block(children[2], depth + 1)
+            self.Emit(
+                depth + 1,
+                "frame%(n)s[variable%(n)s] = %(condition)s" % names
+            )
+            self.Emit(depth, "c.scope = c.scope.parent")
+        else:
+            self.Emit(depth, "if %(condition)s:" % names)
+            self.Block(children[2], depth + 1)
+            if lexeme_index == IF_ELSE:
+                self.Emit(depth, "else:")
+                self.Block(children[3], depth + 1)
+
+    def Source(self):
+        """
+        Source() -> str
+
+        Returns the source so far.
+
+        """
+        return "\n".join(self.lines) + "\n"
+
+
+def Compile(derivation, processor=InterpreterProcessor):
+    """
+    Compile(derivation, processor=InterpreterProcessor) -> function
+
+    Returns the Program given as a derivation, see Replay, \
+compiled once to a Python function taking a Charcoal object, \
+calling the closures processor returns for what is not inlined.
+
+    The source of the function is in its source attribute.
+
+    """
+    compiler = Compiler(processor)
+    compiler.Block(derivation, 1)
+    source = compiler.Source()
+    namespace = dict(compiler.constants)
+    exec(compile(source, "<charcoal>", "exec"), namespace)
+    program = namespace["program"]
+    program.source = source
+    return program
+
+
+CompilerProcessor = dict(DerivationProcessor)
+CompilerProcessor[CT.Program] = [
+    lambda r: CompiledProgram([CT.Program, 0, r]),
+    lambda r: CompiledProgram([CT.Program, 1, r])
+]
@@ -2,8 +2,15 @@ from codepage import (
     OrdinalLookup, Codepage, rCommand, InCodepage, ReverseLookup
 )
 from string import ascii_lowercase, ascii_uppercase, digits
+from diskcache import DiskCache
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import groupby
+from math import log
+import json
 import re
 import lzma
+import zlib
 try:
     import brotli
 except:
@@ -29,6 +36,197 @@ CHARSET_ENCODING = 122
 RLE_ENCODING = 123
 BROTLI_ENCODING = 124
 LZMA_ENCODING = 125
+SIMPLE_DIGITS = 64
+SIMPLE_BITS = 2048
+NEWTON_BITS = 32768
+radix_powers = {}
+DecompressedCache = OrderedDict()
+decompressed_cache_size = 1024
+decompressed_cache_store = None
+decompressed_cache_stats = {"hits": 0, "misses": 0, "store_hits": 0}
+# Bump when decompression changes, so stored literals are not reused
+decompression_version = 1
+decompression_hash = None
+CompressedCache = OrderedDict()
+compressed_cache_size = 1024
+compression_pool = None
+
+
+def FromDigits(digits, base):
+    """
+    FromDigits(digits, base) -> int
+    Returns the number with the given digits in the given base, \
+most significant first.
+
+    Long lists of digits are combined in pairs, then pairs of pairs, \
+and so on, so the work is done in a few large multiplications \
+instead of one small one per digit.
+
+    """
+    if len(digits) <= SIMPLE_DIGITS:
+        number = 0
+        for digit in digits:
+            number = number * base + digit
+        return number
+    values, power = list(digits), base
+    while len(values) > 1:
+        if len(values) % 2:
+            values.insert(0, 0)
+        values = [
+            high * power + low
+            for high, low in zip(values[::2], values[1::2])
+        ]
+        power *= power
+    return values[0]
+
+
+def Powers(base, number):
+    """
+    Powers(base, number) -> (list, list)
+    Returns the powers base, base ** 2, base ** 4 and so on, \
+up to the last one whose square is at most number, \
+along with their reciprocals, see AddReciprocals.
+
+    The powers of each base are kept, so they are only computed once.
+
+    """
+    if base not in radix_powers:
+        radix_powers[base] = ([base], [])
+    powers, reciprocals = radix_powers[base]
+    square = powers[-1] * powers[-1]
+    while square <= number:
+        powers += [square]
+        square *= square
+    AddReciprocals(powers, reciprocals)
+    count = 1
+    while count < len(powers) and powers[count] <= number:
+        count += 1
+    return powers[:count], reciprocals[:count]
+
+
+def AddReciprocals(powers, reciprocals):
+    """
+    AddReciprocals(powers, reciprocals)
+    Adds to reciprocals, for each power in powers after the ones \
+it already has, where each power is the square of the previous one, \
+a pair of the shift 2n for a power of n bits, and the floor \
+of 2 ** (2n) divided by the power, or None for powers small enough \
+to divide by directly.
+
+    Each reciprocal is found from the previous one with a step \
+of Newton's method, which only takes multiplications.
+
+    """
+    previous = reciprocals[-1] if reciprocals else None
+    for power in powers[len(reciprocals):]:
+        bits = power.bit_length()
+        if bits < NEWTON_BITS:
+            reciprocals += [None]
+            continue
+        shift = 2 * bits
+        if previous is None:
+            reciprocal = (1 << shift) // power
+        else:
+            old_shift, old_reciprocal = previous
+            reciprocal = old_reciprocal * old_reciprocal
+            if shift >= 2 * old_shift:
+                reciprocal <<= shift - 2 * old_shift
+            else:
+                reciprocal >>= 2 * old_shift - shift
+            error = (1 << shift) - power * reciprocal
+            reciprocal += (reciprocal * error) >> shift
+            reciprocal += ((1 << shift) - power * reciprocal) // power
+        previous = (shift, reciprocal)
+        reciprocals += [previous]
+
+
+def ToDigits(number, base, strip_one=False):
+    """
+    ToDigits(number, base, strip_one=False) -> list
+    Returns the digits of number in the given base, \
+most significant first.
+
+    If strip_one is true, a leading 1 is left out, \
+as compressed numbers start with a 1 to keep leading zeros.
+
+    Large numbers are split in halves, using precomputed powers \
+of the base and their reciprocals, so that the work is done \
+in a few large multiplications instead of one division per digit.
+
+    """
+    if strip_one and number < 2:
+        return []
+    if number.bit_length() <= SIMPLE_BITS:
+        digits = []
+        while number:
+            digits += [number % base]
+            number //= base
+        digits.reverse()
+    else:
+        powers, reciprocals = Powers(base, number)
+        digits = []
+        SplitDigits(
+            number, len(powers) - 1, base, powers, reciprocals, digits
+        )
+        start = 0
+        while digits[start] == 0:
+            start += 1
+        digits = digits[start:]
+    if strip_one and digits[0] == 1:
+        return digits[1:]
+    return digits
+
+
+def SplitDigits(number, level, base, powers, reciprocals, digits):
+    """
+    SplitDigits(number, level, base, powers, reciprocals, digits)
+    Adds to digits the 2 ** (level + 1) digits of number, \
+which must be less than the square of powers[level], \
+padded with leading zeros.
+
+    """
+    if powers[level].bit_length() <= SIMPLE_BITS:
+        chunk = []
+        for _ in range(2 << level):
+            chunk += [number % base]
+            number //= base
+        chunk.reverse()
+        digits += chunk
+        return
+    power = powers[level]
+    if reciprocals[level] is None:
+        high, low = divmod(number, power)
+    else:
+        shift, reciprocal = reciprocals[level]
+        high = (number * reciprocal) >> shift
+        low = number - high * power
+        if low < 0 or low >= power:
+            extra, low = divmod(low, power)
+            high += extra
+    SplitDigits(high, level - 1, base, powers, reciprocals, digits)
+    SplitDigits(low, level - 1, base, powers, reciprocals, digits)
+
+
+def CodepageDigits(string):
+    """
+    CodepageDigits(string) -> list
+    Returns the base 255 digits encoded by the characters of string.
+
+    """
+    digits = []
+    for character in string:
+        ordinal = OrdinalLookup.get(character, ord(character))
+        digits += [ordinal - (ordinal > gap)]
+    return digits
+
+
+def CodepageString(number):
+    """
+    CodepageString(number) -> str
+    Returns number encoded in base 255 using the codepage without ”.
+
+    """
+    return "".join([Codepage[digit] for digit in ToDigits(number, 255)])
 
 
 def Escaped(string):
@@ -44,14 +242,94 @@ def Escaped(string):
         string = "´" + string
     return re.sub("\r", "⸿", re.sub("\n", "¶", string))
 
+
+def SetCompressionPool(workers=0, processes=False):
+    """
+    SetCompressionPool(workers=0, processes=False)
+
+    Makes Compressed try compression methods at once \
+in a pool of the given number of threads, or processes if processes \
+is true. If workers is 0, they are tried one at a time.
+
+    """
+    global compression_pool
+    if compression_pool:
+        compression_pool.shutdown()
+    compression_pool = workers and (
+        ProcessPoolExecutor if processes else ThreadPoolExecutor
+    )(workers)
+
+
 def Compressed(string):
     """
     Compressed(string) -> str
     Returns the shortest Charcoal compressed literal of the given string.
 
+    Results are cached by string.
+
     """
     if not string:
         return "””"
+    if string in CompressedCache:
+        CompressedCache.move_to_end(string)
+        return CompressedCache[string]
+    result = SearchCompressed(string)
+    CompressedCache[string] = result
+    while len(CompressedCache) > compressed_cache_size:
+        CompressedCache.popitem(last=False)
+    return result
+
+
+def DigitsBound(count, base):
+    """
+    DigitsBound(count, base) -> int
+    Returns a lower bound on the number of base 255 digits \
+of a positive number at least base ** count.
+
+    """
+    if base < 2:
+        return 1
+    return int(count * log(base) / log(255) - 1e-6) + 1
+
+
+def CompressionCandidates(string):
+    """
+    CompressionCandidates(string) -> list
+    Returns the compression methods for the given printable ASCII string, \
+as (opening delimiter, function, lower bound on length) tuples, \
+in the order they win ties in.
+
+    """
+    characters = set(string)
+    length, distinct = len(string), len(characters)
+    runs = sum(
+        (len(list(group)) + 31) // 32 for _, group in groupby(string)
+    )
+    string_base = max(map(default_charset.index, characters)) + 1
+    return [
+        ("“", CompressString, 1 + DigitsBound(length, string_base)),
+        ("”", CompressPermutations, 2 + DigitsBound(length, distinct)),
+        ("”", CompressCharset, 3 + DigitsBound(length, distinct)),
+        ("”", CompressRLE, 1 + DigitsBound(runs, 97 * 32)),
+        # Any brotli stream takes at least a byte, any raw LZMA2 stream
+        # with data takes a chunk header, a byte and an end marker
+        ("”", CompressBrotli, 1 + DigitsBound(1, 256)),
+        ("”", CompressLZMA, 1 + DigitsBound(5, 256))
+    ]
+
+
+def SearchCompressed(string):
+    """
+    SearchCompressed(string) -> str
+    Returns the shortest Charcoal compressed literal of the given string, \
+without caching it.
+
+    Methods whose lower bound on length is no shorter than \
+the best literal so far are skipped. If a pool is set with \
+SetCompressionPool, the remaining methods run at once, \
+and ones that have not started yet are cancelled once they cannot win.
+
+    """
     if not all(
         character == "\n" or character == "\r" or
         character >= " " and character <= "~"
@@ -62,31 +340,26 @@ def Compressed(string):
         if len(rCommand.findall(string)) < 3:
             return Escaped(string)
         return "”" + Codepage[RAW_ENCODING] + string + "”"
-    compressed_charset = CompressCharset(string)
-    compressed_rle = CompressRLE(string)
-    compressed_brotli = CompressBrotli(string)
-    compressed_lzma = CompressLZMA(string)
-    compressed_permuted = CompressPermutations(string)
-    compressed = CompressString(string)
-    string_length = len(string) - 2
-    minimum_length = min(
-        len(compressed_charset), len(compressed_rle), len(compressed_brotli),
-        len(compressed_lzma), len(compressed_permuted), len(compressed),
-        string_length
-    )
-    if string_length == minimum_length:
-        return Escaped(string)
-    if len(compressed) == minimum_length:
-        return "“" + compressed + "”"
-    if len(compressed_permuted) == minimum_length:
-        return "”" + compressed_permuted + "”"
-    if len(compressed_charset) == minimum_length:
-        return "”" + compressed_charset + "”"
-    if len(compressed_rle) == minimum_length:
-        return "”" + compressed_rle + "”"
-    if len(compressed_brotli) == minimum_length:
-        return "”" + compressed_brotli + "”"
-    return "”" + compressed_lzma + "”"
+    best, best_length = None, len(string) - 2
+    candidates = [
+        candidate for candidate in CompressionCandidates(string)
+        if candidate[2] < best_length
+    ]
+    futures = None
+    if compression_pool and len(candidates) > 1:
+        futures = [
+            compression_pool.submit(function, string)
+            for _, function, _ in candidates
+        ]
+    for i, (delimiter, function, bound) in enumerate(candidates):
+        if bound >= best_length:
+            if futures:
+                futures[i].cancel()
+            continue
+        compressed = futures[i].result() if futures else function(string)
+        if len(compressed) < best_length:
+            best, best_length = delimiter + compressed + "”", len(compressed)
+    return best or Escaped(string)
 
 
 def CompressCharset(string):
@@ -102,25 +375,18 @@ using a character set of only the characters in the string.
     items = sorted([i for i, n in enumerate(occurrences) if n])[::-1]
     charset = "".join([chr(n + 30) if n > 1 else "\n\r"[n] for n in items])
     base = len(charset)
-    result = ""
-    number = 1
     if base == 1:
         number = len(string)
     else:
-        for character in string:
-            number = number * base + charset.index(character)
-    while number:
-        result = Codepage[number % 255] + result
-        number //= 255
-    number = 1
-    length = 0
-    for character in charset:
-        number = number * 97 + default_charset.index(character)
-    while number:
-        result = Codepage[number % 255] + result
-        length += 1
-        number //= 255
-    return Codepage[CHARSET_ENCODING] + Codepage[length] + result
+        lookup = {character: i for i, character in enumerate(charset)}
+        number = FromDigits(
+            [1] + [lookup[character] for character in string], base
+        )
+    result = CodepageString(number)
+    header = CodepageString(FromDigits(
+        [1] + [default_charset.index(character) for character in charset], 97
+    ))
+    return Codepage[CHARSET_ENCODING] + Codepage[len(header)] + header + result
 
 
 def CompressRLE(string):
@@ -130,22 +396,16 @@ def CompressRLE(string):
 using run-length encoding.
 
     """
-    number, previous, count = 1, string[0], -1
+    runs, previous, count = [1], string[0], -1
     for character in string:
         if character != previous or count == 31:
-            number = number * 97 + default_charset.index(previous)
-            number = number * 32 + count
+            runs += [default_charset.index(previous) * 32 + count]
             count = 0
             previous = character
         else:
             count += 1
-    number = number * 97 + default_charset.index(string[-1])
-    number = number * 32 + count
-    result = ""
-    while number:
-        result = Codepage[number % 255] + result
-        number //= 255
-    return Codepage[RLE_ENCODING] + result
+    runs += [default_charset.index(string[-1]) * 32 + count]
+    return Codepage[RLE_ENCODING] + CodepageString(FromDigits(runs, 97 * 32))
 
 
 def CompressBrotli(string):
@@ -156,14 +416,8 @@ using Google's brotli compression method.
 
     """
     compressed = brotli.compress(string.encode("ascii"))
-    number = 1
-    for c in compressed:
-        number = number * 256 + c
-    result = ""
-    while number:
-        result = Codepage[number % 255] + result
-        number //= 255
-    return Codepage[BROTLI_ENCODING] + result
+    number = int.from_bytes(b"\x01" + compressed, "big")
+    return Codepage[BROTLI_ENCODING] + CodepageString(number)
 
 
 def CompressLZMA(string):
@@ -178,14 +432,8 @@ using the lzstring compression method.
         format=lzma.FORMAT_RAW,
         filters=[{'id': lzma.FILTER_LZMA2, 'preset': 9 | lzma.PRESET_EXTREME}]
     )
-    number = 1
-    for c in compressed:
-        number = number * 256 + c
-    result = ""
-    while number:
-        result = Codepage[number % 255] + result
-        number //= 255
-    return Codepage[LZMA_ENCODING] + result
+    number = int.from_bytes(b"\x01" + compressed, "big")
+    return Codepage[LZMA_ENCODING] + CodepageString(number)
 
 
 def CompressPermutations(string):
@@ -258,16 +506,66 @@ def Compress(ordinals):
     Returns without delimiters the given string compressed.
 
     """
-    base, result, number = max(ordinals) + 1, "", 1
+    base = max(ordinals) + 1
     if base == 1:
         number = len(ordinals)
     else:
-        for ordinal in ordinals:
-            number = number * base + ordinal
-    while number:
-        result = Codepage[number % 255] + result
-        number //= 255
-    return Codepage[base - 1] + result
+        number = FromDigits([1] + ordinals, base)
+    return Codepage[base - 1] + CodepageString(number)
+
+
+def SetDecompressedCache(size=1024, directory=None):
+    """
+    SetDecompressedCache(size=1024, directory=None)
+    Sets how many decompressed literals Decompressed keeps in memory, \
+and the directory they are stored in so later processes can skip \
+decompressing them. If directory is None, they are not stored on disk.
+
+    """
+    global decompressed_cache_size, decompressed_cache_store
+    decompressed_cache_size = size
+    decompressed_cache_store = directory and DiskCache(directory)
+    ClearDecompressedCache()
+
+
+def DecompressionHash():
+    """
+    DecompressionHash() -> int
+    Returns a hash of decompression_version and of the codepage \
+and character sets literals are decompressed with, so that stored \
+decompressed literals are not reused once any of them changes.
+
+    """
+    global decompression_hash
+    if not decompression_hash:
+        decompression_hash = zlib.crc32(repr((
+            decompression_version, Codepage, default_charset,
+            default_order, sorted(charset_fragment_lookup.items())
+        )).encode("utf-8"))
+    return decompression_hash
+
+
+def ClearDecompressedCache():
+    """
+    ClearDecompressedCache()
+    Empties the in-memory cache of decompressed literals, \
+and resets its counters.
+
+    """
+    DecompressedCache.clear()
+    for key in decompressed_cache_stats:
+        decompressed_cache_stats[key] = 0
+
+
+def DecompressedCacheStats():
+    """
+    DecompressedCacheStats() -> dict
+    Returns how many literals were found in memory ("hits"), \
+how many were not ("misses"), how many of those were found on disk \
+("store_hits"), and how many are kept in memory ("size").
+
+    """
+    return dict(decompressed_cache_stats, size=len(DecompressedCache))
 
 
 def Decompressed(string):
@@ -275,6 +573,39 @@ def Decompressed(string):
     Decompressed(string) -> str
     Returns the decompressed form of the given Charcoal string.
 
+    Compressed literals are cached by their text, see SetDecompressedCache, \
+and stored on disk along with DecompressionHash.
+
+    """
+    if string == "””" or string[-1] != "”":
+        return DecompressLiteral(string)
+    if string in DecompressedCache:
+        decompressed_cache_stats["hits"] += 1
+        DecompressedCache.move_to_end(string)
+        return DecompressedCache[string]
+    decompressed_cache_stats["misses"] += 1
+    result = store_key = None
+    if decompressed_cache_store:
+        store_key = json.dumps([string, DecompressionHash()])
+        result = decompressed_cache_store.Get(store_key)
+        if result is not None:
+            decompressed_cache_stats["store_hits"] += 1
+    if result is None:
+        result = DecompressLiteral(string)
+        if store_key and result is not None:
+            decompressed_cache_store.Set(store_key, result)
+    DecompressedCache[string] = result
+    while len(DecompressedCache) > decompressed_cache_size:
+        DecompressedCache.popitem(last=False)
+    return result
+
+
+def DecompressLiteral(string):
+    """
+    DecompressLiteral(string) -> str
+    Returns the decompressed form of the given Charcoal string, \
+without caching it.
+
     """
     if string == "””":
         return ""
@@ -306,26 +637,15 @@ using a given character set, passed without delimiters.
     """
     length = OrdinalLookup.get(string[0], ord(string[0]))
     length += length <= gap
-    number = 0
-    for character in string[1:length]:
-        ordinal = OrdinalLookup.get(character, ord(character))
-        number = number * 255 + ordinal - (ordinal > gap)
-    charset = ""
-    while number > 1:
-        charset = default_charset[number % 97] + charset
-        number //= 97
-    number = 0
-    for character in string[length:]:
-        ordinal = OrdinalLookup.get(character, ord(character))
-        number = number * 255 + ordinal - (ordinal > gap)
+    number = FromDigits(CodepageDigits(string[1:length]), 255)
+    charset = "".join([
+        default_charset[digit] for digit in ToDigits(number, 97, True)
+    ])
+    number = FromDigits(CodepageDigits(string[length:]), 255)
     base = len(charset)
     if base == 1:
         return charset[0] * number
-    result = ""
-    while number > 1:
-        result = charset[number % base] + result
-        number //= base
-    return result
+    return "".join([charset[digit] for digit in ToDigits(number, base, True)])
 
 
 def DecompressRLE(string):
@@ -335,17 +655,25 @@ def DecompressRLE(string):
 using run-length encoding, passed without delimiters.
 
     """
-    number = 0
-    for character in string:
-        ordinal = OrdinalLookup.get(character, ord(character))
-        number = number * 255 + ordinal - (ordinal > gap)
-    result = ""
-    while number > 1:
-        count = number % 32
-        number //= 32
-        result = default_charset[number % 97] * (count + 1) + result
-        number //= 97
-    return result
+    number = FromDigits(CodepageDigits(string), 255)
+    return "".join([
+        default_charset[run // 32 % 97] * (run % 32 + 1)
+        for run in ToDigits(number, 97 * 32, True)
+    ])
+
+
+def CompressedBytes(string):
+    """
+    CompressedBytes(string) -> bytes
+    Returns the bytes encoded in base 255 by the given string, \
+as made by CompressBrotli and CompressLZMA.
+
+    """
+    number = FromDigits(CodepageDigits(string), 255)
+    if number < 2:
+        return b""
+    compressed = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return compressed[1:] if compressed[0] == 1 else compressed
 
 
 def DecompressBrotli(string):
@@ -355,15 +683,7 @@ def DecompressBrotli(string):
 using Google's brotli compression method., passed without delimiters.
 
     """
-    number = 0
-    for character in string:
-        ordinal = OrdinalLookup.get(character, ord(character))
-        number = number * 255 + ordinal - (ordinal > gap)
-    compressed = []
-    while number > 1:
-        compressed = [number % 256] + compressed
-        number //= 256
-    return brotli.decompress(bytes(compressed)).decode("ascii")
+    return brotli.decompress(CompressedBytes(string)).decode("ascii")
 
 
 def DecompressLZMA(string):
@@ -373,16 +693,8 @@ def DecompressLZMA(string):
 using Google's brotli compression method., passed without delimiters.
 
     """
-    number = 0
-    for character in string:
-        ordinal = OrdinalLookup.get(character, ord(character))
-        number = number * 255 + ordinal - (ordinal > gap)
-    compressed = []
-    while number > 1:
-        compressed = [number % 256] + compressed
-        number //= 256
     return lzma.decompress(
-        bytes(compressed),
+        CompressedBytes(string),
         format=lzma.FORMAT_RAW,
         filters=[{'id': lzma.FILTER_LZMA2, 'preset': 9 | lzma.PRESET_EXTREME}]
     ).decode("ascii")
@@ -426,17 +738,10 @@ def Decompress(string):
     Returns the ordinals in the original form of the given string compressed.
 
     """
-    number, result = 0, []
     base = OrdinalLookup.get(string[0], ord(string[0])) + 1
     if base > gap:
         base -= 1
-    for character in string[1:]:
-        ordinal = OrdinalLookup.get(character, ord(character))
-        number = (number * 255) + ordinal - (ordinal > gap)
+    number = FromDigits(CodepageDigits(string[1:]), 255)
     if base == 1:
         return [0] * number
-    while number > 1:
-        remainder = number % base
-        result = [remainder] + result
-        number //= base
-    return result
+    return ToDigits(number, base, True)
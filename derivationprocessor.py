@@ -0,0 +1,107 @@
+from charcoaltoken import CharcoalToken as CT
+from unicodegrammars import UnicodeGrammars
+
+
+def Node(token, lexeme_index):
+    return lambda r: [token, lexeme_index, r]
+
+
+def Leaf(token):
+    return lambda r: [{"token": token, "value": r[0]}]
+
+
+DerivationProcessor = {
+    token: [Node(token, i) for i in range(len(lexemes))]
+    for token, lexemes in UnicodeGrammars.items()
+}
+
+for token in (CT.String, CT.Number, CT.Name):
+    DerivationProcessor[token] = [Leaf(token)]
+
+
+def Replay(derivation, processor):
+    """
+    Replay(derivation, processor) -> Any
+
+    Returns what parsing would have returned using processor, given the \
+derivation returned by parsing using DerivationProcessor.
+
+    Derivations are lists [token, lexeme index, children], where children \
+are literal strings, dicts holding a String, Number or Name with its value, \
+and derivations, so they can be stored as JSON. \
+Programs may also be flattened, see FlattenDerivation.
+
+    """
+    if derivation[1] is None:
+        # A program flattened by FlattenDerivation
+        *prefixes, result = derivation[2]
+        result = Replay(result, processor)
+        for prefix in reversed(prefixes):
+            result = processor[CT.Program][0](
+                ReplayChildren(prefix, processor) + [result]
+            )
+        return result
+    chain = []
+    while (
+        derivation[0] == CT.Program and derivation[2] and
+        isinstance(derivation[2][-1], list) and
+        derivation[2][-1][0] == CT.Program
+    ):
+        # Replay the rest of a program first, without recursing down it
+        chain += [derivation]
+        derivation = derivation[2][-1]
+    token, lexeme_index, children = derivation
+    result = processor[token][lexeme_index](
+        ReplayChildren(children, processor)
+    )
+    for token, lexeme_index, children in reversed(chain):
+        result = processor[token][lexeme_index](
+            ReplayChildren(children[:-1], processor) + [result]
+        )
+    return result
+
+
+def ReplayChildren(children, processor):
+    """
+    ReplayChildren(children, processor) -> list
+
+    Returns the tokens parsing would have passed to processor, \
+given the children of a derivation.
+
+    """
+    tokens = []
+    for child in children:
+        if isinstance(child, str):
+            tokens += [child]
+        elif isinstance(child, dict):
+            tokens += processor[child["token"]][0]([child["value"]])
+        else:
+            tokens += [Replay(child, processor)]
+    return tokens
+
+
+def FlattenDerivation(derivation):
+    """
+    FlattenDerivation(derivation) -> list
+
+    Returns derivation with each chain of Programs replaced by \
+[CT.Program, None, [children, ..., last program]], where children \
+are those of each Program but the last, without the rest of the program, \
+so long programs do not nest deeply when stored as JSON.
+
+    """
+    if not isinstance(derivation, list):
+        return derivation
+    items = []
+    while (
+        derivation[0] == CT.Program and derivation[2] and
+        isinstance(derivation[2][-1], list) and
+        derivation[2][-1][0] == CT.Program
+    ):
+        items += [list(map(FlattenDerivation, derivation[2][:-1]))]
+        derivation = derivation[2][-1]
+    token, lexeme_index, children = derivation
+    derivation = [token, lexeme_index, list(map(FlattenDerivation, children))]
+    if not items:
+        return derivation
+    return [CT.Program, None, items + [derivation]]
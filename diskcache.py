@@ -0,0 +1,68 @@
+from hashlib import sha256
+import json
+import os
+
+
+class DiskCache(object):
+    """
+    A directory of JSON files, one per key, shared between processes.
+
+    """
+    __slots__ = ("directory",)
+
+    def __init__(self, directory):
+        """
+        DiskCache(directory) -> DiskCache
+
+        Creates the directory if it doesn't exist yet.
+
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def Path(self, key):
+        """
+        Path(key) -> str
+
+        Returns the path of the file that holds the value for key.
+
+        """
+        return os.path.join(
+            self.directory, sha256(key.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def Get(self, key):
+        """
+        Get(key) -> Any
+
+        Returns the value stored for key, or None if there is none.
+
+        """
+        try:
+            with open(self.Path(key), encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError, RecursionError):
+            return None
+        if not isinstance(entry, dict) or entry.get("key") != key:
+            return None
+        return entry.get("value")
+
+    def Set(self, key, value):
+        """
+        Set(key, value)
+
+        Stores value for key. The file is written to a temporary path first \
+and then renamed, so readers never see partial entries.
+
+        """
+        path = self.Path(key)
+        temporary_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump({"key": key, "value": value}, file)
+            os.replace(temporary_path, path)
+        except (OSError, ValueError, RecursionError):
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
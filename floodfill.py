@@ -0,0 +1,93 @@
+import re
+
+filled_cell = re.compile("[^\000]")
+full = 1
+
+
+def Mask(line):
+    """
+    Mask(line) -> bytearray
+
+    Returns a bytearray with a 0 for each "\\000" in line \
+and a 1 for every other cell.
+
+    """
+    return bytearray(filled_cell.sub("\001", line), "latin-1")
+
+
+def Spans(lines, indices, top, x, y):
+    """
+    Spans(lines, indices, top, x, y) -> list
+
+    Returns the runs of empty cells a fill starting at x, y reaches, \
+as (y, start x, end x) sorted top to bottom then left to right, \
+where lines, indices and top are those of a Charcoal canvas.
+
+    Each row is turned into a mask, see Mask, the first time \
+the fill reaches it, and cells are marked full as they are filled, \
+so every cell is looked at a constant number of times.
+
+    """
+    height = len(lines)
+    y_index = y - top
+    if not 0 <= y_index < height:
+        return []
+    masks = [None] * height
+    mask = masks[y_index] = Mask(lines[y_index])
+    start = x - indices[y_index]
+    if not 0 <= start < len(mask) or mask[start]:
+        return []
+    rows = {}
+    stack = [(y_index, x)]
+    while stack:
+        y_index, x = stack.pop()
+        mask, index = masks[y_index], indices[y_index]
+        start = x - index
+        if mask[start]:
+            continue
+        start = mask.rfind(full, 0, start) + 1
+        end = mask.find(full, start)
+        if end == -1:
+            end = len(mask)
+        mask[start:end] = b"\001" * (end - start)
+        start += index
+        end += index
+        rows.setdefault(y_index, []).append((start, end))
+        # Like the scanline fill this replaces, rows at or below y = height
+        # never spread downwards
+        for row in (y_index - 1, y_index + 1):
+            if row < 0 or row >= height or (
+                row > y_index and top + y_index >= height
+            ):
+                continue
+            mask = masks[row]
+            if mask is None:
+                mask = masks[row] = Mask(lines[row])
+            index = indices[row]
+            low, high = max(start - index, 0), min(end - index, len(mask))
+            position = mask.find(0, low, high) if low < high else -1
+            while position != -1:
+                stack += [(row, position + index)]
+                position = mask.find(full, position, high)
+                if position == -1:
+                    break
+                position = mask.find(0, position, high)
+    return [
+        (y_index + top, start, end)
+        for y_index in sorted(rows)
+        for start, end in sorted(rows[y_index])
+    ]
+
+
+def Cycled(string, offset, length):
+    """
+    Cycled(string, offset, length) -> str
+
+    Returns length characters of string repeated forever, \
+starting from the character at offset.
+
+    """
+    offset %= len(string)
+    return (string * ((offset + length) // len(string) + 1))[
+        offset:offset + length
+    ]
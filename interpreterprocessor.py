@@ -11,6 +11,8 @@ import re
 from math import floor, ceil
 from ast import literal_eval
 
+numeric_types = {int, float}
+
 
 def FindAll(haystack, needle):
     r = []
@@ -54,6 +56,17 @@ def iter_apply(iterable, function):
     return clone
 
 
+def IsNumeric(item):
+    """
+    IsNumeric(item) -> bool
+
+    Returns whether item is a list holding only ints and floats, \
+which operators can map over without checking each element.
+
+    """
+    return type(item) == list and set(map(type, item)) <= numeric_types
+
+
 def itersplit(iterable, number):
     result = []
     while len(iterable):
@@ -76,6 +89,8 @@ def product(item):
 
 
 def Negate(item):
+    if IsNumeric(item):
+        return [-element for element in item]
     if isinstance(item, Expression):
         item = item.run()
     if isinstance(item, String):
@@ -90,6 +105,8 @@ def Negate(item):
 
 
 def Abs(item):
+    if IsNumeric(item):
+        return [abs(element) for element in item]
     if isinstance(item, Expression):
         item = item.run()
     if isinstance(item, String):
@@ -165,6 +182,14 @@ def Product(item):
 
 def vectorize(fn, afn=None, cast_string=True):
     def vectorized(left, right, c):
+        if type(right) in numeric_types and IsNumeric(left):
+            return [fn(item, right, c) for item in left]
+        if type(left) in numeric_types and IsNumeric(right):
+            return [fn(left, item, c) for item in right]
+        if not afn and IsNumeric(left) and IsNumeric(right):
+            return [
+                fn(item, other, c) for item, other in zip(left, right)
+            ]
         if isinstance(left, String):
             left = str(left)
         if isinstance(right, String):
@@ -207,6 +232,8 @@ def vectorize(fn, afn=None, cast_string=True):
 
 
 def Incremented(item):
+    if IsNumeric(item):
+        return [element + 1 for element in item]
     if isinstance(item, Expression):
         item = item.run()
     if isinstance(item, String):
@@ -221,6 +248,8 @@ def Incremented(item):
 
 
 def Decremented(item):
+    if IsNumeric(item):
+        return [element - 1 for element in item]
     if isinstance(item, Expression):
         item = item.run()
     if isinstance(item, String):
@@ -235,6 +264,8 @@ def Decremented(item):
 
 
 def Doubled(item):
+    if IsNumeric(item):
+        return [element * 2 for element in item]
     if isinstance(item, Expression):
         item = item.run()
     if isinstance(item, String):
@@ -249,6 +280,10 @@ def Doubled(item):
 
 
 def Halved(item):
+    if IsNumeric(item):
+        return [
+            element / 2 if element % 2 else element // 2 for element in item
+        ]
     if isinstance(item, Expression):
         item = item.run()
     if isinstance(item, String):
@@ -263,6 +298,8 @@ def Halved(item):
 
 
 def SquareRoot(item):
+    if IsNumeric(item):
+        return [element ** 0.5 for element in item]
     if isinstance(item, Expression):
         item = item.run()
     if isinstance(item, String):
@@ -388,6 +425,54 @@ def direction(dir):
         else:
             return 0
 
+
+class Commands(object):
+    """
+    A program, as its first command and the rest of the program, \
+that runs its commands one after another in a loop \
+rather than calling the rest of the program from the first command.
+
+    """
+    __slots__ = ("command", "rest", "commands")
+
+    def __init__(self, command=None, rest=None):
+        """
+        Commands(command=None, rest=None) -> Commands
+
+        Creates a program running command then rest, \
+or an empty program if command is None.
+
+        """
+        self.command = command
+        self.rest = rest
+        self.commands = None
+
+    def Flatten(self):
+        """
+        Flatten() -> list
+
+        Returns every command in the program, in order.
+
+        """
+        commands, program = [], self
+        while isinstance(program, Commands):
+            if program.commands is not None:
+                return commands + program.commands
+            if program.command is None:
+                break
+            commands += [program.command]
+            program = program.rest
+        else:
+            commands += [program]
+        return commands
+
+    def __call__(self, c):
+        commands = self.commands
+        if commands is None:
+            commands = self.commands = self.Flatten()
+        for command in commands:
+            command(c)
+
 InterpreterProcessor = {
     CT.Arrow: [
         lambda r: lambda c: Direction.left,
@@ -715,11 +800,11 @@ InterpreterProcessor = {
     ],
 
     CT.Program: [
-        lambda r: lambda c: ((r[0](c) or True) and r[2](c)),
-        lambda r: lambda c: None
+        lambda r: Commands(r[0], r[2]),
+        lambda r: Commands()
     ],
     CT.NonEmptyProgram: [
-        lambda r: lambda c: ((r[0](c) or True) and r[2](c)),
+        lambda r: Commands(r[0], r[2]),
         lambda r: lambda c: r[0](c)
     ],
     CT.Body: [
@@ -0,0 +1,674 @@
+from charcoaltoken import CharcoalToken as CT
+from interpreterprocessor import InterpreterProcessor
+from derivationprocessor import DerivationProcessor, Replay
+from compiler import Commands, Compile
+from string import ascii_lowercase, ascii_uppercase
+
+NUMBER, STRING, NAME = 0, 1, 2
+LAZY_TERNARY, LAZY_BINARY = (12, 21), (14, 23)
+STRICT = (11, 13, 15, 17, 20, 22, 24, 26)
+FOR, WHILE, IF_ELSE, IF = 91, 92, 93, 94
+LAMBDAS, OTHER_OPERATOR = (7, 8), 9
+# OtherOperators that evaluate their body once per item: Ｅ, ⭆, ⊙, ⬤ and Φ
+MAPS = (1, 2, 3, 4, 5)
+OR = 1
+MULTIPLY, DIVIDE, FLOAT_DIVIDE, MODULO, POWER = 2, 3, 4, 5, 13
+PADS = (20, 21)
+# Operators that only depend on their arguments, by token,
+# and those that also call pure methods of the Charcoal object
+pure_operators = {
+    CT.Unary: {0, 1, 2, 7, 8, 9, 10, 12, 19, 20, 21, 22, 23, 24, 25, 26, 28},
+    CT.Binary: {5, 6, 7, 8, 9, 10, 13, 14, 16, 19, 20, 21, 22, 26},
+    CT.Ternary: {0},
+    CT.Quarternary: {0}
+}
+charcoal_operators = {CT.Unary: {3, 11}, CT.Binary: {0, 1, 2, 3, 4}}
+# Commands and operators that can run code assigning any variable
+dynamic = {
+    CT.Command: {3, 97, 119, 120, 125},
+    CT.OtherOperator: {6, 7, 8},
+    CT.Unary: {5, 27}
+}
+# Variables every canvas starts with that hold immutable values
+preset_variables = {
+    "γ": "".join(map(chr, range(32, 127))),
+    "β": ascii_lowercase,
+    "α": ascii_uppercase,
+    "ω": "",
+    "ψ": "\000",
+    "χ": 10,
+    "φ": 1000
+}
+max_folded_length = 65536
+unknown = object()
+volatile = object()
+# Tokens of the nodes Hoist adds, replayed by HoistingProcessor
+HOISTED, HOISTING, INVARIANTS = "Hoisted", "Hoisting", "Invariants"
+
+
+class OptimizedProgram(list):
+    """
+    A derivation of a Program, see Replay, that optimizes itself, \
+see Optimize, the first time it is called.
+
+    Canvases whose preset variables no longer hold their initial values \
+run the program optimized without folding them instead.
+
+    """
+    __slots__ = ("function", "constants", "fallback")
+    compiled = False
+
+    def __init__(self, derivation):
+        """
+        OptimizedProgram(derivation) -> OptimizedProgram
+
+        Wraps the derivation [CT.Program, lexeme index, children].
+
+        """
+        super().__init__(derivation)
+        self.function = None
+        self.constants = None
+        self.fallback = None
+
+    def __call__(self, charcoal):
+        if self.function is None:
+            self.constants = Presets(self)
+            self.function = self.Build(charcoal, self.constants)
+        if Holds(charcoal.scope, self.constants):
+            return self.function(charcoal)
+        # The canvas was used before, so the presets may have been assigned
+        if self.fallback is None:
+            self.fallback = self.Build(charcoal, {})
+        return self.fallback(charcoal)
+
+    def Build(self, charcoal, constants):
+        """
+        Build(charcoal, constants) -> function
+
+        Returns the program optimized assuming the variables \
+in the dict constants hold their values, see Optimize, as a function \
+taking a Charcoal object.
+
+        """
+        derivation = Optimize(self, charcoal, constants)
+        if self.compiled:
+            return Compile(derivation, HoistingProcessor)
+        return Replay(derivation, HoistingProcessor)
+
+
+class CompiledOptimizedProgram(OptimizedProgram):
+    """
+    An OptimizedProgram that is compiled after it is optimized, \
+see Compile.
+
+    """
+    __slots__ = ()
+    compiled = True
+
+
+def Assigned(derivation):
+    """
+    Assigned(derivation) -> set
+
+    Returns the names of the variables derivation may assign, \
+or None if it may run code assigning any variable.
+
+    """
+    names = set()
+    stack = [derivation]
+    while stack:
+        token, lexeme_index, children = stack.pop()
+        if lexeme_index in dynamic.get(token, ()):
+            return None
+        for child in children:
+            if isinstance(child, list):
+                stack += [child]
+            elif (
+                isinstance(child, dict) and child["token"] == CT.Name and
+                not (token == CT.Expression and lexeme_index == NAME)
+            ):
+                names.add(child["value"])
+    return names
+
+
+def Presets(derivation):
+    """
+    Presets(derivation) -> dict
+
+    Returns the preset variables the Program derivation never assigns, \
+with their initial values.
+
+    """
+    assigned = Assigned(derivation)
+    if assigned is None:
+        return {}
+    return {
+        name: value for name, value in preset_variables.items()
+        if name not in assigned
+    }
+
+
+def Holds(scope, constants):
+    """
+    Holds(scope, constants) -> bool
+
+    Returns whether every variable in the dict constants \
+holds its value in scope.
+
+    """
+    for name, value in constants.items():
+        if name not in scope:
+            return False
+        current = scope[name]
+        if type(current) is not type(value) or current != value:
+            return False
+    return True
+
+
+def Value(derivation):
+    """
+    Value(derivation) -> Any
+
+    Returns the value of the Expression or ExpressionOrEOF derivation \
+if it is a literal, else unknown.
+
+    """
+    token, lexeme_index, children = derivation
+    if token == CT.ExpressionOrEOF:
+        if lexeme_index:
+            return unknown
+        token, lexeme_index, children = children[0]
+    if token == CT.Expression and lexeme_index in (NUMBER, STRING):
+        return children[0]["value"]
+    return unknown
+
+
+def Literal(value):
+    """
+    Literal(value) -> list
+
+    Returns the derivation of an Expression that is the literal value, \
+a number or a string.
+
+    """
+    if isinstance(value, str):
+        return [CT.Expression, STRING, [
+            {"token": CT.String, "value": value}, [CT.S, 1, []]
+        ]]
+    return [CT.Expression, NUMBER, [
+        {"token": CT.Number, "value": value}, [CT.S, 1, []]
+    ]]
+
+
+def Bounded(token, lexeme_index, values):
+    """
+    Bounded(token, lexeme_index, values) -> bool
+
+    Returns whether applying the operator to values \
+takes time and space not much more than that taken by values.
+
+    """
+    if token != CT.Binary:
+        return True
+    left, right = values
+    if lexeme_index in (MULTIPLY, DIVIDE, FLOAT_DIVIDE) and (
+        isinstance(left, str) != isinstance(right, str)
+    ):
+        string, number = (left, right) if isinstance(left, str) else (
+            right, left
+        )
+        if lexeme_index != MULTIPLY:
+            number = 1 / number
+        return len(string) * (1 + abs(number)) <= max_folded_length
+    if lexeme_index == POWER:
+        return not (
+            isinstance(left, int) and isinstance(right, int) and
+            right * left.bit_length() > max_folded_length * 8
+        )
+    if lexeme_index in PADS:
+        return int(right) <= max_folded_length
+    if lexeme_index == MODULO:
+        return not isinstance(left, str)
+    return True
+
+
+class Invariant(object):
+    """
+    A pure expression a loop repeats without assigning the variables \
+it reads, whose value is kept from the first time it is evaluated \
+until the loop is entered again, see Hoist.
+
+    """
+    __slots__ = ("names", "value")
+
+    def __init__(self, names):
+        """
+        Invariant(names) -> Invariant
+
+        Creates an invariant expression reading the variables in names.
+
+        """
+        self.names = names
+        self.value = volatile
+
+    def Enter(self, scope):
+        """
+        Enter(scope)
+
+        Forgets the value, keeping the next one only if every variable \
+the expression reads holds a number or a string in scope, \
+the scope the loop is entered from, so none of them is \
+a loop variable or input.
+
+        """
+        for name in self.names:
+            if name not in scope or type(scope[name]) not in (int, float, str):
+                self.value = volatile
+                return
+        self.value = unknown
+
+    def Evaluate(self, expression, charcoal):
+        """
+        Evaluate(expression, charcoal) -> Any
+
+        Returns the value of the expression closure, \
+evaluating it only if it is not kept.
+
+        """
+        value = self.value
+        if value is volatile:
+            return expression(charcoal)
+        if value is unknown:
+            value = expression(charcoal)
+            if type(value) in (int, float, str):
+                self.value = value
+            else:
+                self.value = volatile
+            return value
+        # Retrieving the variables would have reset last_printed
+        charcoal.last_printed = None
+        return value
+
+
+class Optimizer(object):
+    """
+    Rewrites the derivation of a Program, folding operators \
+with literal arguments and the preset variables it never assigns \
+into literals, and removing the branches of If, ⎇, ∧ and ∨ \
+and the While loops whose conditions are then literals.
+
+    Pure expressions that For, While and the looping operators \
+repeat without assigning the variables they read are hoisted, \
+see Hoist.
+
+    Operators with side effects, and those that read input, \
+random numbers or the canvas, are left alone.
+
+    """
+    __slots__ = ("charcoal", "constants", "variables")
+
+    def __init__(self, charcoal=None, constants=None, variables=None):
+        """
+        Optimizer(charcoal=None, constants=None, variables=None) -> Optimizer
+
+        Creates an optimizer replacing the variables in the dict constants \
+with their values, that calls the pure methods of charcoal \
+to fold operators using them if charcoal is not None.
+
+        Only expressions reading the variables in the set variables, \
+those the program assigns itself, are hoisted, as the others \
+may be loop variables.
+
+        """
+        self.charcoal = charcoal
+        self.constants = constants or {}
+        self.variables = variables or set()
+
+    def Node(self, derivation):
+        """
+        Node(derivation) -> Any
+
+        Returns the child of a derivation, optimized.
+
+        """
+        if not isinstance(derivation, list):
+            return derivation
+        token, lexeme_index, children = derivation
+        if token == CT.Program:
+            return self.Program(derivation)
+        if token == CT.Expression:
+            return self.Expression(derivation)
+        if token == CT.Body:
+            return self.Body(derivation)
+        return [token, lexeme_index, [self.Node(child) for child in children]]
+
+    def Program(self, derivation):
+        """
+        Program(derivation) -> list
+
+        Returns the Program derivation optimized, \
+without recursing down the program.
+
+        """
+        commands = []
+        for command in Commands(derivation):
+            commands += self.Command(command)
+        return Chain(commands)
+
+    def Body(self, derivation):
+        """
+        Body(derivation) -> list
+
+        Returns the Body derivation optimized.
+
+        """
+        token, lexeme_index, children = derivation
+        if lexeme_index != 2:
+            return [
+                token, lexeme_index, [self.Node(child) for child in children]
+            ]
+        commands = self.Command(children[0])
+        if len(commands) == 1:
+            return [token, lexeme_index, [commands[0], children[1]]]
+        return [token, 0, ["«", Chain(commands), "»"]]
+
+    def Command(self, derivation):
+        """
+        Command(derivation) -> list
+
+        Returns the commands the Command derivation optimizes to.
+
+        """
+        token, lexeme_index, children = derivation
+        children = [self.Node(child) for child in children]
+        if lexeme_index in (WHILE, IF_ELSE, IF):
+            condition = Value(children[1])
+            if condition is not unknown and not condition:
+                return (
+                    Commands(children[3]) if lexeme_index == IF_ELSE else []
+                )
+            if condition is not unknown and lexeme_index != WHILE:
+                return Commands(children[2])
+        if lexeme_index == FOR:
+            return [self.Hoist([token, lexeme_index, children], 0, (2,))]
+        if lexeme_index == WHILE:
+            return [self.Hoist([token, lexeme_index, children], 1, (1, 2))]
+        return [[token, lexeme_index, children]]
+
+    def Expression(self, derivation):
+        """
+        Expression(derivation) -> list
+
+        Returns the Expression derivation optimized.
+
+        """
+        token, lexeme_index, children = derivation
+        if lexeme_index == NAME:
+            name = children[0]["value"]
+            if name in self.constants:
+                return Literal(self.constants[name])
+            return derivation
+        children = [self.Node(child) for child in children]
+        if lexeme_index in STRICT:
+            value = self.Fold(children[0], children[1:-1])
+            if value is not unknown:
+                return Literal(value)
+        elif lexeme_index in LAZY_TERNARY:
+            condition = Value(children[1])
+            if condition is not unknown:
+                return Unwrap(children[2] if condition else children[3]) or [
+                    token, lexeme_index, children
+                ]
+        elif lexeme_index in LAZY_BINARY:
+            left = Value(children[1])
+            if left is not unknown:
+                if bool(left) == (children[0][1] == OR):
+                    return Literal(left)
+                return Unwrap(children[2]) or [token, lexeme_index, children]
+        elif lexeme_index == OTHER_OPERATOR and children[0][1] in MAPS:
+            children[0] = self.Hoist(children[0], 0, (2,))
+        return [token, lexeme_index, children]
+
+    def Hoist(self, derivation, lexeme_index, repeated):
+        """
+        Hoist(derivation, lexeme_index, repeated) -> list
+
+        Returns the derivation of a loop, whose first child is evaluated \
+on entry and whose children at the indices in repeated are evaluated \
+on every iteration, with the invariant expressions in those children \
+wrapped in HOISTED nodes, see Invariant.
+
+        The first child is wrapped in a HOISTING node entering them, \
+with lexeme_index 0 if it is evaluated before the loop opens its scope, \
+and 1 if it is the condition of a While loop.
+
+        """
+        token, loop_index, children = derivation
+        assigned = Assigned(derivation)
+        if assigned is None:
+            return derivation
+        invariants = []
+        children = list(children)
+        for index in repeated:
+            children[index] = self.Invariants(
+                children[index], assigned, invariants
+            )[0]
+        if not invariants:
+            return derivation
+        children[1] = [HOISTING, lexeme_index, [
+            children[1], {"token": INVARIANTS, "value": invariants}
+        ]]
+        return [token, loop_index, children]
+
+    def Invariants(self, derivation, assigned, invariants):
+        """
+        Invariants(derivation, assigned, invariants) -> (Any, set)
+
+        Returns the child of a derivation with its largest pure expressions \
+reading variables, but none in assigned, wrapped in HOISTED nodes, \
+adding their Invariants to the list invariants.
+
+        Also returns the variables the child reads if it is itself \
+such an expression, so its parent can be hoisted instead, else None.
+
+        """
+        if not isinstance(derivation, list):
+            return derivation, None
+        token, lexeme_index, children = derivation
+        if token == HOISTED:
+            names = children[1]["value"].names
+            return derivation, None if names & assigned else names
+        if token == CT.Program:
+            return Chain([
+                self.Invariants(command, assigned, invariants)[0]
+                for command in Commands(derivation)
+            ]), None
+        if token == CT.Expression:
+            if lexeme_index in (NUMBER, STRING):
+                return derivation, set()
+            if lexeme_index == NAME:
+                name = children[0]["value"]
+                if name in assigned or name not in self.variables:
+                    return derivation, None
+                return derivation, {name}
+            if lexeme_index in LAMBDAS:
+                return derivation, None
+        results = [
+            self.Invariants(child, assigned, invariants) for child in children
+        ]
+        children = [child for child, names in results]
+        if token == CT.ExpressionOrEOF and not lexeme_index:
+            return [token, lexeme_index, children], results[0][1]
+        arguments = [names for child, names in results[1:-1]]
+        if token == CT.Expression and lexeme_index in STRICT and (
+            children[0][1] in pure_operators.get(children[0][0], ()) or
+            children[0][1] in charcoal_operators.get(children[0][0], ())
+        ) and None not in arguments:
+            return [token, lexeme_index, children], set().union(*arguments)
+        for index, (child, names) in enumerate(results):
+            if names and Hoistable(child):
+                invariant = Invariant(names)
+                invariants += [invariant]
+                children[index] = [HOISTED, 0, [
+                    child, {"token": INVARIANTS, "value": invariant}
+                ]]
+        return [token, lexeme_index, children], None
+
+    def Fold(self, operator, arguments):
+        """
+        Fold(operator, arguments) -> Any
+
+        Returns the result of applying the operator derivation \
+to the arguments if they are all literals, the operator is pure \
+and the result is a number or a string, else unknown.
+
+        """
+        token, lexeme_index = operator[0], operator[1]
+        if not (
+            lexeme_index in pure_operators.get(token, ()) or
+            self.charcoal is not None and
+            lexeme_index in charcoal_operators.get(token, ())
+        ):
+            return unknown
+        values = [Value(argument) for argument in arguments]
+        if unknown in values:
+            return unknown
+        try:
+            if not Bounded(token, lexeme_index, values):
+                return unknown
+            value = Replay(operator, InterpreterProcessor)(
+                *values, self.charcoal
+            )
+        except Exception:
+            return unknown
+        if type(value) in (int, float) or (
+            type(value) is str and len(value) <= max_folded_length
+        ):
+            return value
+        return unknown
+
+
+def Unwrap(derivation):
+    """
+    Unwrap(derivation) -> list
+
+    Returns the Expression in the Expression or ExpressionOrEOF \
+derivation, or None if it is EOF.
+
+    """
+    if derivation[0] == CT.ExpressionOrEOF:
+        return None if derivation[1] else derivation[2][0]
+    return derivation
+
+
+def Hoistable(derivation):
+    """
+    Hoistable(derivation) -> bool
+
+    Returns whether the Expression or ExpressionOrEOF derivation \
+applies an operator with strict arguments.
+
+    """
+    token, lexeme_index, children = derivation
+    if token == CT.ExpressionOrEOF:
+        return not lexeme_index and Hoistable(children[0])
+    return token == CT.Expression and lexeme_index in STRICT
+
+
+def Chain(commands):
+    """
+    Chain(commands) -> list
+
+    Returns the derivation of the Program running the Command derivations \
+in commands in order.
+
+    """
+    program = [CT.Program, 1, []]
+    for command in reversed(commands):
+        program = [CT.Program, 0, [command, [CT.S, 1, []], program]]
+    return program
+
+
+def Optimize(derivation, charcoal=None, constants=None):
+    """
+    Optimize(derivation, charcoal=None, constants=None) -> list
+
+    Returns the derivation of a Program, see Replay, with operators \
+on literals and the preset variables it never assigns folded into literals, \
+the branches and loops whose conditions are then literals removed, \
+and the pure expressions loops repeat without assigning their variables \
+evaluated once per loop, see Optimizer.
+
+    If charcoal is not None, its pure methods are used to fold \
+arithmetic and casts too.
+
+    If constants is None, assumes the preset variables hold \
+their initial values when the program starts, see Presets, \
+else only the variables in the dict constants are folded.
+
+    The result is replayed with HoistingProcessor.
+
+    """
+    if constants is None:
+        constants = Presets(derivation)
+    variables = set(preset_variables) | (Assigned(derivation) or set())
+    return Optimizer(charcoal, constants, variables).Node(derivation)
+
+
+OptimizerProcessor = dict(DerivationProcessor)
+OptimizerProcessor[CT.Program] = [
+    lambda r: OptimizedProgram([CT.Program, 0, r]),
+    lambda r: OptimizedProgram([CT.Program, 1, r])
+]
+CompiledOptimizerProcessor = dict(DerivationProcessor)
+CompiledOptimizerProcessor[CT.Program] = [
+    lambda r: CompiledOptimizedProgram([CT.Program, 0, r]),
+    lambda r: CompiledOptimizedProgram([CT.Program, 1, r])
+]
+
+
+def Entering(r):
+    """
+    Entering(r) -> function
+
+    Returns a closure evaluating the expression a loop starts with \
+before it opens its scope, after entering the Invariants in r.
+
+    """
+    expression, invariants = r
+
+    def run(c):
+        scope = c.scope
+        for invariant in invariants:
+            invariant.Enter(scope)
+        return expression(c)
+
+    return run
+
+
+def Checking(r):
+    """
+    Checking(r) -> function
+
+    Returns a closure evaluating the condition of a While loop, \
+that enters the Invariants in r the first time it runs in a new scope.
+
+    """
+    expression, invariants = r
+    entered = [None]
+
+    def run(c):
+        scope = c.scope
+        if scope is not entered[0]:
+            entered[0] = scope
+            for invariant in invariants:
+                invariant.Enter(scope.parent)
+        return expression(c)
+
+    return run
+
+
+HoistingProcessor = dict(InterpreterProcessor)
+HoistingProcessor[HOISTED] = [lambda r: lambda c: r[1].Evaluate(r[0], c)]
+HoistingProcessor[HOISTING] = [Entering, Checking]
+HoistingProcessor[INVARIANTS] = [lambda r: r]
@@ -0,0 +1,252 @@
+from array import array
+import sys
+
+code_point_type = "I" if array("I").itemsize == 4 else "L"
+codec = "utf-32-le" if sys.byteorder == "little" else "utf-32-be"
+empty_cell = array(code_point_type, [0])
+
+
+def CodePoints(string):
+    """
+    CodePoints(string) -> array
+
+    Returns an array of the code points of string.
+
+    """
+    result = array(code_point_type)
+    result.frombytes(string.encode(codec))
+    return result
+
+
+class RowBuffer(object):
+    """
+    A mutable row of cells, stored as code points with room to grow \
+on both ends.
+
+    Cells outside the row are always "\\000".
+
+    """
+    __slots__ = ("cells", "start", "end", "string")
+
+    def __init__(self, string=""):
+        """
+        RowBuffer(string="") -> RowBuffer
+
+        Creates a row holding string.
+
+        """
+        self.cells = CodePoints(string)
+        self.start = 0
+        self.end = len(self.cells)
+        self.string = string
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __str__(self):
+        if self.string is None:
+            self.string = self.cells[self.start:self.end].tobytes().decode(
+                codec
+            )
+        return self.string
+
+    def Get(self, index):
+        """
+        Get(index) -> str
+
+        Returns the cell at the given index from the start of the row.
+
+        """
+        return chr(self.cells[self.start + index])
+
+    def Write(self, offset, string):
+        """
+        Write(offset, string) -> int
+
+        Writes string starting offset cells after the start of the row, \
+filling any gap between the row and string with "\\000".
+
+        Returns how many cells the row grew by on the left.
+
+        """
+        length = len(string)
+        grown = 0
+        if offset < 0:
+            grown = -offset
+            if self.start < grown:
+                extra = max(grown, len(self.cells))
+                self.cells = empty_cell * extra + self.cells
+                self.start += extra
+                self.end += extra
+            self.start -= grown
+            offset = 0
+        start = self.start + offset
+        end = start + length
+        if end > len(self.cells):
+            self.cells += empty_cell * max(end - len(self.cells), len(
+                self.cells
+            ))
+        if end > self.end:
+            self.end = end
+        if length == 1:
+            self.cells[start] = ord(string)
+        elif length:
+            self.cells[start:end] = CodePoints(string)
+        self.string = None
+        return grown
+
+
+class RowBuffers(object):
+    """
+    A list of rows that reads and writes like a list of strings, \
+with room to grow on both ends.
+
+    Rows are kept as strings until they are first written to, \
+then stored as RowBuffers, so wrapping a list of strings \
+does not copy any cells.
+
+    """
+    __slots__ = ("rows", "start")
+
+    def __init__(self, lines=()):
+        """
+        RowBuffers(lines=()) -> RowBuffers
+
+        Creates a list of rows holding the strings in lines.
+
+        """
+        self.rows = list(lines)
+        self.start = 0
+
+    def __len__(self):
+        return len(self.rows) - self.start
+
+    def __iter__(self):
+        return map(str, self.rows[self.start:])
+
+    def __reversed__(self):
+        return map(str, reversed(self.rows[self.start:]))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [str(row) for row in self.rows[self.start:][index]]
+        return str(self.rows[self.Index(index)])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.Compact()
+            self.rows[index] = list(value)
+        else:
+            self.rows[self.Index(index)] = value
+
+    def __delitem__(self, index):
+        self.Compact()
+        del self.rows[index]
+
+    def __add__(self, other):
+        return RowBuffers(list(self) + list(other))
+
+    def __radd__(self, other):
+        return RowBuffers(list(other) + list(self))
+
+    def __iadd__(self, other):
+        self.rows += list(other)
+        return self
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "RowBuffers(%r)" % list(self)
+
+    def reverse(self):
+        self.Compact()
+        self.rows.reverse()
+
+    def Index(self, index):
+        """
+        Index(index) -> int
+
+        Returns the position in rows of the row at the given index, \
+counting from the end if it is negative.
+
+        """
+        if index < 0:
+            index += len(self)
+            if index < 0:
+                raise IndexError("row index out of range")
+        return self.start + index
+
+    def Compact(self):
+        """
+        Compact()
+
+        Drops the room left for rows before the first row.
+
+        """
+        if self.start:
+            del self.rows[:self.start]
+            self.start = 0
+
+    def Prepend(self, lines):
+        """
+        Prepend(lines)
+
+        Adds the strings in lines before the first row, \
+growing the room before it geometrically so adding rows one at a time \
+takes amortized constant time per row.
+
+        """
+        number = len(lines)
+        if self.start < number:
+            extra = max(number, len(self.rows))
+            self.rows[:0] = [""] * extra
+            self.start += extra
+        self.start -= number
+        self.rows[self.start:self.start + number] = lines
+
+    def Get(self, y_index, x_index):
+        """
+        Get(y_index, x_index) -> str
+
+        Returns the cell at the given indices, without building the row.
+
+        """
+        row = self.rows[self.start + y_index]
+        if type(row) is str:
+            return row[x_index]
+        return row.Get(x_index)
+
+    def Length(self, y_index):
+        """
+        Length(y_index) -> int
+
+        Returns the length of the row at the given index.
+
+        """
+        return len(self.rows[self.start + y_index])
+
+    def Write(self, y_index, offset, string):
+        """
+        Write(y_index, offset, string) -> int
+
+        Writes string into the row at the given index, see RowBuffer.Write.
+
+        """
+        y_index += self.start
+        row = self.rows[y_index]
+        if type(row) is str:
+            if len(string) * 4 >= len(row):
+                # Copying the row costs about as much as the write itself,
+                # so only rows written a little at a time become buffers
+                end = offset + len(string)
+                self.rows[y_index] = (
+                    row[:max(0, offset)] +
+                    "\000" * (offset - len(row)) +
+                    string +
+                    "\000" * -end +
+                    row[max(0, end):]
+                )
+                return max(0, -offset)
+            row = self.rows[y_index] = RowBuffer(row)
+        return row.Write(offset, string)
@@ -0,0 +1,168 @@
+from charcoal import (
+    Charcoal, CharcoalError, CharcoalRuntimeError, Info, Parse, ProcessInput
+)
+from charcoaltoken import CharcoalToken as CT
+from unicodegrammars import UnicodeGrammars
+from interpreterprocessor import InterpreterProcessor
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from time import perf_counter as clock
+
+
+class SessionResult(object):
+    """
+    The result of running a program in a Session.
+
+    """
+    __slots__ = (
+        "output", "canvas", "stdout", "stderr", "parse_time", "run_time"
+    )
+
+    def __init__(
+        self, output="", canvas="", stdout="", stderr="", parse_time=0,
+        run_time=0
+    ):
+        """
+        SessionResult(output="", canvas="", stdout="", stderr="", \
+parse_time=0, run_time=0) -> SessionResult
+
+        Creates a result, where output is everything the program would \
+print when run from the command line, canvas is the final state \
+of the canvas, stdout and stderr are what the program printed to them, \
+and parse_time and run_time are in seconds.
+
+        """
+        self.output = output
+        self.canvas = canvas
+        self.stdout = stdout
+        self.stderr = stderr
+        self.parse_time = parse_time
+        self.run_time = run_time
+
+    def __repr__(self):
+        return "SessionResult(%s)" % ", ".join(
+            "%s=%r" % (key, getattr(self, key)) for key in self.__slots__
+        )
+
+
+class Session(object):
+    """
+    Runs Charcoal programs one after another on a single reused canvas, \
+capturing what they print and raising CharcoalError subclasses \
+instead of exiting.
+
+    As stdout and stderr are redirected while a program runs, \
+sessions should not run at the same time in different threads.
+
+    """
+    __slots__ = (
+        "charcoal", "program", "grammars", "whitespace", "normal_encoding",
+        "verbose", "grave", "trim"
+    )
+
+    def __init__(
+        self,
+        grammars=UnicodeGrammars,
+        whitespace=False,
+        normal_encoding=False,
+        verbose=False,
+        grave=False,
+        trim=False,
+        row_buffers=False
+    ):
+        """
+        Session(grammars=UnicodeGrammars, whitespace=False, \
+normal_encoding=False, verbose=False, grave=False, trim=False, \
+row_buffers=False) -> Session
+
+        Creates a session, compiling code with the given options, \
+see Parse, and running it on a canvas with the given options, \
+see Charcoal.
+
+        """
+        self.charcoal = Charcoal(
+            info={Info.raise_errors}, trim=trim, row_buffers=row_buffers
+        )
+        self.program = None
+        self.grammars = grammars
+        self.whitespace = whitespace
+        self.normal_encoding = normal_encoding
+        self.verbose = verbose
+        self.grave = grave
+        self.trim = trim
+
+    def Compile(self, code):
+        """
+        Compile(code) -> Function
+
+        Parses code, raising CharcoalParseError if it is not valid, \
+and returns the program, which is also kept as the program \
+of the session.
+
+        Parsed programs are cached, see SetProgramCache.
+
+        """
+        stderr = StringIO()
+        with redirect_stderr(stderr):
+            self.program = Parse(
+                code, CT.Program, self.grammars, InterpreterProcessor,
+                self.whitespace, self.normal_encoding, self.verbose,
+                self.grave, strict=True
+            )
+        return self.program
+
+    def Run(self, code=None, inputs=""):
+        """
+        Run(code=None, inputs="") -> SessionResult
+
+        Runs code, a string of Charcoal code or a program returned \
+by Compile, or the program of the session if code is None, \
+on a cleared canvas with the given inputs, \
+a string as for Run or a list.
+
+        Raises CharcoalParseError if code cannot be parsed, \
+and CharcoalRuntimeError if the program fails, with the result \
+so far in the result attribute of the error.
+
+        """
+        parse_time = 0
+        if isinstance(code, str):
+            start = clock()
+            code = self.Compile(code)
+            parse_time = clock() - start
+        elif code is None:
+            code = self.program
+        if code is None:
+            raise CharcoalRuntimeError("No program to run")
+        charcoal = self.charcoal
+        charcoal.Clear()
+        charcoal.trim = self.trim
+        charcoal.ClearInputs()
+        charcoal.AddInputs(
+            list(inputs) if isinstance(inputs, list) else ProcessInput(inputs)
+        )
+        stdout, stderr = StringIO(), StringIO()
+        error = None
+        start = clock()
+        try:
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                code(charcoal)
+        except CharcoalError as caught:
+            error = caught
+        except (Exception, SystemExit) as caught:
+            error = CharcoalRuntimeError(
+                "%s: %s" % (type(caught).__name__, caught)
+            )
+            error.__cause__ = caught
+        run_time = clock() - start
+        canvas = str(charcoal)
+        result = SessionResult(
+            stdout.getvalue() + (
+                canvas if charcoal.print_at_end and error is None else ""
+            ),
+            canvas, stdout.getvalue(), stderr.getvalue(), parse_time, run_time
+        )
+        if error is not None:
+            error.result = result
+            raise error
+        return result
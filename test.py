@@ -348,6 +348,11 @@ cbabc
 *#-#*
 *****"""
         )
+        self.assertEqual(Run("aＭ¹²→bＵＢ-=¶=-"), "a=-=-=-=-=-=-b")
+        self.assertEqual(
+            Run("ＵＴ↘³Ｍ⁵←cＵＢxyz"), "yz\\\nyzx\\\nyzxy\\\nc"
+        )
+        self.assertEqual(Run("↗³ＵＢ\\"), "\\\\/\n\\/\\\n/\\\\")
 
     def test_copy(self):
         self.assertEqual(Run("Ｇ+⁵*Ｃ³¦³"), """\
@@ -1867,6 +1872,31 @@ Print('zzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzz')",
            \\//        \\//  \\     
                               \\    """)
         )
+        from compression import (
+            Decompressed, CompressString, CompressPermutations,
+            CompressCharset, CompressRLE, CompressBrotli, CompressLZMA,
+            FromDigits, ToDigits
+        )
+        string = "".join(
+            " _/\\|-\n"[i * i % 7] * (i % 5 + 1) for i in range(4000)
+        )
+        for compress, delimiter in (
+            (CompressString, "“"), (CompressPermutations, "”"),
+            (CompressCharset, "”"), (CompressRLE, "”"),
+            (CompressBrotli, "”"), (CompressLZMA, "”")
+        ):
+            self.assertEqual(
+                Decompressed(delimiter + compress(string) + "”"), string
+            )
+        number, digits = 3 ** 45000 - 1, []
+        while number:
+            digits += [number % 97]
+            number //= 97
+        digits.reverse()
+        self.assertEqual(ToDigits(3 ** 45000 - 1, 97), digits)
+        self.assertEqual(FromDigits(digits, 97), 3 ** 45000 - 1)
+        self.assertEqual(ToDigits(97 ** 3, 97, True), [0, 0, 0])
+        self.assertEqual(ToDigits(2 * 97 ** 3, 97, True), [2, 0, 0, 0])
 
     def test_python(self):
         self.assertEqual(Run("▷min⟦¹¦²⟧"), "-")
@@ -2495,6 +2525,862 @@ for (10) {
 }""", verbose=True), "------->=>")
         # TODO: document switch correctly
 
+    def test_packrat(self):
+        from charcoal import Parse, Charcoal
+        from interpreterprocessor import InterpreterProcessor
+        self.assertEqual(Run("⁺" * 40 + "¹¦" * 40 + "¹"), "-" * 41)
+        self.assertEqual(Run("⎇" * 40 + "¹¦" * 80 + "¹"), "-")
+        for code in ("Ｆ²«a¹»⁺¹¹", "⎇⁺¹¹a⎇⁰bc", "Ｆ¦α↘β"):
+            charcoal, uncached = Charcoal(), Charcoal()
+            Parse(code, processor=InterpreterProcessor)(charcoal)
+            Parse(
+                code, processor=InterpreterProcessor, packrat=False
+            )(uncached)
+            self.assertEqual(str(charcoal), str(uncached))
+
+    def test_dispatch(self):
+        from charcoal import ParseExpression, Charcoal
+        from charcoaltoken import CharcoalToken as CT
+        from unicodegrammars import UnicodeGrammars
+        from interpreterprocessor import InterpreterProcessor
+        for code in (
+            "Ｆ²«a¹»⁺¹¹", "⎇⁺¹¹a⎇⁰bc", "Ｆ¦α↘β", "↶²abc", "Ｐ↘abc",
+            "⪫⪪a b¦ c", "·⁵", "β", "¶”↶⌊÷ζＣ⁺}｜⊞κcü”", "ab⎇"
+        ):
+            charcoal, undispatched = Charcoal(), Charcoal()
+            result = ParseExpression(code, processor=InterpreterProcessor)
+            self.assertEqual(result[1], ParseExpression(
+                code, processor=InterpreterProcessor, dispatch=False
+            )[1])
+            if result[1] is not False:
+                result[0](charcoal)
+                ParseExpression(
+                    code, processor=InterpreterProcessor, dispatch=False
+                )[0](undispatched)
+                self.assertEqual(str(charcoal), str(undispatched))
+        processor = dict(InterpreterProcessor)
+        processor[CT.Command] = list(processor[CT.Command])
+        processor[CT.Command][UnicodeGrammars[CT.Command].index(["Ｄ"])] = (
+            lambda result: lambda charcoal: charcoal.Print("patched")
+        )
+        charcoal = Charcoal()
+        ParseExpression("Ｄ", processor=processor)[0](charcoal)
+        self.assertEqual(str(charcoal), "patched")
+
+    def test_program_cache(self):
+        from charcoal import (
+            Parse, Charcoal, ProgramCache, SetProgramCache, ClearProgramCache
+        )
+        from interpreterprocessor import InterpreterProcessor
+        from tempfile import TemporaryDirectory
+        code = "Ｆ²«a¹»↗³b"
+        ClearProgramCache()
+        program = Parse(code, processor=InterpreterProcessor)
+        self.assertIs(Parse(code, processor=InterpreterProcessor), program)
+        self.assertIsNot(Parse(
+            code, processor=InterpreterProcessor, cache=False
+        ), program)
+        self.assertIsNot(Parse(
+            code, processor=InterpreterProcessor, whitespace=True
+        ), program)
+        tree = Parse(code)[0]()
+        with TemporaryDirectory() as directory:
+            try:
+                SetProgramCache(2, directory)
+                Parse(code, processor=InterpreterProcessor)
+                Parse("a", processor=InterpreterProcessor)
+                Parse("b", processor=InterpreterProcessor)
+                self.assertEqual(len(ProgramCache), 2)
+                SetProgramCache(2, directory)
+                charcoal = Charcoal()
+                Parse(code, processor=InterpreterProcessor)(charcoal)
+                self.assertEqual(str(charcoal), Run(code))
+                self.assertEqual(Parse(code)[0](), tree)
+                self.assertEqual(Run(
+                    "Print(\"ab\"); Move(:Down); Print(1)", verbose=True
+                ), "ab \n  -")
+                ClearProgramCache()
+                self.assertEqual(Run(
+                    "Print(\"ab\"); Move(:Down); Print(1)", verbose=True
+                ), "ab \n  -")
+            finally:
+                SetProgramCache()
+
+    def test_row_buffers(self):
+        from charcoal import Parse, Charcoal
+        from interpreterprocessor import InterpreterProcessor
+        from rowbuffer import RowBuffers
+        for code in (
+            "Ｆ²«a¹»↗³b", "Ｂ⁵¦⁵#Ｍ←←ab←←cd", "Ｐ↘abcＰ↖defＭ←←←←ghi",
+            "↗⁴↘⁴↙⁴↖⁴‖Ｍ↓Ｆ⁵Ｍ←⟲²xyz", "Ｃ⁵¦⁵Ｇ↘↗⁵#¿⁼Ｋ↑#Ｔ²¦²",
+            "↓⁴→⁴↑⁴←⁴Ｍ↘¤.", "Ｇ+⁵*↷¹Ｍ←←Ｐ↓⁵ab", "Ｆ⁵«↑a¹»Ｍ←Ｐ↑⁶b",
+            "Ｇ↖⁵↙⁵*‖←Ｍ←Ｐ↓⁸c", "ab↑⁴⟲¹‖↘Ｍ↑Ｐ→⁴d"
+        ):
+            charcoal, buffered = Charcoal(), Charcoal(row_buffers=True)
+            program = Parse(code, processor=InterpreterProcessor)
+            program(charcoal)
+            program(buffered)
+            self.assertEqual(str(buffered), str(charcoal))
+            self.assertEqual(list(buffered.lines), list(charcoal.lines))
+            self.assertIs(type(buffered.lines), RowBuffers)
+        lines = RowBuffers(["ab", "", "cd"])
+        lines.Write(0, -2, "xy")
+        lines[1] = "ef"
+        lines += ["g"]
+        self.assertEqual(lines, ["xyab", "ef", "cd", "g"])
+        self.assertEqual(lines[1:3], ["ef", "cd"])
+        self.assertEqual(lines.Get(0, 1), "y")
+        lines.Prepend(["h", "i"])
+        lines.Prepend(["j"])
+        self.assertEqual(lines, ["j", "h", "i", "xyab", "ef", "cd", "g"])
+        self.assertEqual(lines[-4], "xyab")
+        self.assertEqual(list(reversed(lines))[:2], ["g", "cd"])
+        lines.Write(3, 1, "z")
+        del lines[:2]
+        self.assertEqual(lines, ["i", "xzab", "ef", "cd", "g"])
+        for _ in range(100):
+            lines.Prepend([""])
+        self.assertEqual(len(lines), 105)
+        self.assertLess(len(lines.rows), 250)
+
+    def test_incremental_refresh(self):
+        from charcoal import Charcoal, Info
+        from direction import Direction
+        from contextlib import redirect_stdout
+        from io import StringIO
+        import re
+
+        def Frame():
+            output = StringIO()
+            with redirect_stdout(output):
+                charcoal.RefreshFast()
+            return output.getvalue()
+
+        def Draw(screen, frame):
+            if frame.startswith("\033[2J\033[0;0H"):
+                return frame[len("\033[2J\033[0;0H"):].split("\n")[:-1]
+            for row, line in re.findall(
+                "\033\\[(\\d+);1H([^\033]*)\033\\[K", frame
+            ):
+                screen[int(row) - 1:int(row)] = [line]
+            return screen
+
+        charcoal = Charcoal(info={Info.incremental_refresh})
+        charcoal.PrintLine({Direction.right}, 3, "abc")
+        self.assertEqual(Frame(), "\033[2J\033[0;0Habc\n")
+        charcoal.Put("d", 1, 0)
+        self.assertEqual(Frame(), "\033[1;1Hadc\033[K\033[2;1H")
+        self.assertEqual(Frame(), "\033[2;1H")
+        charcoal.Put("e", 2, 2)
+        self.assertEqual(
+            Frame(), "\033[2;1H   \033[K\033[3;1H  e\033[K\033[4;1H"
+        )
+        charcoal.Put("f", 0, -1)
+        self.assertEqual(Frame(), "\033[2J\033[0;0Hf  \nadc\n   \n  e\n")
+        charcoal.Put("g", 5, 0)
+        self.assertTrue(Frame().startswith("\033[2J"))
+        charcoal.Clear()
+        self.assertTrue(Frame().startswith("\033[2J"))
+        charcoal.SetBackground("ab\ncde")
+        screen = []
+        for i in range(8):
+            charcoal.x, charcoal.y = i % 4, i // 2
+            charcoal.PrintLine({Direction.down_right}, 3, "xyz"[i % 3:])
+            if i == 5:
+                charcoal.Reflect(Direction.down)
+            screen = Draw(screen, Frame())
+            self.assertEqual(screen, str(charcoal).split("\n"))
+
+    def test_batch(self):
+        from batch import LoadCases, RunBatch
+        from tempfile import TemporaryDirectory
+        import os
+        cases = [
+            {"name": "a", "input": "abc", "output": "abc"},
+            {"name": "b", "input": "[\"ab\", \"c\"]", "output": "c"},
+            {"name": "c", "input": ["de"]}
+        ]
+        summary = RunBatch("Ｓ", cases, 1)
+        self.assertEqual(
+            [summary[status] for status in ("pass", "fail", "done")],
+            [1, 1, 1]
+        )
+        self.assertEqual(
+            [case["output"] for case in summary["cases"]], ["abc", "ab", "de"]
+        )
+        self.assertIn("-c\n+ab", summary["cases"][1]["diff"])
+        for options in (
+            {"compiled": True}, {"optimized": True},
+            {"compiled": True, "optimized": True}
+        ):
+            self.assertEqual([
+                case["output"]
+                for case in RunBatch("Ｆ²Ｓ", cases, 1, **options)["cases"]
+            ], ["abc", "abc", "de"])
+        import signal
+
+        def Handler(signal_number, frame):
+            pass
+        previous_handler = signal.signal(signal.SIGALRM, Handler)
+        try:
+            summary = RunBatch("Ｓ¹Ｗ¹a", cases[:1], 1, 0.1)
+            self.assertIs(signal.getsignal(signal.SIGALRM), Handler)
+        finally:
+            signal.signal(signal.SIGALRM, previous_handler)
+        self.assertEqual(summary["cases"][0]["status"], "timeout")
+        self.assertEqual(RunBatch("Ｉ÷¹¦⁰", cases[:1], 1)["error"], 1)
+        with TemporaryDirectory() as directory:
+            for name, text in (("x.in", "ab"), ("x.out", "ab"), ("y.in", "c")):
+                with open(os.path.join(directory, name), "w") as file:
+                    file.write(text)
+            self.assertEqual(LoadCases(directory), [
+                {"name": "x", "input": "ab", "output": "ab"},
+                {"name": "y", "input": "c"}
+            ])
+            summary = RunBatch("Ｓ", directory, 2)
+            self.assertEqual((summary["pass"], summary["done"]), (1, 1))
+
+    def test_session(self):
+        from session import Session
+        from charcoal import CharcoalParseError, CharcoalRuntimeError
+        session = Session()
+        program = session.Compile("↓Ｓ")
+        self.assertEqual(session.Run(program, "ab").output, "a\nb")
+        result = session.Run(inputs=["cd"])
+        self.assertEqual((result.output, result.canvas), ("c\nd", "c\nd"))
+        self.assertEqual(session.Run("ＵＢ.¦a¶b").output, "a\nb")
+        self.assertEqual(session.Run("Ｄab").output, "\nab")
+        self.assertEqual(session.Run("Ｄab").stdout, "\n")
+        with self.assertRaises(CharcoalParseError):
+            session.Run("Ｆ")
+        with self.assertRaises(CharcoalRuntimeError) as context:
+            session.Run("ab⟲Ｃ¹")
+        self.assertEqual(context.exception.result.canvas, "ab")
+        with self.assertRaises(CharcoalRuntimeError):
+            session.Run("Ｉ÷¹¦⁰")
+        self.assertEqual(Session(verbose=True).Run(
+            "Print(\"ab\")"
+        ).output, "ab")
+        self.assertEqual(session.Run("ab").output, "ab")
+
+    def test_limits(self):
+        from charcoal import Parse, Charcoal, CharcoalLimitError
+        from interpreterprocessor import InterpreterProcessor
+        from direction import Direction
+        from session import Session
+        charcoal = Charcoal()
+        charcoal.SetLimits(steps=10)
+        with self.assertRaises(CharcoalLimitError) as context:
+            Parse("Ｗ¹a", processor=InterpreterProcessor)(charcoal)
+        self.assertEqual(context.exception.limit, "steps")
+        self.assertEqual(context.exception.output, "a" * 5)
+        charcoal.Clear()
+        Parse("Ｆ⁵a", processor=InterpreterProcessor)(charcoal)
+        self.assertEqual(str(charcoal), "aaaaa")
+        session = Session()
+        session.charcoal.SetLimits(size=20)
+        self.assertEqual(session.Run("Ｅ⁵Ｉι").output, "0\n1\n2\n3\n4")
+        for code in (
+            "a↓¹⁰⁰", "Ｊ⁰¦⁵⁰a", "a→¹⁰⁰", "aＪ⁹⁹⁹⁹⁹⁹⁹¦⁰b", "abＭ⁵⁰←c", "abＭ⁵⁰↑c"
+        ):
+            with self.assertRaises(CharcoalLimitError) as context:
+                session.Run(code)
+            self.assertEqual(context.exception.limit, "size")
+        self.assertEqual(context.exception.result.canvas, "ab")
+        for row_buffers in (False, True):
+            limited = Session(row_buffers=row_buffers)
+            limited.charcoal.SetLimits(size=1000, steps=1000)
+            with self.assertRaises(CharcoalLimitError) as context:
+                limited.Run("aＪ⁹⁹⁹⁹⁹⁹⁹¦⁰b")
+            self.assertEqual(context.exception.limit, "size")
+            self.assertEqual(context.exception.result.canvas, "a")
+            self.assertEqual(limited.Run("Ｊ⁹⁹⁹⁹⁹⁹⁹¦⁰b").output, "b")
+            # Short rows far apart make a wide canvas too
+            for code in (
+                "aＪ⁹⁹⁹⁹⁹⁹¦¹b", "a↓Ｊ⁹⁹⁹⁹⁹⁹¦¹b", "aＪ⁹⁹⁹⁹⁹⁹¦¹⁰↓b",
+                "a→⁶⁰⁰ＵＥ¹"
+            ):
+                with self.assertRaises(CharcoalLimitError) as context:
+                    limited.Run(code)
+                self.assertEqual(context.exception.limit, "size")
+        for code, direction in (
+            ("a→⁶⁰⁰", Direction.left), ("a↓⁶⁰⁰", Direction.up)
+        ):
+            charcoal = Charcoal()
+            Run(code, charcoal=charcoal)
+            charcoal.SetLimits(size=1000)
+            with self.assertRaises(CharcoalLimitError):
+                charcoal.ReflectCopy(direction)
+        charcoal = Charcoal()
+        Run("aＪ⁹⁹⁹⁹⁹⁹⁹¦¹b", charcoal=charcoal)
+        charcoal.SetLimits(steps=1)
+        with self.assertRaises(CharcoalLimitError) as context:
+            charcoal.CheckLimits(steps=2)
+        self.assertEqual(context.exception.output, "a" + " " * ((1 << 20) - 1))
+        # Bounds left wide by a Crop are checked again before raising
+        charcoal = Charcoal()
+        charcoal.SetLimits(size=10)
+        charcoal.Print("a" * 10)
+        charcoal.x = 0
+        charcoal.Crop(5, 1)
+        charcoal.x, charcoal.y = -1, 1
+        charcoal.Print("c")
+        self.assertEqual(str(charcoal), " aaaaa\nc     ")
+        session.charcoal.SetLimits(steps=100, time=0.05)
+        for code in ("Ｗ¹«Ａ¹ι»", "Φ¹⁰⁰⁰⁰⁰⁰ι", "Ｆ¹⁰⁰⁰⁰⁰⁰Ｖa", "Ｅ¹⁰⁰⁰⁰⁰⁰ι"):
+            with self.assertRaises(CharcoalLimitError):
+                session.Run(code)
+
+    def test_compile(self):
+        from charcoal import Parse, Charcoal, CharcoalLimitError
+        from compiler import CompilerProcessor
+        programs = [
+            "Ｆ³«a↓»Ｗ‹ⅈ⁵→¿ⅈb«c»d", "Ｆ⁵«Ｆι«Ｉκ»↓»", "≔⁰θＷ‹θ⁹≔⊕θθＩθ",
+            "Ｆ²¿ι«a»b", "Ｆ⁴Ｆ⁴¿﹪⁺ικ³→«ι»", "Ｆ²«»", "", "Ｆabc«Ｆ²ι¶»",
+            "Ｆ¹" * 16 + "Ｉ⁺ικ", "¿¹" * 20 + "Ｆ²a", "Ｅ³Ｆι⁺ικ", "Ｆ³«Ｐι↘»"
+        ]
+        for code in programs:
+            self.assertEqual(
+                Run(code, compiled=True), Run(code), "compiling %r" % code
+            )
+        program = Parse("Ｆ³a", processor=CompilerProcessor)
+        program(Charcoal())
+        self.assertIn("for item", program.function.source)
+        self.assertEqual(Run("Ｆ", compiled=True, silent=True), "")
+        charcoal = Charcoal()
+        charcoal.SetLimits(steps=10)
+        with self.assertRaises(CharcoalLimitError) as context:
+            Parse("Ｗ¹a", processor=CompilerProcessor)(charcoal)
+        self.assertEqual(context.exception.output, "a" * 5)
+
+    def test_long_program(self):
+        from charcoal import Parse, SetProgramCache, ClearProgramCache
+        from derivationprocessor import (
+            DerivationProcessor, Replay, FlattenDerivation
+        )
+        from interpreterprocessor import InterpreterProcessor
+        from tempfile import TemporaryDirectory
+        import os
+        import sys
+        limit = sys.getrecursionlimit()
+        try:
+            sys.setrecursionlimit(1000)
+            code = "≔⁰θ" + "≔⁺θ¹θ" * 5000 + "Ｉθ"
+            self.assertEqual(Run(code), "5000")
+            self.assertEqual(Run(code, compiled=True), "5000")
+            self.assertEqual(Run("Ｆ²«" + "a¦" * 3000 + "»"), "a" * 6000)
+            derivation = Parse(code, processor=DerivationProcessor)
+            self.assertEqual(
+                len(Replay(derivation, InterpreterProcessor).Flatten()), 5002
+            )
+            flat = FlattenDerivation(derivation)
+            self.assertEqual(len(flat[2]), 5003)
+            tree = Parse(code, cache=False)[0]()
+            self.assertEqual(len(tree), 5003)
+            self.assertEqual(
+                tree[-1], ["Print", ["Ｉ: Cast", ["θ: Identifier θ (q)"]]]
+            )
+            self.assertEqual(FlattenDerivation(
+                Replay(flat, DerivationProcessor)
+            ), flat)
+            with TemporaryDirectory() as directory:
+                try:
+                    SetProgramCache(directory=directory)
+                    self.assertEqual(Run(code), "5000")
+                    self.assertEqual(len(os.listdir(directory)), 1)
+                    ClearProgramCache()
+                    self.assertEqual(Run(code), "5000")
+                finally:
+                    SetProgramCache()
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def test_optimize(self):
+        from charcoal import Parse, Charcoal
+        from derivationprocessor import DerivationProcessor
+        from optimizer import Optimize, Assigned, preset_variables
+        programs = [
+            "Ｉ⁺χφ", "Ｆ³Ｉ×⁺χφ²", "¿¹a¦b", "¿⁰a", "Ｆ²¿⁰a«b»", "⎇⁰a¦b",
+            "∧⁰a", "∨ab", "≔⁵χＩ⁺χφ", "Ｗ⁰a", "↥β", "Ｉ∕χ⁴", "×aχ",
+            "ＩＸ²¦¹⁰⁰", "◧a⁵", "UＶabcＩχ", "Ｎθ⎇θa¦b", "ＥΦ⁵¬﹪ι²⁺ιχ",
+            "Ｆ⁴«¿‹ι²a¿∧⁰ιbc»"
+        ]
+        for code in programs:
+            for compiled in (False, True):
+                self.assertEqual(
+                    Run(code, "3", optimized=True, compiled=compiled),
+                    Run(code, "3"), "optimizing %r" % code
+                )
+        self.assertEqual(
+            Charcoal().top_scope.lookup,
+            dict(preset_variables, υ=[])
+        )
+        self.assertEqual(
+            Optimize(Parse("Ｆ³↥β", processor=DerivationProcessor)),
+            Parse(
+                "Ｆ³ABCDEFGHIJKLMNOPQRSTUVWXYZ", processor=DerivationProcessor
+            )
+        )
+        self.assertEqual(
+            Optimize(
+                Parse("Ｉ⁺χφ", processor=DerivationProcessor), Charcoal()
+            ),
+            Parse("1010", processor=DerivationProcessor)
+        )
+        self.assertEqual(
+            Optimize(Parse("¿⁰a«b¦c»", processor=DerivationProcessor)),
+            Parse("b¦c", processor=DerivationProcessor)
+        )
+        self.assertEqual(
+            Assigned(Parse("≔¹χＮθ", processor=DerivationProcessor)),
+            {"χ", "θ"}
+        )
+        self.assertIsNone(
+            Assigned(Parse("ＶaＩχ", processor=DerivationProcessor))
+        )
+        for code in ("‽²", "Ｓ", "ＫＫ", "⊟υ", "Ｘ⁹¦⁹⁹⁹⁹⁹⁹⁹"):
+            derivation = Parse(code, processor=DerivationProcessor)
+            self.assertEqual(Optimize(derivation, Charcoal()), derivation)
+        for compiled in (False, True):
+            charcoal = Charcoal()
+            Run("≔⁵χ", charcoal=charcoal)
+            self.assertEqual(Run(
+                "Ｉχ", charcoal=charcoal, optimized=True, compiled=compiled
+            ), "5")
+
+    def test_hoisting(self):
+        from charcoal import Parse, Charcoal
+        from optimizer import OptimizerProcessor, CompiledOptimizerProcessor
+
+        class Counting(Charcoal):
+            def Retrieve(self, key):
+                self.retrieved += [key]
+                return super().Retrieve(key)
+
+        programs = [
+            "≔abcθＦ⁵«Ｉ⁺ιＬθ»", "≔abcθＦ⁵«Ｉ⁺ιＬθ≔⁺θxθ»",
+            "≔abcθ≔⁶ηＷ‹Ｌθ×η²«≔⁺θxθ»θ", "≔⁵θＩＥχ×θ²", "≔⁵θＦ³Ｆ³Ｉ×θ⁺ι²",
+            "Ｆ³«≔ιθＦ³Ｉ×θ²»", "≔³θＷθ«Ｉ×θ²≦⊖θ»", "≔abcθＦ²«Ｆ²Ｉ⁺κＬθ≔⁺θyθ»",
+            "≔⟦¹⟧θＦ³«Ｉ⁺ＬθＬθ⊞θι»", "≔¹θＦ²«Ｆ²Ｉ×θ²≔Ｉθθ»"
+        ]
+        for code in programs:
+            for compiled in (False, True):
+                self.assertEqual(
+                    Run(code, optimized=True, compiled=compiled), Run(code),
+                    "hoisting %r" % code
+                )
+        for processor in (OptimizerProcessor, CompiledOptimizerProcessor):
+            charcoal = Counting()
+            charcoal.retrieved = []
+            Parse("≔abcθＦ⁵«Ｉ⁺ιＬθ»", processor=processor)(charcoal)
+            self.assertEqual(str(charcoal), "34567")
+            self.assertEqual(charcoal.retrieved.count("θ"), 1)
+
+    def test_scope(self):
+        from charcoal import Scope
+        top = Scope(lookup={"χ": 10})
+        outer = Scope(top)
+        self.assertEqual(next(outer), "ι")
+        outer["ι"] = 1
+        inner = Scope(outer, {"κ": 2})
+        self.assertEqual(next(inner), "λ")
+        self.assertEqual((inner["ι"], inner["κ"], inner["χ"]), (1, 2, 10))
+        inner["ι"] = 3
+        inner["θ"] = 4
+        self.assertEqual((outer["ι"], top.parent, top["θ"]), (3, {"θ": 4}, 4))
+        self.assertNotIn("κ", outer)
+        self.assertIn("θ", inner)
+        shadow = Scope(inner, {"χ": 5})
+        self.assertEqual((shadow["χ"], inner["χ"]), (5, 10))
+        del shadow["χ"]
+        self.assertEqual(shadow["χ"], 10)
+        self.assertEqual(shadow.get("ω", 6), 6)
+        self.assertEqual(
+            [next(Scope(inner)) for _ in range(2)], ["μ", "μ"]
+        )
+        self.assertEqual(Run("Ｆ²Ｆ³Ｆ⁴«≔⁺⁺ικλθ»Ｉθ"), "6")
+        self.assertEqual(Run("≔⁰θＦ³≔⁺θιθＩθ"), "3")
+        self.assertEqual(Run("ＩＥ²Ｅ²⁺ιλ", compiled=True), Run("ＩＥ²Ｅ²⁺ιλ"))
+
+    def test_lambda_pool(self):
+        from charcoal import Parse, Charcoal
+        from interpreterprocessor import InterpreterProcessor
+        charcoal = Charcoal()
+        draw = charcoal.Lambdafy(
+            Parse("Ｆι«a↓»", processor=InterpreterProcessor)
+        )
+        self.assertEqual(draw(2), "a \n a")
+        self.assertEqual(len(charcoal.pool), 1)
+        canvas = charcoal.pool[0]
+        self.assertEqual(draw(3), "a  \n a \n  a")
+        self.assertEqual(charcoal.pool, [canvas])
+        self.assertIs(charcoal.pool[0], canvas)
+        self.assertEqual(str(charcoal.pool[0]), "")
+        charcoal.scope["f"] = draw
+        nested = charcoal.Lambdafy(
+            Parse("a↓▷f⟦¹⟧", processor=InterpreterProcessor)
+        )
+        for _ in range(3):
+            self.assertEqual(nested(), "a")
+            self.assertEqual(len(charcoal.pool), 2)
+            self.assertIn(canvas, charcoal.pool)
+        canvases = list(map(id, charcoal.pool))
+        self.assertEqual(nested(), "a")
+        self.assertEqual(list(map(id, charcoal.pool)), canvases)
+        make = charcoal.Lambdafy(
+            Parse("≔«ab»θ", processor=InterpreterProcessor)
+        )
+        make()
+        self.assertEqual(len(charcoal.pool), 1)
+        self.assertEqual(charcoal.scope["θ"](), "ab")
+        del charcoal.scope["f"]
+        del charcoal.scope["θ"]
+        self.assertEqual(charcoal.Lambdafy(
+            Parse("ab", processor=InterpreterProcessor)
+        )(), "ab")
+        self.assertEqual(charcoal.Lambdafy(
+            Parse("", processor=InterpreterProcessor)
+        )(), "")
+        peek = charcoal.Lambdafy(
+            Parse("ab≔ＫＡθ", processor=InterpreterProcessor)
+        )
+        self.assertEqual(peek(), "ab")
+        self.assertEqual(charcoal.pool, [])
+        self.assertEqual(str(charcoal.scope["θ"].charcoal), "ab")
+        self.assertEqual(Run("≔f«ab≔ＫＡθ»▷f⟦⟧▷f⟦⟧θ"), "ababa\n    b")
+        self.assertEqual(Run("≔f«Ｆ³Ｉι»▷f⟦⟧▷f⟦⟧"), "22")
+
+    def test_vectorized_lists(self):
+        from charcoal import Charcoal
+        from interpreterprocessor import (
+            Negate, Abs, Incremented, Decremented, Doubled, Halved,
+            SquareRoot, IsNumeric
+        )
+        self.assertTrue(IsNumeric([1, 2.5, -3]))
+        self.assertTrue(IsNumeric([]))
+        self.assertFalse(IsNumeric([1, True]))
+        self.assertFalse(IsNumeric([1, [2]]))
+        self.assertFalse(IsNumeric([1, "2"]))
+        self.assertFalse(IsNumeric((1, 2)))
+        numbers = [3, -4, 0, 2.5, -1.5, 10 ** 20]
+        for function in (
+            Negate, Abs, Incremented, Decremented, Doubled, Halved,
+            SquareRoot
+        ):
+            result = function(numbers)
+            expected = [function(number) for number in numbers]
+            self.assertEqual(result, expected)
+            self.assertEqual(
+                list(map(type, result)), list(map(type, expected))
+            )
+        self.assertEqual(Halved([3, 4, [5, 6]]), [1.5, 2, [2.5, 3]])
+        self.assertEqual(Incremented([1, "2"]), [2, 3])
+        charcoal = Charcoal()
+        for name in ("Add", "Subtract", "Multiply", "Divide"):
+            method = getattr(charcoal, name)
+            for left, right in ((numbers, 2), (numbers, 0.5), (7, [2, 3.5])):
+                result = method(left, right)
+                expected = (
+                    [method(item, right) for item in left]
+                    if isinstance(left, list) else
+                    [method(left, item) for item in right]
+                )
+                self.assertEqual(result, expected)
+                self.assertEqual(
+                    list(map(type, result)), list(map(type, expected))
+                )
+        self.assertEqual(charcoal.Divide([3, 4], 2, floor=False), [1.5, 2.0])
+        self.assertEqual(charcoal.Add([1, "a"], 1), [2, "a1"])
+        self.assertEqual(Run("Ｉ⊘…·¹¦⁵"), "0.5\n1  \n1.5\n2  \n2.5")
+        self.assertEqual(Run("Ｉ﹪…⁰χ³"), "0\n1\n2\n0\n1\n2\n0\n1\n2\n0")
+        self.assertEqual(Run("Ｉ⁻⁵⟦¹¦²·⁵⟧"), "4  \n2.5")
+
+    def test_fill_spans(self):
+        from floodfill import Spans, Cycled
+        lines = ["#\000\000#", "\000\000#\000", "##\000"]
+        self.assertEqual(Spans(lines, [0, -1, 0], 0, 2, 1), [
+            (0, 1, 3), (1, 2, 3), (2, 2, 3)
+        ])
+        self.assertEqual(Spans(lines, [0, -1, 0], 0, 0, 1), [(1, -1, 1)])
+        self.assertEqual(Spans(lines, [0, -1, 0], 0, 0, 0), [])
+        self.assertEqual(Spans(lines, [0, -1, 0], 0, 9, 9), [])
+        # Rows at or below y = len(lines) do not spread downwards
+        self.assertEqual(Spans(lines, [0, -1, 0], 2, 2, 3), [
+            (2, 1, 3), (3, 2, 3)
+        ])
+        self.assertEqual(Cycled("abc", 4, 7), "bcabcab")
+        self.assertEqual(Cycled("abc", 0, 0), "")
+        self.assertEqual(Run("ＵＲ⁵¦⁵Ｊ¹¦¹¤ab\000"), """\
++---+
+|ab |
+|ab |
+|ab |
++---+""")
+        self.assertEqual(Run("ＵＲ⁵¦⁵‖↓Ｊ¹¦±³¤xy"), """\
++---+
+|xyx|
+|yxy|
+|xyx|
++---+""")
+        self.assertEqual(
+            Run("ＵＲ⁶⁴¦⁶⁴Ｊ¹¦¹¤abc").count("a"), 62 * 62 // 3 + 1
+        )
+
+    def test_coordinates(self):
+        from charcoal import Coordinates
+        coordinates = Coordinates()
+        coordinates.Add(1, 2)
+        coordinates.Add(3, -2)
+        coordinates.Add(4, 2)
+        coordinates.Add(0, -1)
+        self.assertEqual(coordinates.top, -2)
+        self.assertEqual(list(map(list, coordinates.Rows())), [
+            [3], [0], [], [], [1, 4]
+        ])
+        coordinates.Add(2 ** 70, 0)
+        self.assertEqual(list(coordinates.Rows())[2], [2 ** 70])
+        self.assertEqual(Run("Ｊ±²¦±⁴Ｇ→⁵↓⁵←⁵*"), "\n".join(["*****"] * 5))
+        self.assertEqual(
+            Run("Ｊ±²¦±⁴Ｇ→⁵↓⁵←⁵ab\ncd"),
+            "ababa\ncdcdc\nababa\ncdcdc\nababa"
+        )
+        self.assertEqual(
+            Run("Ｇ↘⁴↗⁴ab\ncd"), "abababa\n dcdcd \n  aba  \n   d   "
+        )
+
+    def test_trim(self):
+        from charcoal import Charcoal
+        charcoal = Charcoal()
+        charcoal.top = -1
+        charcoal.lines = ["", "\000\000", "\000ab\000", "\000\000\000", ""]
+        charcoal.indices = [0, 1, 2, 3, 4]
+        charcoal.lengths = list(map(len, charcoal.lines))
+        charcoal.right_indices = [
+            index + length
+            for index, length in zip(charcoal.indices, charcoal.lengths)
+        ]
+        charcoal.Trim()
+        # One empty row is kept on top, and only lines with nothing
+        # but "\000" lose their right side
+        self.assertEqual(charcoal.lines, ["", "ab\000"])
+        self.assertEqual(charcoal.top, 0)
+        self.assertEqual(charcoal.indices, [2, 2, 2, 3, 4])
+        self.assertEqual(charcoal.lengths, [-4, 1, 4, 3, 0])
+        self.assertEqual(charcoal.right_indices, [-2, 3, 6, 6, 4])
+        lines = charcoal.lines
+        charcoal.Trim()
+        self.assertIs(charcoal.lines, lines)
+        self.assertEqual(charcoal.lines, ["", "ab\000"])
+        self.assertEqual(charcoal.indices, [2, 2, 2, 3, 4])
+        charcoal.lines = ["\000", ""]
+        self.assertRaises(IndexError, charcoal.Trim)
+
+    def test_bulk_transforms(self):
+        from charcoal import Charcoal
+        from bulktransforms import Rotate, Sentinel
+        from charactertransformers import RotateLeft, HorizontalFlip
+        from direction import Direction
+
+        def State(charcoal):
+            return (
+                list(charcoal.lines), charcoal.indices, charcoal.lengths,
+                charcoal.right_indices, charcoal.top, charcoal.x, charcoal.y
+            )
+        for code in (
+            "abc↓de←f", "↖ab\000c¶¶Ｍ³→xyz", "Ｊ±²¦±³↗ab/\\", "ＵＯ³¦⁴#"
+        ):
+            for rotations in range(1, 8):
+                drawn, bulk = Charcoal(), Charcoal()
+                Run(code, charcoal=drawn)
+                Run(code, charcoal=bulk)
+                # Limits make Rotate draw the rows one by one
+                drawn.limits = (0, 0, 0)
+                drawn.Rotate(rotations, True)
+                bulk.Rotate(rotations, True)
+                self.assertEqual(State(bulk), State(drawn))
+            for transform in (
+                lambda c: c.RotateCopy(2, Direction.down_right, True),
+                lambda c: c.RotateCopy(6, Direction.up_left, False),
+                lambda c: c.RotateOverlap(4, Direction.down_right, True),
+                lambda c: c.RotateOverlap(
+                    2, Direction.up_right, False, False, 0
+                ),
+                lambda c: c.ReflectCopy(Direction.down_left, True),
+                lambda c: c.ReflectOverlap(Direction.right, True, 1),
+                lambda c: c.ReflectOverlap(Direction.up_left, False, 2)
+            ):
+                drawn, bulk = Charcoal(), Charcoal()
+                Run(code, charcoal=drawn)
+                Run(code, charcoal=bulk)
+                # Limits make the strokes get drawn one by one too
+                drawn.limits = (0, 0, 0)
+                transform(drawn)
+                transform(bulk)
+                self.assertEqual(State(bulk), State(drawn))
+        self.assertIsNone(Rotate(["ab"], [0], [3], 0, 2))
+        self.assertEqual(Rotate(["ab"], [0], [2], 0, 1), (
+            ["b", "a"], [1, 0], [1, 1], [2, 1], -1
+        ))
+        self.assertEqual(Sentinel(["a\001b"]), "\002")
+        self.assertIsNone(Sentinel(["\001\002\003\004\005\006\007\010"]))
+        self.assertEqual(
+            "-|┌ab".translate(RotateLeft.table),
+            "".join(RotateLeft.get(c, c) for c in "-|┌ab")
+        )
+        self.assertEqual("(b]".translate(HorizontalFlip.table), ")d[")
+
+    def test_translate(self):
+        import charactertransformers
+        from charactertransformers import Transformer
+        from charcoal import Charcoal
+        from direction import Direction
+        string = "".join(sorted(set("".join(
+            key + value
+            for transformer in vars(charactertransformers).values()
+            if isinstance(transformer, Transformer)
+            for key, value in transformer.items()
+        )))) + "abc \000"
+        for name, transformer in vars(charactertransformers).items():
+            if isinstance(transformer, Transformer):
+                self.assertEqual(
+                    transformer.Translate(string),
+                    "".join(transformer.get(c, c) for c in string), name
+                )
+        self.assertEqual(Transformer({"a": "b"}).Translate("aab"), "bbb")
+        charcoal = Charcoal()
+        Run("ab/\\", charcoal=charcoal)
+        charcoal.ReflectMirror(Direction.right)
+        self.assertEqual(str(charcoal), "ab/\\/\\da")
+        charcoal = Charcoal()
+        Run("ab/\\", charcoal=charcoal)
+        charcoal.RotatePrism(4)
+        self.assertEqual(str(charcoal), "ab/\\    \n    \\/qa")
+
+    def test_decompressed_cache(self):
+        from compression import (
+            Compressed, Decompressed, SetDecompressedCache,
+            ClearDecompressedCache, DecompressedCacheStats
+        )
+        from tempfile import TemporaryDirectory
+        import compression
+        version = compression.decompression_version
+        string = "abcabcabc" * 20 + "\n" + "xyz" * 30
+        literal = Compressed(string)
+        with TemporaryDirectory() as directory:
+            try:
+                SetDecompressedCache(2, directory)
+                self.assertEqual(Decompressed(literal), string)
+                self.assertEqual(Decompressed(literal), string)
+                self.assertEqual(Decompressed("abc"), "abc")
+                self.assertEqual(DecompressedCacheStats(), {
+                    "hits": 1, "misses": 1, "store_hits": 0, "size": 1
+                })
+                Decompressed(Compressed("a" * 50))
+                Decompressed(Compressed("b" * 50))
+                self.assertEqual(DecompressedCacheStats()["size"], 2)
+                ClearDecompressedCache()
+                self.assertEqual(Decompressed(literal), string)
+                self.assertEqual(DecompressedCacheStats(), {
+                    "hits": 0, "misses": 1, "store_hits": 1, "size": 1
+                })
+                self.assertEqual(Run(literal).rstrip(), string)
+                # Literals stored by another version are decompressed again
+                compression.decompression_version += 1
+                compression.decompression_hash = None
+                ClearDecompressedCache()
+                self.assertEqual(Decompressed(literal), string)
+                self.assertEqual(DecompressedCacheStats()["store_hits"], 0)
+            finally:
+                compression.decompression_version = version
+                compression.decompression_hash = None
+                SetDecompressedCache()
+
+    def test_compressed_search(self):
+        from compression import (
+            Compressed, CompressedCache, Escaped, SearchCompressed,
+            SetCompressionPool, CompressString, CompressPermutations,
+            CompressCharset, CompressRLE, CompressBrotli, CompressLZMA
+        )
+        strings = [
+            "a", "ab", "abc", "hello", "a" * 100, "ab\n" * 50,
+            "Hello, World!", "/\\" * 40 + "\n" + "\\/" * 40,
+            "The quick brown fox jumps over the lazy dog", "é", "é" * 5
+        ]
+
+        def Exhaustive(string):
+            if not all(" " <= c <= "~" or c in "\n\r" for c in string):
+                return Compressed(string)
+            best, best_length = Escaped(string), len(string) - 2
+            for delimiter, function in (
+                ("“", CompressString), ("”", CompressPermutations),
+                ("”", CompressCharset), ("”", CompressRLE),
+                ("”", CompressBrotli), ("”", CompressLZMA)
+            ):
+                compressed = function(string)
+                if len(compressed) < best_length:
+                    best = delimiter + compressed + "”"
+                    best_length = len(compressed)
+            return best
+
+        expected = [SearchCompressed(string) for string in strings]
+        self.assertEqual(expected, [Exhaustive(string) for string in strings])
+        for string, literal in zip(strings, expected):
+            self.assertEqual(Run(literal).rstrip(), string.rstrip())
+            self.assertEqual(Compressed(string), literal)
+            self.assertIs(CompressedCache[string], Compressed(string))
+        try:
+            SetCompressionPool(4)
+            self.assertEqual(
+                [SearchCompressed(string) for string in strings], expected
+            )
+        finally:
+            SetCompressionPool()
+
+    def test_decode_stream(self):
+        from charcoal import Decode, ReadCode, print_xxd
+        from codepage import DecodeStream, EncodeStream
+        from contextlib import redirect_stdout
+        from io import BytesIO, StringIO
+        from tempfile import TemporaryDirectory, TemporaryFile
+        import mmap
+        import os
+        code = "Ｇ+⁵a╬ＵＢ¶↷²×⁺β⸿" * 3
+        encoded = bytes(
+            byte for piece in EncodeStream(code) for byte in piece
+        )
+        self.assertEqual(encoded[:4], b"\xC7+\xB5a")
+        self.assertEqual(Decode(encoded), code)
+        self.assertEqual(Decode(encoded.decode("latin1")), code)
+        for chunk_size in (1, 2, 3, 5, 64):
+            self.assertEqual(
+                "".join(DecodeStream(BytesIO(encoded), chunk_size)), code
+            )
+        with TemporaryFile() as file:
+            file.write(encoded)
+            file.flush()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.assertEqual(Decode(data), code)
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "code.cl")
+            with open(path, "wb") as file:
+                file.write(encoded)
+            self.assertEqual(ReadCode(path, True), code)
+            self.assertEqual(
+                ReadCode(path, True, False), encoded.decode("latin1")
+            )
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(code)
+            self.assertEqual(ReadCode(path), code)
+        self.assertEqual(Decode("a\xFF\x41b"), "aAb")
+        self.assertRaises(ValueError, Decode, "a\xFF\x80")
+        output = StringIO()
+        with redirect_stdout(output):
+            print_xxd(StringIO("Ｇ+⁵a╬" + "-" * 15))
+        self.assertEqual(output.getvalue(), """\
+0000000: c72b b561 ffa4 ec2d 2d2d 2d2d 2d2d 2d2d  .+.a...---------
+0000010: 2d2d 2d2d 2d2d                           ------
+""")
+
     def test_grammars(self):
         from charcoaltoken import CharcoalTokenNames
         from unicodegrammars import UnicodeGrammars